@@ -0,0 +1,309 @@
+import asyncio
+import http.client
+import io
+import socket
+import ssl
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple
+
+from .compression import decompress
+from .www import CHUNK_SIZE, STALE_ERRORS, BaseWWW, WWWError
+
+Address = Tuple[str, str, int]
+Stream = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class AsyncWWW(BaseWWW):
+    """
+    An asyncio counterpart to `WWW`.
+
+    Connections are kept alive and reused per host, and at most `limit`
+    requests are in flight at any time.  Up to `pool_size` connections
+    per host are kept idle, by default as many as there may be requests
+    in flight, so that a burst of requests reuses the connections of
+    the previous one.  As with `WWW`, a request on an idle connection
+    that the server has closed is only sent again if it could not be
+    written or if its method is in `retry_methods`, and
+    `connect_timeout` and `read_timeout` bound every connection attempt
+    and every read from and write to a connection.
+    """
+
+    def __init__(
+            self,
+            url: str,
+            token: Optional[str] = None,
+            cafile: Optional[str] = None,
+            pool_size: Optional[int] = None,
+            limit: int = 100,
+            retry_methods: Iterable[str] = ("GET", "DELETE"),
+            connect_timeout: Optional[float] = None,
+            read_timeout: Optional[float] = None,
+    ) -> None:
+        super().__init__(url, token, cafile)
+        self._pool_size = limit if pool_size is None else pool_size
+        self._limit = limit
+        self._retry_methods = {m.upper() for m in retry_methods}
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._idle = {}  # type: Dict[Address, List[Stream]]
+        self._semaphore = None  # type: Optional[asyncio.Semaphore]
+
+    async def __aenter__(self) -> "AsyncWWW":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close all idle connections.
+        """
+        idle, self._idle = self._idle, {}
+        for streams in idle.values():
+            for _reader, writer in streams:
+                writer.close()
+
+    async def get(self, path: str = "/", **kwargs: Any) -> Dict:
+        """
+        Send a GET request.
+        """
+        return await self._send(path, "GET", **kwargs)
+
+    async def delete(self, path: str = "/", **kwargs: Any) -> Dict:
+        """
+        Send a DELETE request.
+        """
+        return await self._send(path, "DELETE", **kwargs)
+
+    async def post(self, path: str = "/", **kwargs: Any) -> Dict:
+        """
+        Send a POST request.
+        """
+        return await self._send(path, "POST", **kwargs)
+
+    async def _send(self, path: str, method: str, **kwargs: Any) -> Dict:
+        """
+        Send a HTTP(S) request.
+        """
+        # The semaphore is created lazily so that it is bound to the
+        # running event loop rather than to the one that was current
+        # when the client was instantiated.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._limit)
+
+        async with self._semaphore:
+            try:
+                url, data, headers = self._prepare(path, method, kwargs)
+                address = self._address(url)
+                status, content_type, body = await self._request(
+                    address, method, self._target(url), data, headers
+                )
+                res = self._decode(body, content_type)
+            except (
+                    EOFError,
+                    OSError,
+                    ValueError,
+                    asyncio.LimitOverrunError,
+                    http.client.HTTPException,
+                    ssl.CertificateError,
+            ) as e:
+                raise WWWError(e)
+
+        if status >= 400:
+            raise self._error(status, res)
+        return res
+
+    async def _request(
+            self,
+            address: Address,
+            method: str,
+            target: str,
+            data: Optional[bytes],
+            headers: Dict[str, str],
+    ) -> Tuple[int, str, bytes]:
+        """
+        Send a request on a pooled connection.
+
+        Idle connections may have been closed by the server; these are
+        replaced by a fresh connection.  The request is sent again only
+        if it could not be written, or if its method is in
+        `retry_methods`, since the server may already have acted on it.
+        """
+        idle = self._idle.get(address)
+        if idle:
+            stream, reused = idle.pop(), True
+        else:
+            stream, reused = await self._connect(address), False
+
+        replay = method in self._retry_methods
+        while True:
+            sent = False
+            try:
+                await self._write(
+                    stream, address, method, target, data, headers
+                )
+                sent = True
+                status, content_type, body, keep_alive = await self._read(
+                    stream
+                )
+                break
+            except STALE_ERRORS:
+                stream[1].close()
+                if not reused or (sent and not replay):
+                    raise
+            except BaseException:
+                stream[1].close()
+                raise
+            stream, reused = await self._connect(address), False
+
+        idle = self._idle.setdefault(address, [])
+        if keep_alive and len(idle) < self._pool_size:
+            idle.append(stream)
+        else:
+            stream[1].close()
+        return status, content_type, body
+
+    async def _connect(self, address: Address) -> Stream:
+        """
+        Open a new connection.
+        """
+        scheme, host, port = address
+        context = self._context if scheme == "https" else None
+        stream = await self._wait(
+            asyncio.open_connection(host, port, ssl=context),
+            self._connect_timeout,
+        )  # type: Stream
+        return stream
+
+    @staticmethod
+    async def _wait(aw: Awaitable, timeout: Optional[float]) -> Any:
+        """
+        Wait for `aw` for at most `timeout` seconds.  Raises
+        socket.timeout, as a blocking socket would.
+        """
+        try:
+            return await asyncio.wait_for(aw, timeout)
+        except asyncio.TimeoutError:
+            raise socket.timeout("timed out")
+
+    async def _write(
+            self,
+            stream: Stream,
+            address: Address,
+            method: str,
+            target: str,
+            data: Optional[bytes],
+            headers: Dict[str, str],
+    ) -> None:
+        """
+        Write a request.
+        """
+        _reader, writer = stream
+        scheme, host, port = address
+
+        if port != {"http": 80, "https": 443}[scheme]:
+            host = "{}:{}".format(host, port)
+        lines = [
+            "{} {} HTTP/1.1".format(method, target),
+            "host: {}".format(host),
+            "content-length: {}".format(len(data or b"")),
+        ]
+        lines += ["{}: {}".format(k, v) for k, v in headers.items()]
+        head = "{}\r\n\r\n".format("\r\n".join(lines)).encode("latin-1")
+        writer.write(head + (data or b""))
+        await self._wait(writer.drain(), self._read_timeout)
+
+    async def _read(self, stream: Stream) -> Tuple[int, str, bytes, bool]:
+        """
+        Read a response.
+
+        The returned tuple contains the status, the content type, the
+        body and whether the connection can be reused.
+        """
+        reader, _writer = stream
+        line = await self._readline(reader)
+        if not line:
+            raise http.client.RemoteDisconnected(
+                "Remote end closed connection without response"
+            )
+        parts = line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise http.client.BadStatusLine(line.decode("latin-1"))
+        status = int(parts[1])
+
+        raw = []
+        while True:
+            line = await self._readline(reader)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            raw.append(line)
+        msg = http.client.parse_headers(io.BytesIO(b"".join(raw + [b"\r\n"])))
+
+        keep_alive = msg.get("connection", "").lower() != "close"
+        if msg.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked(reader)
+        elif msg.get("content-length") is not None:
+            body = await self._read_body(reader, int(msg["content-length"]))
+        elif status in (204, 304) or 100 <= status < 200:
+            body = b""
+        else:
+            body = await self._read_body(reader)
+            keep_alive = False
+
+        encoding = msg.get("content-encoding", "").strip().lower()
+        if encoding not in ("", "identity"):
+            body = decompress(body, encoding)
+        return status, msg.get("content-type", ""), body, keep_alive
+
+    async def _read_chunked(self, reader: asyncio.StreamReader) -> bytes:
+        """
+        Read a body with chunked transfer encoding.
+        """
+        chunks = []  # type: List[bytes]
+        while True:
+            line = await self._readline(reader)
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise http.client.IncompleteRead(b"".join(chunks))
+            if size == 0:
+                break
+            chunks.append(await self._read_body(reader, size))
+            await self._read_body(reader, 2)
+
+        # Skip trailers.
+        while (await self._readline(reader)) not in (b"\r\n", b"\n", b""):
+            pass
+        return b"".join(chunks)
+
+    async def _readline(self, reader: asyncio.StreamReader) -> bytes:
+        line = await self._wait(
+            reader.readline(), self._read_timeout
+        )  # type: bytes
+        return line
+
+    async def _read_body(
+            self,
+            reader: asyncio.StreamReader,
+            size: Optional[int] = None,
+    ) -> bytes:
+        """
+        Read `size` bytes, or everything until the end of the stream if
+        `size` is None.  `read_timeout` applies to every single read, as
+        it does for `WWW`.
+        """
+        chunks = []  # type: List[bytes]
+        received = 0
+        while size is None or received < size:
+            amt = CHUNK_SIZE if size is None else size - received
+            data = await self._wait(
+                reader.read(min(amt, CHUNK_SIZE)), self._read_timeout
+            )  # type: bytes
+            if not data:
+                if size is None:
+                    break
+                raise http.client.IncompleteRead(
+                    b"".join(chunks), size - received
+                )
+            chunks.append(data)
+            received += len(data)
+        return b"".join(chunks)
@@ -0,0 +1,235 @@
+import hashlib
+import http.client
+import json
+import os
+import stat
+import tempfile
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
+
+
+class CacheWriter:
+    """
+    A file-like object that copies a response body into a cache entry
+    while it is being read.
+
+    The entry is only stored by `commit()`, once the whole body has been
+    read.  Failures to write the entry are ignored, since the cache must
+    never break a request.
+    """
+
+    def __init__(self, fp: BinaryIO, path: str, meta: Dict[str, Any]) -> None:
+        self._fp = fp
+        self._path = path
+        fd, self._tmp = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=".tmp-"
+        )
+        self._file = os.fdopen(fd, "wb")  # type: Optional[BinaryIO]
+        self._write(lambda f: f.write(encode_header(meta)))
+
+    def read(self, amt: int) -> bytes:
+        data = self._fp.read(amt)
+        self._write(lambda f: f.write(data))
+        return data
+
+    def commit(self) -> None:
+        """
+        Store the entry.
+        """
+        if self._file is not None:
+            try:
+                self._file.close()
+                os.replace(self._tmp, self._path)
+                self._file = None
+            except OSError:
+                self.abort()
+
+    def abort(self) -> None:
+        """
+        Discard the entry.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.unlink(self._tmp)
+        except OSError:
+            pass
+
+    def _write(self, func: Any) -> None:
+        if self._file is not None:
+            try:
+                func(self._file)
+            except OSError:
+                self.abort()
+
+
+class ResponseCache:
+    """
+    An on-disk cache of GET responses, for revalidation with
+    If-None-Match and If-Modified-Since.
+
+    Each entry is a file that starts with a line of JSON, the header,
+    holding the validators and the content type and coding of the
+    response, followed by the body as it was received, so that reading
+    the validators does not involve the body.  Entries are named
+    after a hash of the request and the token, so that responses are
+    never shared between identities and the token is not written to
+    disk.  The cache is bypassed if the directory does not belong to
+    the user or if others can write to it, since they could then plant
+    responses.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = os.path.expanduser(directory)
+
+    def key(self, *parts: str) -> str:
+        """
+        Derive the key of an entry from the parts of a request.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the header of an entry, or None if there is none.
+        """
+        entry = self.open(key)
+        if entry is None:
+            return None
+        meta, f = entry
+        f.close()
+        return meta
+
+    def open(self, key: str) -> Optional[Tuple[Dict[str, Any], BinaryIO]]:
+        """
+        Retrieve the header of an entry and the open entry file,
+        positioned at the raw body.  The caller must close the file.
+        """
+        if not self._check():
+            return None
+        try:
+            f = open(self._path(key), "rb")
+        except OSError:
+            return None
+
+        try:
+            meta = json.loads(f.readline().decode("utf-8"))
+            if not isinstance(meta, dict):
+                raise ValueError("invalid cache entry")
+        except Exception:
+            # A corrupt or truncated entry is a miss.
+            f.close()
+            return None
+        return meta, f
+
+    def store(
+            self,
+            key: str,
+            res: http.client.HTTPResponse,
+            data: Union[bytes, memoryview],
+    ) -> None:
+        """
+        Store the body of a response as it was received, if the
+        response can be revalidated.
+        """
+        meta = self.validators(res)
+        if meta is None or not self._mkdir():
+            return
+
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(encode_header(meta))
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            os.unlink(tmp)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def writer(
+            self,
+            key: str,
+            res: http.client.HTTPResponse,
+            fp: BinaryIO,
+    ) -> Optional[CacheWriter]:
+        """
+        Create a reader that stores the raw body of a response as it is
+        read from `fp`, if the response can be revalidated.
+        """
+        meta = self.validators(res)
+        if meta is None or not self._mkdir():
+            return None
+        try:
+            return CacheWriter(fp, self._path(key), meta)
+        except OSError:
+            return None
+
+    @staticmethod
+    def validators(res: http.client.HTTPResponse) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the header of an entry for a response, or None if the
+        response has no validators or must not be stored.
+        """
+        cache_control = res.getheader("cache-control", "").lower()
+        if "no-store" in cache_control:
+            return None
+
+        etag = res.getheader("etag")
+        last_modified = res.getheader("last-modified")
+        if not etag and not last_modified:
+            return None
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_type": res.getheader("content-type", ""),
+            "content_encoding": res.getheader("content-encoding", ""),
+        }
+
+    @staticmethod
+    def conditions(meta: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Retrieve the conditional request headers for an entry.
+        """
+        headers = {}
+        if meta.get("etag"):
+            headers["if-none-match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["if-modified-since"] = meta["last_modified"]
+        return headers
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _mkdir(self) -> bool:
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        except OSError:
+            return False
+        return self._check()
+
+    def _check(self) -> bool:
+        """
+        Check that the directory belongs to the user and that nobody
+        else can write to it.
+        """
+        try:
+            st = os.stat(self.directory)
+        except OSError:
+            return False
+        if hasattr(os, "getuid") and st.st_uid != os.getuid():
+            return False
+        return not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def encode_header(meta: Dict[str, Any]) -> bytes:
+    """
+    Encode the header of a cache entry as a line of JSON.
+    """
+    return json.dumps(meta).encode("utf-8") + b"\n"
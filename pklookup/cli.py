@@ -1,47 +1,251 @@
+import collections
 import configparser
+import functools
 import getpass
+import glob
+import itertools
+import json
 import os
+import re
 import shutil
+import sqlite3
 import sys
-from typing import Dict, List
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import click
-import texttable
 
-from .www import WWW, WWWError
+from .known_hosts import KnownHosts
+from .metrics import FORMATS, Metrics
+from .mirror import Mirror, matches, parse_query, parse_time, sort_records
+from .output import FORMATS as OUTPUT_FORMATS
+from .output import WRITERS
+from .stats import BUCKETS, ServerStats
+from .table import OVERFLOWS, Table
+from .www import WWW, Timing, WWWError
 
 ROLES = ["admin", "server"]
+SERVER_HEADER = [
+    "id",
+    "token_id",
+    "ip",
+    "port",
+    "key_type",
+    "key_data",
+    "key_comment",
+    "created",
+]
+TOKEN_HEADER = ["id", "role", "description", "created"]
+PHASES = [
+    "queue",
+    "dns",
+    "connect",
+    "tls",
+    "ttfb",
+    "body",
+    "decompress",
+    "decode",
+]
+
+
+def validate_time(
+        _ctx: click.Context,
+        _param: click.Parameter,
+        value: Optional[str],
+) -> Optional[str]:
+    """
+    Check that an option is a timestamp that `parse_time()` accepts.
+    """
+    if value is not None:
+        try:
+            parse_time(value)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    return value
 
 
 @click.group()
 @click.option("--config-file", "-c", default="~/.pklookup.ini")
+@click.option("--deadline", type=click.FloatRange(min=0))
+@click.option("--timings", is_flag=True)
 @click.pass_context
-def cli(ctx: click.Context, config_file: str) -> None:
+def cli(
+        ctx: click.Context,
+        config_file: str,
+        deadline: float,
+        timings: bool,
+) -> None:
     config = configparser.ConfigParser()
     config.read(os.path.expanduser(config_file))
 
     url = config.get("pklookup", "url", fallback="").rstrip("/")
-    if not url:
-        sys.stderr.write("ERROR: no 'url' in {}\n".format(config_file))
-        sys.exit(1)
-    url = "{}/api/v1".format(url)
-
     admin_token = config.get("pklookup", "admin_token", fallback="")
-    if not admin_token:
-        admin_token = getpass.getpass("Admin token: ")
 
     cafile = config.get("pklookup", "cafile", fallback="") or None
+    pool_size = config.getint("pklookup", "pool_size", fallback=4)
+    max_concurrency = config.getint("pklookup", "max_concurrency", fallback=0)
+    workers = config.getint(
+        "pklookup", "workers", fallback=max_concurrency or pool_size
+    )
+    page_size = config.getint("pklookup", "page_size", fallback=0)
+    prefetch = config.getint("pklookup", "prefetch", fallback=2)
+    connect_timeout = config.getfloat(
+        "pklookup", "connect_timeout", fallback=10
+    )
+    read_timeout = config.getfloat("pklookup", "read_timeout", fallback=60)
+    if deadline is None:
+        deadline = config.getfloat("pklookup", "deadline", fallback=0)
+    retries = config.getint("pklookup", "retries", fallback=2)
+    backoff = config.getfloat("pklookup", "backoff", fallback=0.5)
+    backoff_max = config.getfloat("pklookup", "backoff_max", fallback=30)
+    retry_methods = config.get(
+        "pklookup", "retry_methods", fallback="GET, DELETE"
+    )
+    hedge_delay = config.getfloat("pklookup", "hedge_delay", fallback=0)
+    rate_limit = config.getfloat("pklookup", "rate_limit", fallback=0)
+    rate_burst = config.getint("pklookup", "rate_burst", fallback=0)
+    compress_min = config.getint("pklookup", "compress_min", fallback=0)
+    cache_dir = os.path.expanduser(
+        config.get("pklookup", "cache_dir", fallback="")
+    )
+
+    metrics_file = os.path.expanduser(
+        config.get("pklookup", "metrics_file", fallback="")
+    )
+    metrics_format = config.get(
+        "pklookup", "metrics_format", fallback="prometheus"
+    )
+    if metrics_format not in FORMATS:
+        sys.stderr.write(
+            "ERROR: invalid metrics_format in {}\n".format(config_file)
+        )
+        sys.exit(1)
 
     known_hosts = os.path.expanduser(
         config.get("pklookup", "known_hosts", fallback="~/known_hosts")
     )
+    mirror_file = os.path.expanduser(
+        config.get("pklookup", "mirror_file", fallback="~/.pklookup.sqlite")
+    )
+
+    # The API client is only created by the commands that need it, so
+    # that commands that read the local mirror neither ask for the admin
+    # token nor pay for the TLS setup.
+    www_options = {
+        "cafile": cafile,
+        "pool_size": pool_size,
+        "connect_timeout": connect_timeout or None,
+        "read_timeout": read_timeout or None,
+        "deadline": deadline or None,
+        "retries": retries,
+        "backoff": backoff,
+        "backoff_max": backoff_max,
+        "retry_methods": re.split(r"[\s,]+", retry_methods.strip()),
+        "hedge_delay": hedge_delay or None,
+        "rate_limit": rate_limit or None,
+        "rate_burst": rate_burst or None,
+        "max_concurrency": max_concurrency or None,
+        "compress_min": compress_min or None,
+        "cache_dir": cache_dir or None,
+    }
+    hooks = []  # type: List[Any]
+
+    phases = None  # type: Optional[Dict[str, float]]
+    if timings:
+        requests = []  # type: List[Timing]
+        phases = collections.OrderedDict()
+        hooks.append(requests.append)
+        ctx.call_on_close(
+            functools.partial(
+                print_timings, requests, phases, time.monotonic()
+            )
+        )
+
+    if metrics_file:
+        metrics = Metrics()
+        hooks.append(metrics)
+        ctx.call_on_close(
+            functools.partial(
+                write_metrics, metrics, metrics_file, metrics_format
+            )
+        )
 
     ctx.obj = {
+        "admin_token": admin_token,
+        "config_file": config_file,
+        "hooks": hooks,
         "known_hosts": known_hosts,
-        "www": WWW(url, token=admin_token, cafile=cafile)
+        "mirror_file": mirror_file,
+        "page_size": page_size,
+        "phases": phases,
+        "prefetch": prefetch,
+        "url": url,
+        "workers": workers,
+        "www": None,
+        "www_options": www_options,
     }
 
 
+def get_www(options: Dict) -> WWW:
+    """
+    Retrieve the API client, which is created on first use.  Asks for
+    the admin token if the config lacks it, and exits if it lacks the
+    url.
+    """
+    www = options["www"]  # type: Optional[WWW]
+    if www is not None:
+        return www
+
+    if not options["url"]:
+        sys.stderr.write(
+            "ERROR: no 'url' in {}\n".format(options["config_file"])
+        )
+        sys.exit(1)
+
+    admin_token = options["admin_token"]
+    if not admin_token:
+        admin_token = getpass.getpass("Admin token: ")
+
+    try:
+        www = WWW(
+            "{}/api/v1".format(options["url"]),
+            token=admin_token,
+            **options["www_options"]
+        )
+    except WWWError as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+    www.hooks.extend(options["hooks"])
+    options["www"] = www
+    return www
+
+
+@cli.command("sync")
+@click.option("--page-size", type=click.IntRange(min=0))
+@click.pass_obj
+def sync(options: Dict, page_size: int) -> None:
+    """
+    Update the local mirror of the servers and tokens.
+    """
+    try:
+        with Mirror(options["mirror_file"]) as mirror:
+            for name in ("server", "token"):
+                records = paginate(
+                    options, name, "{}s".format(name), None, page_size
+                )
+                added, deleted = mirror.sync(name, records)
+                print("{}: {} added, {} deleted".format(name, added, deleted))
+    except WWWError as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+    except (OSError, sqlite3.Error) as e:
+        sys.stderr.write("ERROR: unable to update mirror: {}\n".format(e))
+        sys.exit(1)
+    except (KeyError, TypeError):
+        sys.stderr.write("ERROR: invalid {} list\n".format(name))
+        sys.exit(1)
+
+
 @cli.group()
 def token() -> None:
     pass
@@ -53,7 +257,9 @@ def token() -> None:
 @click.pass_obj
 def token_add(options: Dict, role: str, description: str) -> None:
     try:
-        res = options["www"].post("token", role=role, description=description)
+        res = get_www(options).post(
+            "token", role=role, description=description
+        )
         print("{} token: {token}".format(role, **res))
     except WWWError as e:
         sys.stderr.write("ERROR: {}\n".format(e))
@@ -64,26 +270,63 @@ def token_add(options: Dict, role: str, description: str) -> None:
 
 
 @token.command("delete")
-@click.option("--id", "token_id", type=int, required=True)
+@click.option("--id", "token_ids", required=True, multiple=True)
+@click.option("--parallel", "-j", type=click.IntRange(min=1))
 @click.pass_obj
-def token_delete(options: Dict, token_id: int) -> None:
-    try:
-        res = options["www"].delete("token", id=token_id)
-        print("token: {message}".format(**res))
-    except WWWError as e:
-        sys.stderr.write("ERROR: {}\n".format(e))
-        sys.exit(1)
-    except (KeyError, TypeError):
-        sys.stderr.write("ERROR: invalid response\n")
-        sys.exit(1)
+def token_delete(options: Dict, token_ids: List[str], parallel: int) -> None:
+    """
+    Delete one or more tokens.
+
+    Every --id is an id, a range such as 100-250 or - to read ids from
+    stdin.
+    """
+    delete(options, "token", token_ids, parallel)
 
 
 @token.command("list")
+@click.option("--limit", type=click.IntRange(min=0))
+@click.option("--page-size", type=click.IntRange(min=0))
+@click.option("--cached", is_flag=True)
+@click.option("--role", type=click.Choice(ROLES))
+@click.option("--created-after", callback=validate_time)
+@click.option("--sort", type=click.Choice(
+    TOKEN_HEADER + ["-" + c for c in TOKEN_HEADER]
+))
+@click.option(
+    "--format", "fmt", type=click.Choice(["table"] + OUTPUT_FORMATS),
+    default="table",
+)
+@click.option("--overflow", type=click.Choice(OVERFLOWS), default="elide")
+@click.option("--pager", is_flag=True)
 @click.pass_obj
-def token_list(options: Dict) -> None:
+def token_list(
+        options: Dict,
+        limit: int,
+        page_size: int,
+        cached: bool,
+        sort: Optional[str],
+        fmt: str,
+        overflow: str,
+        pager: bool,
+        **filters: Any,
+) -> None:
+    """
+    List tokens, from the local mirror with --cached.  --sort orders
+    them by a column, descending if it is prefixed with "-"; with
+    --limit, every page is still fetched to find the first records.
+    """
+    filters = {k: v for k, v in filters.items() if v is not None}
     try:
-        res = options["www"].get("token")
-        tabulate(["id", "role", "description", "created"], res["tokens"])
+        if cached:
+            mirror = open_mirror(options, "token")
+            tokens = mirror.records("token", limit, filters, sort)
+        else:
+            tokens = paginate(
+                options, "token", "tokens", limit, page_size, filters, sort
+            )
+        print_rows(
+            fmt, TOKEN_HEADER, tokens, options["phases"], overflow, pager
+        )
     except WWWError as e:
         sys.stderr.write("ERROR: {}\n".format(e))
         sys.exit(1)
@@ -98,59 +341,177 @@ def server() -> None:
 
 
 @server.command("add")
-@click.option("--public-key", required=True)
+@click.option("--public-key", required=True, multiple=True)
+@click.option("--parallel", "-j", type=click.IntRange(min=1))
 @click.pass_obj
-def server_add(options: Dict, public_key: str) -> None:
-    if public_key.startswith("@"):
-        try:
-            with open(public_key[1:], "r") as f:
-                public_key = f.readline().strip()
-        except IOError as e:
-            sys.stderr.write("ERROR: {}\n".format(e))
-            sys.exit(1)
+def server_add(options: Dict, public_key: List[str], parallel: int) -> None:
+    """
+    Add one or more servers.
+
+    Every --public-key is either a key, @FILE with one key per line,
+    @DIRECTORY with *.pub files, @GLOB or - to read keys from stdin.
+    """
+    try:
+        keys = list(read_public_keys(public_key))
+    except IOError as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+
+    if not keys:
+        sys.stderr.write("ERROR: no public keys\n")
+        sys.exit(1)
+
+    requests = [("POST", "server", {"public_key": key}) for _, key in keys]
+    res = get_www(options).batch(requests, parallel or options["workers"])
+    if report("server", [label for label, _ in keys], res):
+        sys.exit(1)
+
+
+@server.command("delete")
+@click.option("--id", "server_ids", required=True, multiple=True)
+@click.option("--parallel", "-j", type=click.IntRange(min=1))
+@click.pass_obj
+def server_delete(options: Dict, server_ids: List[str], parallel: int) -> None:
+    """
+    Delete one or more servers.
+
+    Every --id is an id, a range such as 100-250 or - to read ids from
+    stdin.
+    """
+    delete(options, "server", server_ids, parallel)
+
 
+@server.command("list")
+@click.option("--limit", type=click.IntRange(min=0))
+@click.option("--page-size", type=click.IntRange(min=0))
+@click.option("--cached", is_flag=True)
+@click.option("--ip")
+@click.option("--port", type=click.IntRange(min=0))
+@click.option("--key-type")
+@click.option("--token-id", type=click.IntRange(min=0))
+@click.option("--created-after", callback=validate_time)
+@click.option("--sort", type=click.Choice(
+    SERVER_HEADER + ["-" + c for c in SERVER_HEADER]
+))
+@click.option(
+    "--format", "fmt", type=click.Choice(["table"] + OUTPUT_FORMATS),
+    default="table",
+)
+@click.option("--overflow", type=click.Choice(OVERFLOWS), default="elide")
+@click.option("--pager", is_flag=True)
+@click.pass_obj
+def server_list(
+        options: Dict,
+        limit: int,
+        page_size: int,
+        cached: bool,
+        sort: Optional[str],
+        fmt: str,
+        overflow: str,
+        pager: bool,
+        **filters: Any,
+) -> None:
+    """
+    List servers, from the local mirror with --cached.  --sort orders
+    them by a column, descending if it is prefixed with "-"; with
+    --limit, every page is still fetched to find the first records.
+    """
+    filters = {k: v for k, v in filters.items() if v is not None}
     try:
-        res = options["www"].post("server", public_key=public_key)
-        print("server: {message}".format(**res))
+        if cached:
+            mirror = open_mirror(options, "server")
+            servers = mirror.records("server", limit, filters, sort)
+        else:
+            servers = paginate(
+                options, "server", "servers", limit, page_size, filters, sort
+            )
+        print_rows(
+            fmt, SERVER_HEADER, servers, options["phases"], overflow, pager
+        )
     except WWWError as e:
         sys.stderr.write("ERROR: {}\n".format(e))
         sys.exit(1)
     except (KeyError, TypeError):
-        sys.stderr.write("ERROR: invalid response\n")
+        sys.stderr.write("ERROR: invalid server list\n")
         sys.exit(1)
 
 
-@server.command("delete")
-@click.option("--id", "server_id", type=int, required=True)
+@server.command("lookup")
+@click.argument("query")
+@click.option("--cached", is_flag=True)
+@click.option("--known-hosts", is_flag=True)
 @click.pass_obj
-def server_delete(options: Dict, server_id: int) -> None:
+def server_lookup(
+        options: Dict,
+        query: str,
+        cached: bool,
+        known_hosts: bool,
+) -> None:
+    """
+    Find servers by ip, ip:port, [ip]:port, SHA256 fingerprint or key.
+
+    The query is sent as filter parameters, and the response is checked
+    against it for servers that do not support them.  With --cached,
+    the query is answered from the indexes of the local mirror.  With
+    --known-hosts, matches are printed as known_hosts lines.  Exits with
+    status 1 if there is no match.
+    """
+    try:
+        filters = parse_query(query)
+    except ValueError as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+
     try:
-        res = options["www"].delete("server", id=server_id)
-        print("server: {message}".format(**res))
+        if cached:
+            servers = open_mirror(options, "server").lookup(filters)
+        else:
+            res = get_www(options).get("server", **filters)
+            servers = [s for s in res["servers"] if matches(s, filters)]
+        if not servers:
+            sys.stderr.write("ERROR: no matching server\n")
+            sys.exit(1)
+
+        if known_hosts:
+            for s in servers:
+                print("{ip} {key_type} {key_data}".format(**s))
+        else:
+            tabulate(SERVER_HEADER, servers, options["phases"])
     except WWWError as e:
         sys.stderr.write("ERROR: {}\n".format(e))
         sys.exit(1)
     except (KeyError, TypeError):
-        sys.stderr.write("ERROR: invalid response\n")
+        sys.stderr.write("ERROR: invalid server list\n")
         sys.exit(1)
 
 
-@server.command("list")
+@server.command("stats")
+@click.option("--page-size", type=click.IntRange(min=0))
+@click.option("--cached", is_flag=True)
+@click.option("--bucket", type=click.Choice(list(BUCKETS)), default="month")
+@click.option(
+    "--format", "fmt", type=click.Choice(["table", "json"]), default="table"
+)
 @click.pass_obj
-def server_list(options: Dict) -> None:
+def server_stats(
+        options: Dict,
+        page_size: int,
+        cached: bool,
+        bucket: str,
+        fmt: str,
+) -> None:
+    """
+    Count servers by key type, token and creation time, and find
+    duplicate keys and ips, in a single pass over the servers.
+    """
+    stats = ServerStats(bucket)
     try:
-        res = options["www"].get("server")
-        headers = [
-            "id",
-            "token_id",
-            "ip",
-            "port",
-            "key_type",
-            "key_data",
-            "key_comment",
-            "created",
-        ]
-        tabulate(headers, res["servers"])
+        if cached:
+            servers = open_mirror(options, "server").records("server")
+        else:
+            servers = paginate(options, "server", "servers", None, page_size)
+        for record in servers:
+            stats.add(record)
     except WWWError as e:
         sys.stderr.write("ERROR: {}\n".format(e))
         sys.exit(1)
@@ -158,14 +519,57 @@ def server_list(options: Dict) -> None:
         sys.stderr.write("ERROR: invalid server list\n")
         sys.exit(1)
 
+    if fmt == "json":
+        print(json.dumps(stats.to_dict(), indent=2))
+        return
+
+    def count(column: str, counter: collections.Counter) -> None:
+        rows = [
+            {column: value, "count": n} for value, n in counter.most_common()
+        ]
+        print()
+        tabulate([column, "count"], rows, options["phases"])
+
+    def duplicates(column: str, ids: Dict[str, List]) -> None:
+        rows = [{
+            column: value,
+            "count": len(i),
+            "ids": " ".join(str(j) for j in i),
+        } for value, i in ids.items()]
+        print()
+        tabulate([column, "count", "ids"], rows, options["phases"])
+
+    print("servers: {}".format(stats.count))
+    count("key_type", stats.key_types)
+    count("token_id", stats.token_ids)
+    print()
+    tabulate(
+        ["created", "count", "histogram"], stats.histogram(), options["phases"]
+    )
+    duplicates("fingerprint", stats.duplicate_keys)
+    duplicates("ip", stats.duplicate_ips)
+
 
 @server.command("save-key")
 @click.option("--id", "server_id", type=int, required=True)
+@click.option("--cached", is_flag=True)
 @click.pass_obj
-def server_save_key(options: Dict, server_id: int) -> None:
+def server_save_key(options: Dict, server_id: int, cached: bool) -> None:
+    """
+    Save the key of a server to the known_hosts file, looked up in the
+    local mirror with --cached.  Keys that are already saved are
+    skipped, and keys of the same type saved before for the ip are
+    replaced.
+    """
     try:
-        res = options["www"].get("server", id=server_id)
-        entry = "{ip} {key_type} {key_data}".format(**res["servers"][0])
+        if cached:
+            record = open_mirror(options, "server").get("server", server_id)
+            res = {"servers": [record] if record else []}
+        else:
+            res = get_www(options).get("server", id=server_id)
+        record = res["servers"][0]
+        host, key_type = str(record["ip"]), str(record["key_type"])
+        key_data = str(record["key_data"])
     except WWWError as e:
         sys.stderr.write("ERROR: {}\n".format(e))
         sys.exit(1)
@@ -176,18 +580,347 @@ def server_save_key(options: Dict, server_id: int) -> None:
         sys.stderr.write("ERROR: invalid server list\n")
         sys.exit(1)
 
-    print("{known_hosts}: saving '{}'".format(entry, **options))
-    with open(options["known_hosts"], "a") as f:
-        f.write("{}\n".format(entry))
+    entry = " ".join([host, key_type, key_data])
+    try:
+        with KnownHosts(options["known_hosts"]) as known_hosts:
+            added, removed = known_hosts.add(host, key_type, key_data)
+    except OSError as e:
+        sys.stderr.write("ERROR: unable to update known_hosts: {}\n".format(e))
+        sys.exit(1)
+
+    if not added:
+        print("{known_hosts}: '{}' already saved".format(entry, **options))
+    else:
+        print("{known_hosts}: saving '{}'".format(entry, **options))
+    if removed:
+        print("{known_hosts}: removed {} old entries for {}".format(
+            removed, host, **options
+        ))
 
 
-def tabulate(header: List[str], rows: List[Dict[str, str]]) -> None:
+def delete(options: Dict, name: str, values: List[str], parallel: int) -> None:
     """
-    Print rows as a table with the given headers.
+    Delete the token or server ids in `values` concurrently.
     """
-    size = shutil.get_terminal_size()
-    table = texttable.Texttable(max_width=size.columns)
-    table.header(header)
+    try:
+        ids = parse_ids(values)
+    except ValueError as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+
+    if not ids:
+        sys.stderr.write("ERROR: no ids\n")
+        sys.exit(1)
+
+    requests = [("DELETE", name, {"id": i}) for i in ids]
+    res = get_www(options).batch(requests, parallel or options["workers"])
+    if report(name, ["id {}".format(i) for i in ids], res):
+        sys.exit(1)
+
+
+def paginate(
+        options: Dict,
+        path: str,
+        key: str,
+        limit: Optional[int],
+        page_size: Optional[int],
+        filters: Optional[Dict[str, Any]] = None,
+        sort: Optional[str] = None,
+) -> Iterator[Dict]:
+    """
+    Iterate over a collection, with the page size from the config file
+    unless overridden.
+
+    `filters` and `sort` are sent as query parameters, and applied again
+    to the records as they arrive in case the server ignores them.
+    `limit` applies to the records that match, and with `sort` to the
+    sorted records, which are then selected with a bounded heap rather
+    than by sorting the whole collection.  Without `sort`, pages are no
+    larger than `limit`, so that a server which applies the filters
+    returns the records in one page; further pages are only requested
+    if it doesn't.
+    """
+    if page_size is None:
+        page_size = options["page_size"]
+    if limit and page_size and not sort:
+        page_size = min(page_size, limit)
+    params = dict(filters or {})
+    if sort:
+        params["sort"] = sort
+    records = get_www(options).paginate(
+        path,
+        key,
+        page_size=page_size,
+        limit=None if params else limit,
+        prefetch=options["prefetch"],
+        **params
+    )  # type: Iterator[Dict]
+    if filters:
+        records = (r for r in records if matches(r, filters))
+    if sort:
+        records = iter(sort_records(records, sort, limit))
+    elif filters:
+        records = itertools.islice(records, limit)
+    return records
+
+
+def open_mirror(options: Dict, name: str) -> Mirror:
+    """
+    Open the local mirror for reading the collection `name`.  The
+    mirror is closed with the command.
+
+    Exits with an error if the collection has never been synced.
+    """
+    if not os.path.exists(options["mirror_file"]):
+        # Opening the mirror would create an empty one.
+        sys.stderr.write("ERROR: no mirror, run 'pklookup sync' first\n")
+        sys.exit(1)
+
+    try:
+        mirror = Mirror(options["mirror_file"])
+        synced = mirror.synced(name)
+    except (OSError, sqlite3.Error) as e:
+        sys.stderr.write("ERROR: unable to open mirror: {}\n".format(e))
+        sys.exit(1)
+
+    click.get_current_context().call_on_close(mirror.close)
+    if synced is None:
+        sys.stderr.write("ERROR: no mirror, run 'pklookup sync' first\n")
+        sys.exit(1)
+    return mirror
+
+
+def parse_ids(values: Iterable[str]) -> List[int]:
+    """
+    Parse ids and ranges of ids.
+
+    A value of - reads ids from stdin, one per line.  Only the first
+    field of each line is considered, which makes it possible to pipe
+    the output of the list commands; lines without an id (such as the
+    table header and borders) are ignored.
+    """
+    ids = []  # type: List[int]
+    for value in values:
+        if value == "-":
+            for line in sys.stdin:
+                fields = re.split(r"[\s|,]+", line.strip(" \t\r\n|"))
+                if re.match(r"^\d+(-\d+)?$", fields[0]):
+                    ids += parse_id_range(fields[0])
+        else:
+            ids += parse_id_range(value)
+    return list(collections.OrderedDict.fromkeys(ids))
+
+
+def parse_id_range(value: str) -> List[int]:
+    """
+    Parse an id or a range of ids, such as 5 or 100-250.
+    """
+    m = re.match(r"^\s*(\d+)\s*(?:-\s*(\d+)\s*)?$", value)
+    if not m:
+        raise ValueError("invalid id: {}".format(value))
+
+    first = int(m.group(1))
+    last = int(m.group(2) or first)
+    if last < first:
+        raise ValueError("invalid id range: {}".format(value))
+    return list(range(first, last + 1))
+
+
+def read_public_keys(sources: Iterable[str]) -> Iterable[Tuple[str, str]]:
+    """
+    Read public keys from command-line arguments, files and stdin.
+
+    Yields tuples of a label that identifies the origin of the key and
+    the key itself.
+    """
+    for i, source in enumerate(sources, 1):
+        if source == "-":
+            paths = ["-"]
+        elif source.startswith("@"):
+            path = source[1:]
+            if os.path.isdir(path):
+                paths = sorted(glob.glob(os.path.join(path, "*.pub")))
+            elif glob.has_magic(path):
+                paths = sorted(glob.glob(path))
+            else:
+                paths = [path]
+        else:
+            yield "argument {}".format(i), source
+            continue
+
+        for path in paths:
+            if path == "-":
+                lines = sys.stdin.readlines()
+            else:
+                with open(path, "r") as f:
+                    lines = f.readlines()
+
+            for lineno, line in enumerate(lines, 1):
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield "{}:{}".format(path, lineno), line
+
+
+def report(
+        name: str,
+        labels: List[str],
+        results: List[Union[Dict, WWWError]],
+) -> int:
+    """
+    Print the outcome of a batch of requests.
+
+    The label of each request is only included if there is more than
+    one request.  Returns the number of failed requests.
+    """
+    failed = 0
+    for label, res in zip(labels, results):
+        prefix = "{}: ".format(label) if len(labels) > 1 else ""
+        try:
+            if isinstance(res, WWWError):
+                raise res
+            print("{}: {}{message}".format(name, prefix, **res))
+        except WWWError as e:
+            sys.stderr.write("ERROR: {}{}\n".format(prefix, e))
+            failed += 1
+        except (KeyError, TypeError):
+            sys.stderr.write("ERROR: {}invalid response\n".format(prefix))
+            failed += 1
+
+    if len(labels) > 1:
+        print(
+            "{}: {} succeeded, {} failed".format(
+                name, len(labels) - failed, failed
+            )
+        )
+    return failed
+
+
+def print_rows(
+        fmt: str,
+        header: List[str],
+        rows: Iterable[Dict[str, Any]],
+        phases: Optional[Dict[str, float]] = None,
+        overflow: str = "elide",
+        pager: bool = False,
+) -> None:
+    """
+    Print rows as a table or in one of the machine-readable formats.
+
+    Machine-readable rows are written as soon as they are received, and
+    `overflow` and `pager` only apply to tables.  If `phases` is given,
+    the time spent writing, but not waiting for rows, is added to its
+    "render" entry.
+    """
+    if fmt == "table":
+        tabulate(header, rows, phases, overflow, pager)
+        return
+
+    writer = WRITERS[fmt](sys.stdout, header)
+    elapsed = 0.0
     for row in rows:
-        table.add_row([row[key] for key in header])
-    print(table.draw())
+        start = time.monotonic()
+        writer.write(row)
+        elapsed += time.monotonic() - start
+    writer.close()
+    if phases is not None:
+        phases["render"] = phases.get("render", 0) + elapsed
+
+
+def tabulate(
+        header: List[str],
+        rows: Iterable[Dict[str, Any]],
+        phases: Optional[Dict[str, float]] = None,
+        overflow: str = "elide",
+        pager: bool = False,
+) -> None:
+    """
+    Print rows as a table with the given headers, fitted to the width
+    of the terminal.  Rows are printed as they arrive, through a pager
+    if `pager` is True.
+
+    If `phases` is given, the time spent rendering the table, but not
+    waiting for rows, is added to its "render" entry.  Time spent in
+    the pager is not recorded.
+    """
+    waited = 0.0
+
+    def fetch() -> Iterator[Dict[str, Any]]:
+        nonlocal waited
+        it = iter(rows)
+        while True:
+            start = time.monotonic()
+            row = next(it, None)
+            waited += time.monotonic() - start
+            if row is None:
+                return
+            yield row
+
+    size = shutil.get_terminal_size()
+    table = Table(header, max_width=size.columns, overflow=overflow)
+    lines = ("{}\n".format(line) for line in table.lines(fetch()))
+    if pager:
+        click.echo_via_pager(lines)
+        return
+
+    start = time.monotonic()
+    for line in lines:
+        sys.stdout.write(line)
+    if phases is not None:
+        elapsed = time.monotonic() - start - waited
+        phases["render"] = phases.get("render", 0) + elapsed
+
+
+def write_metrics(metrics: Metrics, path: str, fmt: str) -> None:
+    """
+    Write the metrics of the command to `path`.
+    """
+    try:
+        metrics.write(path, fmt)
+    except OSError as e:
+        sys.stderr.write("ERROR: unable to write metrics: {}\n".format(e))
+
+
+def print_timings(
+        requests: List[Timing],
+        phases: Dict[str, float],
+        start: float,
+) -> None:
+    """
+    Print the time spent in each phase of the requests and of the
+    command itself to stderr.
+
+    Requests may overlap, so the totals can exceed the wall time.
+    """
+    totals = collections.OrderedDict()  # type: Dict[str, List[float]]
+    for timing in requests:
+        for name, value in timing.phases.items():
+            totals.setdefault(name, []).append(value)
+    for name, value in phases.items():
+        totals[name] = [value]
+
+    names = [name for name in PHASES if name in totals]
+    names += [name for name in totals if name not in PHASES]
+    width = max(len(name) for name in PHASES + names)
+    lines = ["{:<{}} {:>10} {:>10}".format("phase", width, "total", "max")]
+    for name in names:
+        lines.append(
+            "{:<{}} {:>9.3f}s {:>9.3f}s".format(
+                name, width, sum(totals[name]), max(totals[name])
+            )
+        )
+    lines.append(
+        "{:<{}} {:>9.3f}s".format("wall", width, time.monotonic() - start)
+    )
+
+    failed = sum(
+        1 for t in requests if t.error or (t.status or 0) >= 400
+    )
+    lines.append(
+        "requests: {}, failed: {}, sent: {} B, received: {} B".format(
+            len(requests),
+            failed,
+            sum(t.sent for t in requests),
+            sum(t.received for t in requests),
+        )
+    )
+    sys.stderr.write("".join("{}\n".format(line) for line in lines))
@@ -0,0 +1,155 @@
+import gzip
+import importlib.util
+import zlib
+from typing import Any, BinaryIO, List, Optional, Union
+
+# Size of the compressed chunks that are read by `DecompressingReader`.
+CHUNK_SIZE = 64 * 1024
+
+
+def get_encodings() -> List[str]:
+    """
+    Retrieve the content codings that can be decompressed, in order of
+    preference.
+    """
+    encodings = ["gzip", "deflate"]
+    if importlib.util.find_spec("brotli") is not None:
+        encodings.insert(0, "br")
+    return encodings
+
+
+ENCODINGS = get_encodings()
+
+# Value of the accept-encoding header sent with every request.
+ACCEPT_ENCODING = ", ".join(ENCODINGS)
+
+
+class BrotliDecompressor:
+    """
+    An adapter that gives brotli the interface of zlib decompressors.
+    """
+
+    def __init__(self) -> None:
+        import brotli
+        self._decompressor = brotli.Decompressor()
+
+    @property
+    def eof(self) -> bool:
+        return bool(self._decompressor.is_finished())
+
+    def decompress(self, data: bytes) -> bytes:
+        import brotli
+        try:
+            return bytes(self._decompressor.process(data))
+        except brotli.error as e:
+            raise ValueError(e)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def decompressor(encoding: str) -> Any:
+    """
+    Create a decompressor for a content coding.
+
+    Raises ValueError if the coding is not supported.  Decompressors
+    raise ValueError on corrupt data, except for zlib, which raises
+    zlib.error.
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompressobj()
+    if encoding == "br" and "br" in ENCODINGS:
+        return BrotliDecompressor()
+    raise ValueError("unsupported content encoding: {}".format(encoding))
+
+
+def decompress(data: Union[bytes, memoryview], encoding: str) -> bytes:
+    """
+    Decompress a complete body.
+    """
+    d = decompressor(encoding)
+    try:
+        res = d.decompress(data) + d.flush()
+    except zlib.error as e:
+        raise ValueError(e)
+    if not d.eof:
+        raise ValueError("truncated {} body".format(encoding))
+    return bytes(res)
+
+
+def compress(data: bytes) -> bytes:
+    """
+    Compress a request body with gzip.
+    """
+    return gzip.compress(data, compresslevel=6)
+
+
+class DecompressingReader:
+    """
+    A file-like object that decompresses a body while it is read.
+
+    Only one compressed chunk and its decompressed output are held in
+    memory at a time.  The number of compressed bytes read so far is
+    available as `received`.
+    """
+
+    def __init__(
+            self,
+            fp: BinaryIO,
+            encoding: str,
+            size: int = CHUNK_SIZE,
+    ) -> None:
+        self._fp = fp
+        self._encoding = encoding
+        self._decompressor = decompressor(encoding)
+        self._size = size
+        self._buf = b""
+        self._pos = 0
+        self._eof = False
+        self.received = 0
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        """
+        Read up to `amt` decompressed bytes, or everything that remains
+        if `amt` is None or negative.
+
+        Returns an empty bytes object only at the end of the body.
+        """
+        if amt is None or amt < 0:
+            chunks = [self._buf[self._pos:]]
+            while self._fill():
+                chunks.append(self._buf)
+            self._buf, self._pos = b"", 0
+            return b"".join(chunks)
+
+        while self._pos >= len(self._buf) and self._fill():
+            pass
+        data = self._buf[self._pos:self._pos + amt]
+        self._pos += len(data)
+        return data
+
+    def _fill(self) -> bool:
+        """
+        Decompress another chunk.  Returns False at the end of the body.
+        """
+        if self._eof:
+            return False
+
+        data = self._fp.read(self._size)
+        self.received += len(data)
+        self._pos = 0
+        try:
+            if data:
+                self._buf = self._decompressor.decompress(data)
+                return True
+
+            self._eof = True
+            self._buf = self._decompressor.flush()
+        except zlib.error as e:
+            raise ValueError(e)
+        if not self._decompressor.eof:
+            raise ValueError("truncated {} body".format(self._encoding))
+        return bool(self._buf)
@@ -0,0 +1,160 @@
+import importlib.util
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Union
+
+from .compression import DecompressingReader
+
+# Size of the chunks that are fed to `MsgpackStream`.
+CHUNK_SIZE = 64 * 1024
+
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+JSON = "application/json"
+
+# Media types that are used for msgpack in the wild.
+ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+
+
+def get_formats() -> List[str]:
+    """
+    Retrieve the media types that can be decoded, in order of
+    preference.  JSON is always available.
+    """
+    formats = []
+    if importlib.util.find_spec("msgpack") is not None:
+        formats.append(MSGPACK)
+    if importlib.util.find_spec("cbor2") is not None:
+        formats.append(CBOR)
+    return formats + [JSON]
+
+
+FORMATS = get_formats()
+
+# Value of the accept header sent with every request.  The q-values make
+# the order of preference explicit, since servers are free to ignore
+# the order of the list.
+ACCEPT = ", ".join(
+    "{};q={:g}".format(fmt, 1 - i / 10) if i else fmt
+    for i, fmt in enumerate(FORMATS)
+)
+
+
+def media_type(content_type: str) -> str:
+    """
+    Retrieve the media type of a content-type header, without
+    parameters and with known aliases resolved.
+    """
+    res = content_type.split(";", 1)[0].strip().lower()
+    return ALIASES.get(res, res)
+
+
+def get_decoders() -> Dict[str, Callable[[Union[bytes, memoryview]], Any]]:
+    """
+    Retrieve functions that decode complete bodies, keyed on the media
+    type.  JSON is left to the caller.
+    """
+    decoders = {}  # type: Dict[str, Callable[[Any], Any]]
+    if MSGPACK in FORMATS:
+        import msgpack
+        decoders[MSGPACK] = lambda data: msgpack.unpackb(data, raw=False)
+    if CBOR in FORMATS:
+        import cbor2
+        decoders[CBOR] = lambda data: cbor2.loads(bytes(data))
+    return decoders
+
+
+DECODERS = get_decoders()
+
+
+def iterate_member(obj: Any, key: str) -> Iterator[Any]:
+    """
+    Iterate over the array `key` in a decoded object, with the same
+    exceptions as the streaming decoders.
+    """
+    if not isinstance(obj, dict):
+        raise TypeError("expected an object")
+    if not isinstance(obj[key], list):
+        raise TypeError("expected an array")
+    return iter(obj[key])
+
+
+class MsgpackStream:
+    """
+    Incrementally decode the members of an array in a msgpack map.
+
+    This is the msgpack counterpart to `JSONStream`, built on the
+    header API of `msgpack.Unpacker`.  The number of bytes read so far
+    is available as `received`.
+    """
+
+    def __init__(
+            self,
+            fp: Union[BinaryIO, DecompressingReader],
+            size: int = CHUNK_SIZE,
+    ) -> None:
+        import msgpack
+        self._fp = fp
+        self._size = size
+        self._unpacker = msgpack.Unpacker(raw=False)
+        self._out_of_data = msgpack.OutOfData
+        self._eof = False
+        self.received = 0
+
+    def iterate(self, key: str) -> Iterator[Any]:
+        """
+        Yield each member of the array `key` in the top-level map.
+
+        Raises KeyError if `key` is missing and TypeError if the body is
+        not a map or if `key` is not an array.
+        """
+        try:
+            size = self._call(self._unpacker.read_map_header)
+        except TypeError:
+            raise TypeError("expected a map")
+
+        for _ in range(size):
+            if self._call(self._unpacker.unpack) != key:
+                self._call(self._unpacker.skip)
+                continue
+
+            try:
+                count = self._call(self._unpacker.read_array_header)
+            except TypeError:
+                raise TypeError("expected an array")
+            for _ in range(count):
+                yield self._call(self._unpacker.unpack)
+            return
+        raise KeyError(key)
+
+    def _call(self, func: Callable[[], Any]) -> Any:
+        """
+        Call an unpacker method, feeding it more data until it succeeds.
+
+        Unexpected type headers are raised as TypeError.
+        """
+        while True:
+            try:
+                return func()
+            except self._out_of_data:
+                if not self._fill():
+                    raise ValueError("truncated msgpack body")
+            except ValueError as e:
+                if "type header" in str(e).lower():
+                    raise TypeError(e)
+                raise
+
+    def _fill(self) -> bool:
+        """
+        Feed another chunk to the unpacker.  Returns False on EOF.
+        """
+        if self._eof:
+            return False
+
+        data = self._fp.read(self._size)
+        self.received += len(data)
+        self._eof = not data
+        if data:
+            self._unpacker.feed(data)
+        return bool(data)
@@ -0,0 +1,206 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import mmap
+import os
+import stat
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+# Prefix of hostnames hashed with HashKnownHosts.
+HASH_MAGIC = b"|1|"
+
+
+class KnownHosts:
+    """
+    A known_hosts file, indexed by host.
+
+    The file is mapped into memory and indexed as hosts are looked up,
+    by the offsets of their entries.  Hashed hostnames are matched like
+    ssh does, while comments, markers such as @revoked and wildcard
+    patterns are left alone.  Changes are written to a temporary file
+    that then replaces the original, so that the file is never seen
+    half written.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.realpath(path)
+        self._data = b""  # type: Any
+        self._load()
+
+    def __enter__(self) -> "KnownHosts":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b""
+
+    def _load(self) -> None:
+        """
+        Map the file into memory, with an empty index.
+        """
+        self.close()
+        # Line offsets and key types of the entries of each hostname
+        # that has been looked up.
+        self._index = {}  # type: Dict[bytes, List[Tuple[int, int, bytes]]]
+        # Salts, hashes, key types and line offsets of hashed entries.
+        self._hashed = None  # type: Optional[List[Tuple]]
+
+        try:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size:
+                    self._data = mmap.mmap(
+                        f.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+        except FileNotFoundError:
+            pass
+
+    def add(self, host: str, key_type: str, key_data: str) -> Tuple[int, int]:
+        """
+        Save the key of a host, replacing the keys of the same type
+        that were saved for it before, as well as repeated entries.
+
+        Returns the number of added and removed entries, which are both
+        zero if the key is already saved.  Raises OSError if the file
+        cannot be written.
+        """
+        name = host.encode()
+        entry = b" ".join([name, key_type.encode(), key_data.encode()])
+        found = False
+        edits = {}  # type: Dict[int, Tuple[int, bytes]]
+        for start, end in self._lookup(name, key_type.encode()):
+            line = self._data[start:end]
+            hosts, rest = line.split(None, 1)
+            if rest.split()[1] == key_data.encode() and not found:
+                found = True
+                continue
+            others = [
+                h for h in hosts.split(b",")
+                if h != name and not h.startswith(HASH_MAGIC)
+            ]
+            # Entries of other hosts are kept.
+            line = b",".join(others) + b" " + rest + b"\n" if others else b""
+            edits[start] = (end, line)
+
+        if found and not edits:
+            return 0, 0
+        self._write(edits, b"" if found else entry + b"\n")
+        self._load()
+        return int(not found), len(edits)
+
+    def _lookup(self, host: bytes, key_type: bytes) -> List[Tuple]:
+        """
+        Find the line offsets of the entries of a host and key type.
+        """
+        if host not in self._index:
+            self._index[host] = self._find(host)
+        if self._hashed is None:
+            self._hashed = self._find_hashed()
+
+        offsets = [(s, e) for s, e, t in self._index[host] if t == key_type]
+        for salt, digest, hashed_type, line in self._hashed:
+            if hashed_type == key_type and hmac.compare_digest(
+                    hmac.new(salt, host, hashlib.sha1).digest(), digest
+            ):
+                offsets.append(line)
+        return sorted(offsets)
+
+    def _find(self, host: bytes) -> List[Tuple[int, int, bytes]]:
+        """
+        Find the entries of a plain hostname.  The mapped file is
+        searched for the name, which is much faster than splitting
+        every line, and only the lines that contain it are parsed.
+        """
+        entries = []
+        pos = self._data.find(host)
+        while pos >= 0:
+            start, end = self._line(pos)
+            fields = self._fields(start, end)
+            if fields and host in fields[0].split(b","):
+                entries.append((start, end, fields[1]))
+            pos = self._data.find(host, end)
+        return entries
+
+    def _find_hashed(self) -> List[Tuple[bytes, bytes, bytes, Tuple]]:
+        """
+        Find the salts and hashes of the entries with hashed hostnames.
+        """
+        entries = []
+        pos = self._data.find(HASH_MAGIC)
+        while pos >= 0:
+            start, end = self._line(pos)
+            fields = self._fields(start, end)
+            if fields and fields[0].startswith(HASH_MAGIC):
+                try:
+                    salt, digest = fields[0][len(HASH_MAGIC):].split(b"|")
+                    entries.append((
+                        base64.b64decode(salt),
+                        base64.b64decode(digest),
+                        fields[1],
+                        (start, end),
+                    ))
+                except (binascii.Error, ValueError):
+                    pass
+            pos = self._data.find(HASH_MAGIC, end)
+        return entries
+
+    def _line(self, pos: int) -> Tuple[int, int]:
+        """
+        Find the start and end offsets of the line at `pos`.
+        """
+        end = self._data.find(b"\n", pos)
+        return (
+            self._data.rfind(b"\n", 0, pos) + 1,
+            len(self._data) if end < 0 else end,
+        )
+
+    def _fields(self, start: int, end: int) -> Optional[List[bytes]]:
+        """
+        Split an entry into its fields, or return None for comments,
+        entries with markers and invalid lines.
+        """
+        fields = self._data[start:end].split()  # type: List[bytes]
+        if len(fields) < 3 or fields[0].startswith((b"#", b"@")):
+            return None
+        return fields
+
+    def _write(
+            self,
+            edits: Dict[int, Tuple[int, bytes]],
+            entry: bytes,
+    ) -> None:
+        """
+        Rewrite the file with the lines at the offsets in `edits`
+        replaced and `entry` appended.
+        """
+        data = self._data
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(self.path), prefix=".known_hosts-"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pos = 0
+                for start, (end, line) in sorted(edits.items()):
+                    f.write(data[pos:start])
+                    f.write(line)
+                    pos = end + 1
+                f.write(data[pos:])
+                if entry and pos < len(data) and data[-1:] != b"\n":
+                    f.write(b"\n")
+                f.write(entry)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.chmod(tmp, stat.S_IMODE(os.stat(self.path).st_mode))
+            except FileNotFoundError:
+                # New files keep the private mode of the temporary file.
+                pass
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
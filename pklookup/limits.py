@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    A token bucket that allows `rate` requests per second on average,
+    with bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None) -> None:
+        if rate <= 0:
+            raise ValueError("invalid rate: {}".format(rate))
+        self._rate = rate
+        self._capacity = float(burst or max(1, int(rate)))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Take a token, waiting for one to become available.
+
+        Tokens are reserved in the order that callers arrive.  Returns
+        False without waiting if no token is available within `timeout`
+        seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._capacity,
+                self._tokens + (now - self._updated) * self._rate,
+            )
+            self._updated = now
+
+            wait = max(0, (1 - self._tokens) / self._rate)
+            if timeout is not None and wait > timeout:
+                return False
+            self._tokens -= 1
+
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+
+class ConcurrencyLimiter:
+    """
+    An adaptive limit on the number of requests in flight.
+
+    The limit is adjusted with additive increase and multiplicative
+    decrease (AIMD): it grows by one for every `limit` requests that
+    succeed at a stable latency, and is multiplied by `decrease` when
+    a request is rejected as overloaded or takes more than `tolerance`
+    times the baseline latency.  The baseline follows the lowest
+    latencies seen, and slowly drifts upwards so that a permanently
+    slower server is eventually accepted as the new normal.
+    """
+
+    def __init__(
+            self,
+            initial: int = 4,
+            minimum: int = 1,
+            maximum: int = 64,
+            decrease: float = 0.5,
+            tolerance: float = 2.0,
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self._decrease = decrease
+        self._tolerance = tolerance
+        self._baseline = None  # type: Optional[float]
+        self._decreased = 0.0
+        self._inflight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a free slot.
+
+        Returns False if no slot became available within `timeout`
+        seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                    lambda: self._inflight < int(self.limit), timeout
+            ):
+                return False
+            self._inflight += 1
+            return True
+
+    def release(self, latency: float, overloaded: bool = False) -> None:
+        """
+        Free a slot and adjust the limit to the outcome of the request.
+        """
+        with self._cond:
+            self._inflight -= 1
+
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            else:
+                self._baseline += (latency - self._baseline) * 0.01
+
+            now = time.monotonic()
+            if overloaded or latency > self._baseline * self._tolerance:
+                # Decrease at most once per round trip, as the requests
+                # in flight were all sent under the previous limit.
+                if now - self._decreased >= latency:
+                    self._decreased = now
+                    self.limit = max(
+                        self.minimum, self.limit * self._decrease
+                    )
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
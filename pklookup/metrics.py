@@ -0,0 +1,215 @@
+import collections
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Any, Dict, List, Tuple
+
+from .www import Timing
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+FORMATS = ["prometheus", "json"]
+
+
+class Histogram:
+    """
+    A cumulative histogram of request latencies.
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def buckets(self) -> List[Tuple[str, int]]:
+        """
+        Retrieve the cumulative count for each bucket, labelled with its
+        upper bound.
+        """
+        bounds = ["{:g}".format(bound) for bound in BUCKETS] + ["+Inf"]
+        cumulative = 0
+        res = []
+        for bound, count in zip(bounds, self.counts):
+            cumulative += count
+            res.append((bound, cumulative))
+        return res
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile by interpolating linearly within its bucket,
+        in the same way as Prometheus' histogram_quantile().
+        """
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(BUCKETS, self.counts):
+            if cumulative + count >= rank and count:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return float(BUCKETS[-1])
+
+
+class Metrics:
+    """
+    Request counters and latency histograms, fed by `WWW` hooks.
+
+    Requests are counted per method, path and status, errors per
+    method, path and cause, and latencies are kept per method and path.
+    The path is the last component of the request path, such as
+    "server" or "token".
+    """
+
+    def __init__(self) -> None:
+        self.requests = collections.Counter()  # type: collections.Counter
+        self.errors = collections.Counter()  # type: collections.Counter
+        self.latencies = {}  # type: Dict[Tuple[str, str], Histogram]
+        self.created = time.time()
+        self._lock = threading.Lock()
+
+    def __call__(self, timing: Timing) -> None:
+        path = urllib.parse.urlsplit(timing.target).path
+        path = path.rstrip("/").rsplit("/", 1)[-1] or "/"
+        key = (timing.method, path)
+
+        cause = None
+        if timing.error is not None:
+            cause = type(timing.error).__name__
+        elif timing.status is not None and timing.status >= 400:
+            cause = "HTTP {}".format(timing.status)
+        status = "error" if timing.status is None else str(timing.status)
+
+        with self._lock:
+            self.requests[key + (status,)] += 1
+            if cause:
+                self.errors[key + (cause,)] += 1
+            if key not in self.latencies:
+                self.latencies[key] = Histogram()
+            self.latencies[key].observe(timing.total)
+
+    def prometheus(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP pklookup_requests_total Requests by status.",
+                "# TYPE pklookup_requests_total counter",
+            ]
+            for (method, path, status), count in sorted(self.requests.items()):
+                labels = _labels(method=method, path=path, status=status)
+                lines.append("pklookup_requests_total{} {}".format(
+                    labels, count
+                ))
+
+            lines += [
+                "# HELP pklookup_request_errors_total Failed requests by "
+                "cause.",
+                "# TYPE pklookup_request_errors_total counter",
+            ]
+            for (method, path, cause), count in sorted(self.errors.items()):
+                labels = _labels(method=method, path=path, cause=cause)
+                lines.append("pklookup_request_errors_total{} {}".format(
+                    labels, count
+                ))
+
+            name = "pklookup_request_duration_seconds"
+            lines += [
+                "# HELP {} Client-observed request latency.".format(name),
+                "# TYPE {} histogram".format(name),
+            ]
+            for (method, path), hist in sorted(self.latencies.items()):
+                for bound, count in hist.buckets():
+                    labels = _labels(method=method, path=path, le=bound)
+                    lines.append("{}_bucket{} {}".format(name, labels, count))
+                labels = _labels(method=method, path=path)
+                lines.append("{}_sum{} {}".format(name, labels, hist.sum))
+                lines.append("{}_count{} {}".format(name, labels, hist.count))
+
+        lines += [
+            "# HELP pklookup_last_run_timestamp_seconds Start of the run "
+            "that wrote these metrics.",
+            "# TYPE pklookup_last_run_timestamp_seconds gauge",
+            "pklookup_last_run_timestamp_seconds {}".format(self.created),
+        ]
+        return "".join("{}\n".format(line) for line in lines)
+
+    def json(self) -> str:
+        """
+        Render the metrics as a JSON document.
+        """
+        with self._lock:
+            doc = {
+                "created": self.created,
+                "requests": [
+                    {"method": m, "path": p, "status": s, "count": count}
+                    for (m, p, s), count in sorted(self.requests.items())
+                ],
+                "errors": [
+                    {"method": m, "path": p, "cause": c, "count": count}
+                    for (m, p, c), count in sorted(self.errors.items())
+                ],
+                "latency": [
+                    {
+                        "method": m,
+                        "path": p,
+                        "count": hist.count,
+                        "sum": hist.sum,
+                        "buckets": collections.OrderedDict(hist.buckets()),
+                        "p50": hist.quantile(0.5),
+                        "p95": hist.quantile(0.95),
+                        "p99": hist.quantile(0.99),
+                    }
+                    for (m, p), hist in sorted(self.latencies.items())
+                ],
+            }  # type: Dict[str, Any]
+        return json.dumps(doc, indent=2) + "\n"
+
+    def write(self, path: str, fmt: str = "prometheus") -> None:
+        """
+        Write the metrics to `path` atomically, so that a concurrent
+        reader such as node_exporter never sees a partial file.
+        """
+        if fmt not in FORMATS:
+            raise ValueError("invalid metrics format: {}".format(fmt))
+        data = self.prometheus() if fmt == "prometheus" else self.json()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".pklookup-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def _labels(**labels: str) -> str:
+    """
+    Format Prometheus labels, escaping their values.
+    """
+    pairs = []
+    for key, value in sorted(labels.items()):
+        value = value.replace("\\", "\\\\").replace("\n", "\\n")
+        pairs.append('{}="{}"'.format(key, value.replace('"', '\\"')))
+    return "{{{}}}".format(",".join(pairs))
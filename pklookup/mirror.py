@@ -0,0 +1,439 @@
+import base64
+import binascii
+import datetime
+import email.utils
+import hashlib
+import heapq
+import ipaddress
+import itertools
+import os
+import re
+import sqlite3
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+# Columns of the mirrored collections, in the order of the API records.
+COLUMNS = {
+    "server": [
+        "id",
+        "token_id",
+        "ip",
+        "port",
+        "key_type",
+        "key_data",
+        "key_comment",
+        "created",
+    ],
+    "token": ["id", "role", "description", "created"],
+}
+
+# Columns that hold integers, which the API may send as strings.
+NUMERIC_COLUMNS = ["id", "token_id", "port"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS server (
+    id INTEGER PRIMARY KEY,
+    token_id,
+    ip,
+    port,
+    key_type,
+    key_data,
+    key_comment,
+    created,
+    fingerprint
+);
+CREATE TABLE IF NOT EXISTS token (
+    id INTEGER PRIMARY KEY,
+    role,
+    description,
+    created
+);
+CREATE TABLE IF NOT EXISTS sync (
+    name TEXT PRIMARY KEY,
+    synced REAL
+);
+"""
+
+# Indexes for `Mirror.lookup()`.  The port is not indexed, as it is
+# only ever looked up together with the ip.
+INDEXES = """
+CREATE INDEX IF NOT EXISTS server_ip ON server (ip);
+CREATE INDEX IF NOT EXISTS server_key_data ON server (key_data);
+CREATE INDEX IF NOT EXISTS server_fingerprint ON server (fingerprint);
+"""
+
+# Number of rows inserted or deleted per statement.
+BATCH_SIZE = 1000
+
+# ISO 8601 dates and times, with an optional UTC offset.
+ISO_TIME = re.compile(
+    r"^(\d{4})-(\d\d)-(\d\d)"
+    r"(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6})\d*)?)?)?"
+    r" *(Z|[+-]\d\d:?\d\d)?$",
+    re.IGNORECASE,
+)
+
+
+class Mirror:
+    """
+    A local SQLite copy of the server and token collections.
+
+    `sync()` applies the difference between the mirror and the records
+    of a collection in a single transaction, so readers never see a
+    partially synced collection and a failed sync changes nothing.
+    Records are immutable in the API, so only new ids are inserted and
+    ids that are no longer listed are deleted.  The database uses
+    write-ahead logging so that reads are not blocked by a sync.
+    """
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.executescript(INDEXES)
+
+    def __enter__(self) -> "Mirror":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def sync(self, name: str, records: Iterable[Dict]) -> Tuple[int, int]:
+        """
+        Update the collection `name` to match `records`.
+
+        Returns the number of added and deleted records.  Raises
+        KeyError if a record lacks a column and TypeError if its id is
+        not an integer.
+        """
+        columns = COLUMNS[name]
+        names = columns + (["fingerprint"] if name == "server" else [])
+        insert = "INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(
+            name, ", ".join(names), ", ".join("?" * len(names))
+        )
+
+        with self._conn:
+            # Take the write lock up front, so that concurrent syncs do
+            # not work from the same set of known ids.
+            self._conn.execute("BEGIN IMMEDIATE")
+            known = {
+                row[0]
+                for row in self._conn.execute("SELECT id FROM " + name)
+            }
+            seen = set()
+            rows = []  # type: List[Tuple]
+            added = 0
+            for record in records:
+                try:
+                    record_id = int(record["id"])
+                except ValueError:
+                    raise TypeError("invalid id: {}".format(record["id"]))
+                seen.add(record_id)
+                if record_id in known:
+                    continue
+
+                row = (record_id,) + tuple(record[c] for c in columns[1:])
+                if name == "server":
+                    row += (fingerprint(record["key_data"]),)
+                rows.append(row)
+                if len(rows) >= BATCH_SIZE:
+                    self._conn.executemany(insert, rows)
+                    added += len(rows)
+                    rows = []
+            self._conn.executemany(insert, rows)
+            added += len(rows)
+
+            deleted = [(i,) for i in known - seen]
+            self._conn.executemany(
+                "DELETE FROM {} WHERE id = ?".format(name), deleted
+            )
+            # Columns are named, as mirrors created by older versions
+            # have more of them.
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync (name, synced) VALUES (?, ?)",
+                (name, time.time()),
+            )
+        return added, len(deleted)
+
+    def synced(self, name: str) -> Optional[float]:
+        """
+        Retrieve the time of the last sync of `name`, or None if it has
+        never been synced.
+        """
+        row = self._conn.execute(
+            "SELECT synced FROM sync WHERE name = ?", (name,)
+        ).fetchone()
+        return None if row is None else float(row[0])
+
+    def records(
+            self,
+            name: str,
+            limit: Optional[int] = None,
+            filters: Optional[Dict[str, Any]] = None,
+            sort: Optional[str] = None,
+    ) -> Iterator[Dict]:
+        """
+        Iterate over the records of `name` that match `filters`, in the
+        order of their ids or sorted as with `sort_records()`.
+
+        Filters on columns are applied by SQLite and `created_after`
+        with `matches()`.  Raises ValueError for any other filter or
+        sort column.
+        """
+        columns = COLUMNS[name] + (["fingerprint"] if name == "server" else [])
+        clauses = []
+        params = []
+        rest = {}
+        for column, value in sorted((filters or {}).items()):
+            if column == "created_after":
+                rest[column] = value
+            elif column not in columns:
+                raise ValueError("invalid filter: {}".format(column))
+            elif column in ("port", "token_id"):
+                # Numbers are stored as they were received, which may be
+                # either integers or strings.
+                clauses.append("CAST({} AS TEXT) = ?".format(column))
+                params.append(str(value))
+            else:
+                clauses.append("{} = ?".format(column))
+                params.append(value)
+
+        order = "id"
+        by_time = False
+        if sort:
+            column = sort.lstrip("-")
+            if column not in COLUMNS[name]:
+                raise ValueError("invalid sort: {}".format(column))
+            if column in NUMERIC_COLUMNS:
+                column = "CAST({} AS INTEGER)".format(column)
+            # Timestamps are stored as they were received, and RFC 1123
+            # dates do not sort chronologically as text.
+            by_time = column == "created"
+            if not by_time:
+                order = "{} {}, id".format(
+                    column, "DESC" if sort.startswith("-") else "ASC"
+                )
+
+        query = "SELECT * FROM {} WHERE {} ORDER BY {}".format(
+            name, " AND ".join(clauses) or "1", order
+        )
+        if limit is not None and not rest and not by_time:
+            query += " LIMIT {:d}".format(limit)
+        rows = (
+            dict(row) for row in self._conn.execute(query, params)
+        )  # type: Iterator[Dict]
+        if rest:
+            rows = (row for row in rows if matches(row, rest))
+        if by_time and sort:
+            rows = iter(sort_records(rows, sort, limit))
+        yield from itertools.islice(rows, limit)
+
+    def get(self, name: str, record_id: int) -> Optional[Dict]:
+        """
+        Retrieve a record by id.
+        """
+        row = self._conn.execute(
+            "SELECT * FROM {} WHERE id = ?".format(name), (record_id,)
+        ).fetchone()
+        return None if row is None else dict(row)
+
+    def lookup(self, filters: Dict[str, Any]) -> List[Dict]:
+        """
+        Retrieve the servers that match the filters from
+        `parse_query()`, in the order of their ids.
+        """
+        return list(self.records("server", filters=filters))
+
+    def _migrate(self) -> None:
+        """
+        Add the fingerprint column to mirrors created without it.
+        """
+        columns = [
+            row[1] for row in self._conn.execute("PRAGMA table_info(server)")
+        ]
+        if "fingerprint" in columns:
+            return
+
+        with self._conn:
+            self._conn.execute("ALTER TABLE server ADD COLUMN fingerprint")
+            rows = self._conn.execute("SELECT id, key_data FROM server")
+            self._conn.executemany(
+                "UPDATE server SET fingerprint = ? WHERE id = ?",
+                [(fingerprint(key_data), i) for i, key_data in rows],
+            )
+
+
+def fingerprint(key_data: str) -> Optional[str]:
+    """
+    Compute the SHA256 fingerprint of a key in the format of
+    `ssh-keygen -l`, or None if `key_data` is not valid base64.
+    """
+    try:
+        blob = base64.b64decode(key_data, validate=True)
+    except (binascii.Error, TypeError, ValueError):
+        return None
+    digest = base64.b64encode(hashlib.sha256(blob).digest()).decode()
+    return "SHA256:{}".format(digest.rstrip("="))
+
+
+def parse_query(value: str) -> Dict[str, Any]:
+    """
+    Parse a server lookup into filters on the server columns.
+
+    A query is a SHA256 fingerprint, an ip, an ip:port or [ip]:port,
+    or the key data of a public key with an optional key type.
+    """
+    value = value.strip()
+    if value.startswith("SHA256:"):
+        return {"fingerprint": value}
+
+    if value.startswith("["):
+        host, sep, port = value[1:].partition("]:")
+        if sep and host and port.isdigit():
+            return {"ip": host, "port": int(port)}
+        raise ValueError("invalid query: {}".format(value))
+
+    host, sep, port = value.rpartition(":")
+    if sep and value.count(":") == 1 and port.isdigit():
+        return {"ip": host, "port": int(port)}
+
+    try:
+        return {"ip": str(ipaddress.ip_address(value))}
+    except ValueError:
+        pass
+
+    # A public key, optionally with its key type and a comment.
+    fields = value.split()
+    if len(fields) >= 2 and not fingerprint(fields[0]) and \
+            fingerprint(fields[1]):
+        return {"key_type": fields[0], "key_data": fields[1]}
+    if fields and fingerprint(fields[0]):
+        return {"key_data": fields[0]}
+    raise ValueError("invalid query: {}".format(value))
+
+
+def parse_time(value: Any) -> float:
+    """
+    Parse a timestamp into seconds since the epoch.
+
+    Timestamps may be numbers, ISO 8601 dates and times or RFC 1123
+    dates as sent by Flask.  Times without an offset are taken as UTC.
+    Raises ValueError for anything else.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    m = ISO_TIME.match(value)
+    if not m:
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (IndexError, TypeError, ValueError):
+            raise ValueError("invalid timestamp: {}".format(value))
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return date.timestamp()
+
+    year, month, day, hour, minute, second = (
+        int(f) if f else 0 for f in m.groups()[:6]
+    )
+    date = datetime.datetime(
+        year, month, day, hour, minute, second,
+        int((m.group(7) or "0").ljust(6, "0")),
+        datetime.timezone.utc,
+    )
+    offset = m.group(8)
+    if offset and offset.upper() != "Z":
+        offset = offset.replace(":", "")
+        delta = datetime.timedelta(
+            hours=int(offset[1:3]), minutes=int(offset[3:5])
+        )
+        date -= delta if offset[0] == "+" else -delta
+    return date.timestamp()
+
+
+def matches(record: Dict, filters: Dict[str, Any]) -> bool:
+    """
+    Check a record against filters.
+
+    Filters compare a column for equality, except for `fingerprint`,
+    which is computed from the key data, and `created_after`.  Records
+    with a creation time that cannot be parsed pass `created_after`,
+    as the server is then trusted to have applied it.
+    """
+    for column, value in filters.items():
+        if column == "fingerprint":
+            if fingerprint(record["key_data"]) != value:
+                return False
+        elif column == "created_after":
+            try:
+                created = parse_time(record["created"])
+            except ValueError:
+                continue
+            if created <= parse_time(value):
+                return False
+        elif str(record[column]) != str(value):
+            return False
+    return True
+
+
+def sort_key(column: str) -> Callable[[Dict], Tuple[bool, Any]]:
+    """
+    Create a key function that orders records by `column`: numerically
+    for ids and ports, by time for `created` and as strings otherwise.
+    Values that cannot be converted are ordered last, as strings.
+    """
+    def key(record: Dict) -> Tuple[bool, Any]:
+        value = record[column]
+        try:
+            if column in NUMERIC_COLUMNS:
+                return False, int(value)
+            if column == "created":
+                return False, parse_time(value)
+        except (TypeError, ValueError):
+            return True, str(value)
+        return False, str(value)
+
+    return key
+
+
+def sort_records(
+        records: Iterable[Dict],
+        sort: str,
+        limit: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Sort records by the column `sort`, in descending order if it is
+    prefixed with "-", and keep the first `limit`.
+
+    With a limit, the records are selected with a heap that never holds
+    more than `limit` of them.  Records that compare equal keep their
+    order.  Raises KeyError if a record lacks the column.
+    """
+    key = sort_key(sort.lstrip("-"))
+    if limit is None:
+        return sorted(records, key=key, reverse=sort.startswith("-"))
+    if sort.startswith("-"):
+        return heapq.nlargest(limit, records, key=key)
+    return heapq.nsmallest(limit, records, key=key)
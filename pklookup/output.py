@@ -0,0 +1,113 @@
+import collections
+import csv
+import json
+from typing import Any, Dict, List, TextIO
+
+FORMATS = ["json", "ndjson", "csv", "tsv"]
+
+
+class Writer:
+    """
+    Write rows in a machine-readable format as they are produced.
+
+    Only the columns in `header` are written, in that order.  The output
+    is flushed after every row, so that a consumer on the other end of a
+    pipe sees each row as soon as it has been received.
+    """
+
+    def __init__(self, out: TextIO, header: List[str]) -> None:
+        self._out = out
+        self._header = header
+        self.count = 0
+
+    def write(self, row: Dict[str, Any]) -> None:
+        """
+        Write a row.  Raises KeyError if a column is missing.
+        """
+        self._write([row[key] for key in self._header])
+        self.count += 1
+        self._out.flush()
+
+    def close(self) -> None:
+        """
+        Finish the output once all rows have been written.
+        """
+        self._out.flush()
+
+    def _write(self, values: List[Any]) -> None:
+        raise NotImplementedError
+
+
+class JSONWriter(Writer):
+    """
+    Write rows as a JSON array of objects, one object per line.
+    """
+
+    def _write(self, values: List[Any]) -> None:
+        obj = collections.OrderedDict(zip(self._header, values))
+        self._out.write("{}{}".format(
+            ",\n" if self.count else "[\n", json.dumps(obj)
+        ))
+
+    def close(self) -> None:
+        self._out.write("\n]\n" if self.count else "[]\n")
+        super().close()
+
+
+class NDJSONWriter(Writer):
+    """
+    Write rows as newline-delimited JSON objects.
+    """
+
+    def _write(self, values: List[Any]) -> None:
+        obj = collections.OrderedDict(zip(self._header, values))
+        self._out.write("{}\n".format(json.dumps(obj)))
+
+
+class CSVWriter(Writer):
+    """
+    Write rows as CSV with a header line.
+    """
+
+    def __init__(self, out: TextIO, header: List[str]) -> None:
+        super().__init__(out, header)
+        self._writer = csv.writer(out, lineterminator="\n")
+        self._writer.writerow(header)
+
+    def _write(self, values: List[Any]) -> None:
+        self._writer.writerow(values)
+
+
+class TSVWriter(Writer):
+    """
+    Write rows as tab-separated values with a header line.
+
+    Backslashes, tabs and line breaks in values are escaped as \\\\,
+    \\t, \\n and \\r, and None is written as an empty field.
+    """
+
+    ESCAPES = str.maketrans({
+        "\\": "\\\\",
+        "\t": "\\t",
+        "\n": "\\n",
+        "\r": "\\r",
+    })
+
+    def __init__(self, out: TextIO, header: List[str]) -> None:
+        super().__init__(out, header)
+        self._write(header)
+
+    def _write(self, values: List[Any]) -> None:
+        fields = [
+            "" if v is None else str(v).translate(self.ESCAPES)
+            for v in values
+        ]
+        self._out.write("{}\n".format("\t".join(fields)))
+
+
+WRITERS = {
+    "json": JSONWriter,
+    "ndjson": NDJSONWriter,
+    "csv": CSVWriter,
+    "tsv": TSVWriter,
+}
@@ -0,0 +1,113 @@
+import collections
+import hashlib
+import time
+from typing import Any, Dict, List, Tuple
+
+from .mirror import ISO_TIME, fingerprint, parse_time
+
+# Formats of the creation time buckets.
+BUCKETS = collections.OrderedDict([
+    ("day", "%Y-%m-%d"),
+    ("month", "%Y-%m"),
+    ("year", "%Y"),
+])
+
+# Width of the longest bar of the creation time histogram.
+HISTOGRAM_WIDTH = 40
+
+
+class ServerStats:
+    """
+    Aggregate server records as they are streamed.
+
+    Only counters are kept, which are bounded by the number of distinct
+    key types, tokens and creation time buckets, except for duplicate
+    detection: every key is remembered by its SHA-256 digest and every
+    ip as is, each with the id of the first server that had it.
+    """
+
+    def __init__(self, bucket: str = "month") -> None:
+        self.count = 0
+        self.key_types = collections.Counter()  # type: collections.Counter
+        self.token_ids = collections.Counter()  # type: collections.Counter
+        self.created = collections.Counter()  # type: collections.Counter
+        # Ids of the servers with each duplicate key or ip.
+        self.duplicate_keys = collections.OrderedDict()  # type: Dict
+        self.duplicate_ips = collections.OrderedDict()  # type: Dict
+        self._format = BUCKETS[bucket]
+        self._keys = {}  # type: Dict[bytes, Any]
+        self._ips = {}  # type: Dict[str, Any]
+        self._dates = {}  # type: Dict[Tuple[str, ...], str]
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """
+        Add a server record.  Raises KeyError if a column is missing.
+        """
+        key_data = str(record["key_data"])
+        self.count += 1
+        self.key_types[str(record["key_type"])] += 1
+        self.token_ids[str(record["token_id"])] += 1
+        self.created[self._bucket(record["created"])] += 1
+
+        digest = hashlib.sha256(key_data.encode()).digest()
+        first = self._keys.setdefault(digest, record["id"])
+        if first != record["id"]:
+            label = fingerprint(key_data) or key_data
+            self.duplicate_keys.setdefault(label, [first]).append(
+                record["id"]
+            )
+
+        ip = str(record["ip"])
+        first = self._ips.setdefault(ip, record["id"])
+        if first != record["id"]:
+            self.duplicate_ips.setdefault(ip, [first]).append(record["id"])
+
+    def histogram(self) -> List[Dict[str, Any]]:
+        """
+        Count the servers per creation time bucket, in chronological
+        order with servers of unknown creation time last.
+        """
+        most = max(self.created.values(), default=0)
+        return [{
+            "created": bucket,
+            "count": count,
+            "histogram": "#" * max(1, round(HISTOGRAM_WIDTH * count / most)),
+        } for bucket, count in sorted(self.created.items())]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Collect the statistics, with counters ordered as they are
+        printed.
+        """
+        return collections.OrderedDict([
+            ("count", self.count),
+            ("key_type", collections.OrderedDict(
+                self.key_types.most_common()
+            )),
+            ("token_id", collections.OrderedDict(
+                self.token_ids.most_common()
+            )),
+            ("created", collections.OrderedDict(
+                sorted(self.created.items())
+            )),
+            ("duplicate_keys", self.duplicate_keys),
+            ("duplicate_ips", self.duplicate_ips),
+        ])
+
+    def _bucket(self, created: Any) -> str:
+        # The bucket of a UTC time only depends on its date, which saves
+        # parsing every single time.
+        m = ISO_TIME.match(created) if isinstance(created, str) else None
+        if m and m.group(8) in (None, "Z", "z"):
+            date = m.group(1, 2, 3)
+            if date not in self._dates:
+                self._dates[date] = self._parse(created)
+            return self._dates[date]
+        return self._parse(created)
+
+    def _parse(self, created: Any) -> str:
+        try:
+            seconds = parse_time(created)
+            return time.strftime(self._format, time.gmtime(seconds))
+        except (OSError, OverflowError, ValueError):
+            return "unknown"
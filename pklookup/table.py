@@ -0,0 +1,124 @@
+import itertools
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Number of rows that the column widths are estimated from.
+SAMPLE_SIZE = 100
+
+# Columns are not narrowed below this width to fit the table.
+MIN_WIDTH = 8
+
+ELLIPSIS = "..."
+
+OVERFLOWS = ["elide", "truncate", "none"]
+
+
+class Table:
+    """
+    Render rows as a text table in a single pass.
+
+    The column widths are estimated from the first `sample` rows, which
+    are the only rows that are held in memory; every later row is
+    rendered as soon as it arrives.  If the table is wider than
+    `max_width`, the widest columns are narrowed until it fits.
+
+    Cells in narrowed columns are elided in the middle with `overflow`
+    "elide", which keeps both ends of keys visible, or cut at the end
+    with "truncate".  With "none", no column is narrowed.  Cells that
+    are wider than a column that was not narrowed, such as ids that
+    grow past the sample, are printed in full at the cost of alignment,
+    as they must never be shortened.
+    """
+
+    def __init__(
+            self,
+            header: List[str],
+            max_width: Optional[int] = None,
+            sample: int = SAMPLE_SIZE,
+            overflow: str = "elide",
+    ) -> None:
+        if overflow not in OVERFLOWS:
+            raise ValueError("invalid overflow: {}".format(overflow))
+        self._header = header
+        self._max_width = max_width
+        self._sample = sample
+        self._overflow = overflow
+        self._narrowed = []  # type: List[bool]
+
+    def lines(self, rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+        """
+        Render the table line by line.  Raises KeyError if a row lacks
+        a column.
+        """
+        rows = iter(rows)
+        sample = [
+            self._cells(row) for row in itertools.islice(rows, self._sample)
+        ]
+        widths = self._widths(sample)
+        # Columns that are narrower than the sample and thus elided.
+        self._narrowed = [
+            w < max([len(h)] + [len(c[i]) for c in sample])
+            for i, (h, w) in enumerate(zip(self._header, widths))
+        ]
+
+        border = "+{}+".format("+".join("-" * (w + 2) for w in widths))
+        yield border
+        yield self._line(
+            [self._fit(h, w, i).strip().center(w)
+             for i, (h, w) in enumerate(zip(self._header, widths))],
+            widths,
+        )
+        yield border.replace("-", "=")
+        for cells in sample:
+            yield self._line(cells, widths)
+        for row in rows:
+            yield self._line(self._cells(row), widths)
+        yield border
+
+    def _cells(self, row: Dict[str, Any]) -> List[str]:
+        return [
+            str(row[key]).replace("\r", " ").replace("\n", " ")
+            for key in self._header
+        ]
+
+    def _widths(self, sample: List[List[str]]) -> List[int]:
+        """
+        Estimate the column widths from a sample of rows.
+        """
+        widths = [len(h) for h in self._header]
+        for cells in sample:
+            widths = [max(w, len(c)) for w, c in zip(widths, cells)]
+
+        if self._overflow == "none" or not self._max_width:
+            return widths
+
+        # Borders and padding take 3 characters per column, plus one.
+        excess = sum(widths) + 3 * len(widths) + 1 - self._max_width
+        while excess > 0:
+            i = max(range(len(widths)), key=lambda i: widths[i])
+            if widths[i] <= MIN_WIDTH:
+                break
+            widths[i] -= 1
+            excess -= 1
+        return widths
+
+    def _line(self, cells: List[str], widths: List[int]) -> str:
+        return "| {} |".format(" | ".join(
+            self._fit(c, w, i) for i, (c, w) in enumerate(zip(cells, widths))
+        ))
+
+    def _fit(self, cell: str, width: int, column: int) -> str:
+        """
+        Pad a cell to `width`, or shorten it if it is wider and in a
+        narrowed column.
+        """
+        if len(cell) <= width or not self._narrowed[column]:
+            return cell.ljust(width)
+        if width <= len(ELLIPSIS):
+            return cell[:width]
+
+        keep = width - len(ELLIPSIS)
+        if self._overflow == "truncate":
+            return cell[:keep] + ELLIPSIS
+        head = (keep + 1) // 2
+        tail = keep - head
+        return cell[:head] + ELLIPSIS + (cell[-tail:] if tail else "")
@@ -1,25 +1,757 @@
+import codecs
+import collections
+import concurrent.futures
+import email.utils
 import http.client
+import itertools
 import json
+import random
+import socket
 import ssl
-import urllib.error
+import threading
+import time
+import urllib.parse
 import urllib.request
-from typing import Any, BinaryIO, Dict, Optional, Union
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .cache import CacheWriter, ResponseCache
+from .compression import (
+    ACCEPT_ENCODING,
+    DecompressingReader,
+    compress,
+    decompress,
+)
+from .formats import (
+    ACCEPT,
+    DECODERS,
+    MSGPACK,
+    MsgpackStream,
+    iterate_member,
+    media_type,
+)
+from .limits import ConcurrencyLimiter, RateLimiter
+
+# A request for `WWW.batch()`: (method, path, kwargs).
+Request = Tuple[str, str, Dict[str, Any]]
+Connection = http.client.HTTPConnection
+Response = http.client.HTTPResponse
+
+# Size of the chunks that are read from streamed responses.
+CHUNK_SIZE = 64 * 1024
+
+# Largest response body that is read into the reused per-thread buffer;
+# larger bodies get a buffer of their own that is released afterwards.
+MAX_BUFFER_SIZE = 32 * 1024 * 1024
+
+# Errors raised when a kept-alive connection has been closed by the
+# remote end while it was sitting idle in a pool.
+STALE_ERRORS = (
+    BrokenPipeError,
+    ConnectionAbortedError,
+    ConnectionResetError,
+    http.client.RemoteDisconnected,
+)
+
+
+# Responses and errors that are retried for idempotent methods.
+RETRY_STATUSES = (429, 502, 503, 504)
+RETRY_ERRORS = (
+    ConnectionError,
+    socket.timeout,
+    http.client.IncompleteRead,
+)
+
+# Errors that are wrapped in a WWWError.
+ERRORS = (
+    OSError,
+    ValueError,
+    http.client.HTTPException,
+    ssl.CertificateError,
+)
 
 
 class WWWError(Exception):
     pass
 
 
-class WWW:
+def get_json_loads() -> Callable[[Union[bytes, memoryview]], Any]:
+    """
+    Retrieve the fastest available function that decodes JSON from
+    bytes or a memoryview.
+
+    orjson decodes a memoryview in place and ujson needs bytes.  The
+    standard library is used if neither is installed.
+    """
+    try:
+        import orjson
+        loads = orjson.loads  # type: Callable[[Any], Any]
+        return loads
+    except ImportError:
+        pass
+
+    try:
+        import ujson
+        return lambda data: ujson.loads(bytes(data))
+    except ImportError:
+        pass
+
+    # json.loads() only accepts bytes from Python 3.6 on.
+    return lambda data: json.loads(bytes(data).decode("utf-8"))
+
+
+json_loads = get_json_loads()
+
+
+class Timing:
+    """
+    The timing of a single HTTP request, as passed to `WWW` hooks.
+
+    `phases` maps phase names to seconds, in the order in which they
+    happened: "queue" while waiting for the rate and concurrency limits,
+    "dns", "connect" and "tls" for new connections, "ttfb" from sending
+    the request until the response headers arrived, and "body",
+    "decompress" and "decode" for the response body.  Streamed responses
+    are decompressed and decoded as they are read, so their "body"
+    includes both.  `received` counts the bytes on the wire.
+    """
+
+    def __init__(self, method: str, target: str) -> None:
+        self.method = method
+        self.target = target
+        self.status = None  # type: Optional[int]
+        self.phases = collections.OrderedDict()  # type: Dict[str, float]
+        self.sent = 0
+        self.received = 0
+        self.error = None  # type: Optional[BaseException]
+
+    def __repr__(self) -> str:
+        phases = ", ".join(
+            "{}={:.3f}".format(k, v) for k, v in self.phases.items()
+        )
+        return "<Timing {} {} {} [{}]>".format(
+            self.method, self.target, self.status or self.error, phases
+        )
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+
+class JSONStream:
+    """
+    Incrementally decode the members of an array in a JSON object.
+
+    Only the array and the value being decoded are kept in memory, so
+    arbitrarily large responses can be consumed one record at a time.
+    The number of bytes read so far is available as `received`.
+    """
+
+    def __init__(
+            self,
+            fp: Union[BinaryIO, DecompressingReader],
+            size: int = CHUNK_SIZE,
+    ) -> None:
+        self._fp = fp
+        self._size = size
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self.received = 0
+
+    def iterate(self, key: str) -> Iterator[Any]:
+        """
+        Yield the members of the array `key` in the top-level object.
+
+        Raises TypeError if the response is not an object or if `key`
+        is not an array, and KeyError if `key` is missing.
+        """
+        if self._next() != "{":
+            raise TypeError("expected an object")
+
+        if self._peek() != "}":
+            while True:
+                name = self._value()
+                if self._next() != ":":
+                    raise ValueError("expected ':' at {}".format(self._pos))
+                if name == key:
+                    yield from self._array()
+                    return
+                self._value()
+                if self._next() != ",":
+                    break
+        raise KeyError(key)
+
+    def _array(self) -> Iterator[Any]:
+        """
+        Yield the members of the array at the current position.
+        """
+        if self._next() != "[":
+            raise TypeError("expected an array")
+
+        if self._peek() == "]":
+            self._pos += 1
+            return
+
+        while True:
+            yield self._value()
+            char = self._next()
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError("expected ',' at {}".format(self._pos))
+
+    def _value(self) -> Any:
+        """
+        Decode the value at the current position.
+        """
+        while True:
+            self._peek()
+            try:
+                obj, end = self._json.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+
+            # Numbers that end the buffer may continue in the next
+            # chunk.
+            if isinstance(obj, (int, float)) and not self._eof and (
+                    end == len(self._buf) or self._buf[end] in "+-.eE"
+            ) and self._fill():
+                continue
+
+            self._pos = end
+            return obj
+
+    def _peek(self) -> str:
+        """
+        Skip whitespace and return the next character.
+        """
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in \
+                    " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _next(self) -> str:
+        """
+        Consume and return the next non-whitespace character.
+        """
+        char = self._peek()
+        self._pos += len(char)
+        return char
+
+    def _fill(self) -> bool:
+        """
+        Read another chunk.  Returns False on EOF.
+        """
+        if self._eof:
+            return False
+
+        data = self._fp.read(self._size)
+        self.received += len(data)
+        self._buf = self._buf[self._pos:] + self._utf8.decode(data, not data)
+        self._pos = 0
+        self._eof = not data
+        return bool(data)
+
+
+class HTTPResponse(http.client.HTTPResponse):
+    """
+    A HTTP response whose body can be read within a deadline.
+
+    Socket timeouts apply to every single read from the socket, so a
+    body that trickles in never times out as a whole.  If `read_timeout`
+    is set to a function that returns the timeout of the next read, the
+    socket timeout is lowered to it before every read, and each read
+    waits for at most one read from the socket.  The function raises
+    once the deadline has passed.
+    """
+
+    def __init__(self, sock: socket.socket, *args: Any, **kwargs: Any) -> None:
+        super().__init__(sock, *args, **kwargs)
+        self.read_timeout = None  # type: Optional[Callable[[], Any]]
+        self._socket = sock
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        if self.read_timeout is None:
+            return super().read(amt)
+
+        if amt is None or amt < 0:
+            chunks = []  # type: List[bytes]
+            while True:
+                data = self.read(CHUNK_SIZE)
+                if not data:
+                    return b"".join(chunks)
+                chunks.append(data)
+
+        self._socket.settimeout(self.read_timeout())
+        try:
+            data = self.read1(amt)
+        except socket.timeout:
+            # Raises if the timeout was the time left until the
+            # deadline.
+            self.read_timeout()
+            raise
+        if self.length == 0 and not self.isclosed():
+            # Unlike `read()`, `read1()` leaves the response open at the
+            # end of the body, which would keep the connection busy.
+            self._close_conn()  # type: ignore
+        return data
+
+    def readinto(self, b: Any) -> int:
+        if self.read_timeout is None:
+            return super().readinto(b)
+
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class HTTPConnection(http.client.HTTPConnection):
+    """
+    A HTTP connection that records how long it took to connect.
+
+    After `connect()`, `phases` holds the seconds spent resolving the
+    host ("dns") and establishing the connection ("connect").
+    """
+
+    response_class = HTTPResponse
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.phases = collections.OrderedDict()  # type: Dict[str, float]
+        self._create_connection = self._resolve_and_connect
+
+    def connect(self) -> None:
+        """
+        Connect to the host, through the tunnel if one is configured.
+        """
+        self.phases = collections.OrderedDict()
+        start = time.monotonic()
+        http.client.HTTPConnection.connect(self)
+        self.phases["connect"] = time.monotonic() - start - \
+            self.phases.get("dns", 0)
+
+    def _resolve_and_connect(
+            self,
+            address: Tuple[str, int],
+            timeout: Any = socket._GLOBAL_DEFAULT_TIMEOUT,  # type: ignore
+            source_address: Optional[Tuple[str, int]] = None,
+    ) -> socket.socket:
+        """
+        Resolve the host separately from connecting to it.
+        """
+        host, port = address
+        start = time.monotonic()
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        self.phases["dns"] = time.monotonic() - start
+
+        error = OSError("getaddrinfo returns an empty list")
+        for _family, _type, _proto, _name, sockaddr in infos:
+            try:
+                return socket.create_connection(
+                    (str(sockaddr[0]), int(sockaddr[1])),
+                    timeout,
+                    source_address,
+                )
+            except OSError as e:
+                error = e
+        raise error
+
+
+class HTTPSConnection(HTTPConnection, http.client.HTTPSConnection):
+    """
+    A HTTPS connection that can resume a previous TLS session.
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            context: ssl.SSLContext,
+            session: Any = None,
+    ) -> None:
+        # `session` is an ssl.SSLSession, which is only available from
+        # Python 3.6 on.
+        super().__init__(host, port, context=context)
+        self.session = session
+        self._ssl_context = context
+
+    def connect(self) -> None:
+        """
+        Connect to the host and perform the TLS handshake.
+
+        Resuming a session skips the full handshake when the server
+        still remembers it.
+        """
+        HTTPConnection.connect(self)
+
+        kwargs = {}  # type: Dict[str, Any]
+        if self.session is not None and hasattr(ssl, "SSLSession"):
+            kwargs["session"] = self.session
+
+        start = time.monotonic()
+        tunnel_host = getattr(self, "_tunnel_host", None)
+        self.sock = self._ssl_context.wrap_socket(
+            self.sock, server_hostname=tunnel_host or self.host, **kwargs
+        )
+        self.phases["tls"] = time.monotonic() - start
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of persistent connections to a single host.
+
+    At most `maxsize` idle connections are kept around.  Connections
+    that are released while the pool is full are closed.  The most
+    recent TLS session is remembered and offered by new connections.
+    """
+
+    def __init__(
+            self,
+            scheme: str,
+            host: str,
+            port: int,
+            maxsize: int = 4,
+            context: Optional[ssl.SSLContext] = None,
+    ) -> None:
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self._maxsize = maxsize
+        self._context = context
+        self._idle = []  # type: List[http.client.HTTPConnection]
+        self._lock = threading.Lock()
+        self._proxy = self._get_proxy()
+        self._session = None  # type: Optional[ssl.SSLSession]
+
+    def connect(self) -> http.client.HTTPConnection:
+        """
+        Create a new connection.
+        """
+        host, port = self._proxy or (self.host, self.port)
+        if self.scheme == "https":
+            conn = HTTPSConnection(
+                host,
+                port,
+                self._context or ssl.create_default_context(),
+                self._session,
+            )  # type: http.client.HTTPConnection
+            if self._proxy:
+                conn.set_tunnel(self.host, self.port)
+        else:
+            conn = HTTPConnection(host, port)
+        return conn
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        Retrieve an idle connection or create a new one.
+
+        The second member of the returned tuple is True if the
+        connection has been used before.
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self.connect(), False
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        """
+        Return a connection to the pool.
+        """
+        # TLS 1.3 session tickets are sent after the handshake, so the
+        # session is picked up once a response has been read.
+        session = getattr(conn.sock, "session", None)
+        with self._lock:
+            if session is not None:
+                self._session = session
+            if len(self._idle) < self._maxsize:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def target(self, path: str) -> str:
+        """
+        Retrieve the request target for `path`.
+
+        Plain HTTP requests that are sent through a proxy must use the
+        absolute form of the URL.
+        """
+        if self._proxy and self.scheme == "http":
+            return "http://{}:{}{}".format(self.host, self.port, path)
+        return path
+
+    def _get_proxy(self) -> Optional[Tuple[str, int]]:
+        """
+        Retrieve the proxy to use for this host, if any.
+        """
+        proxy = urllib.request.getproxies().get(self.scheme)
+        if not proxy or urllib.request.proxy_bypass(self.host):
+            return None
+        if "://" not in proxy:
+            proxy = "http://{}".format(proxy)
+        url = urllib.parse.urlsplit(proxy)
+        return url.hostname or "", url.port or 80
+
+
+class BaseWWW:
+    """
+    Request preparation and response decoding shared by the clients.
+
+    The parameters of GET requests are sent in the query string and
+    those of other requests in a JSON body.  Responses may be compressed
+    with any of the codings in `ACCEPT_ENCODING`.  JSON request bodies
+    of at least `compress_min` bytes are compressed with gzip, which the
+    server has to support.
+    """
+
     def __init__(
             self,
             url: str,
             token: Optional[str] = None,
             cafile: Optional[str] = None,
+            compress_min: Optional[int] = None,
     ) -> None:
         self._url = url
         self._token = token
-        self._cafile = cafile
+        self._compress_min = compress_min
+        try:
+            self._context = ssl.create_default_context(cafile=cafile)
+        except (OSError, ValueError) as e:
+            raise WWWError(e)
+
+    def _prepare(
+            self,
+            path: str,
+            method: str,
+            kwargs: Dict[str, Any],
+    ) -> Tuple[urllib.parse.SplitResult, Optional[bytes], Dict[str, str]]:
+        """
+        Prepare the URL, body and headers of a request.
+        """
+        data = None
+        headers = {"accept": ACCEPT, "accept-encoding": ACCEPT_ENCODING}
+
+        if self._token:
+            headers["authorization"] = "bearer {}".format(self._token)
+
+        if method == "GET":
+            query = self._query(kwargs)
+            if query:
+                path = "{}?{}".format(path, query)
+        elif kwargs:
+            data = json.dumps(kwargs).encode("utf-8")
+            headers["content-type"] = "application/json"
+            if self._compress_min is not None and \
+                    len(data) >= self._compress_min:
+                data = compress(data)
+                headers["content-encoding"] = "gzip"
+
+        url = urllib.parse.urlsplit("{}/{}".format(self._url, path))
+        return url, data, headers
+
+    @staticmethod
+    def _query(kwargs: Dict[str, Any]) -> str:
+        """
+        Encode parameters as a query string.
+
+        Parameters that are None are left out, booleans are sent as
+        "true" and "false" and lists as repeated parameters.
+        """
+        params = []
+        for key, value in sorted(kwargs.items()):
+            values = value if isinstance(value, (list, tuple)) else [value]
+            for v in values:
+                if isinstance(v, bool):
+                    v = "true" if v else "false"
+                if v is not None:
+                    params.append((key, v))
+        return urllib.parse.urlencode(params)
+
+    @staticmethod
+    def _address(url: urllib.parse.SplitResult) -> Tuple[str, str, int]:
+        """
+        Retrieve the scheme, host and port of `url`.
+        """
+        ports = {"http": 80, "https": 443}
+        if url.scheme not in ports or not url.hostname:
+            raise ValueError("invalid url: {}".format(url.geturl()))
+        return url.scheme, url.hostname, url.port or ports[url.scheme]
+
+    @staticmethod
+    def _target(url: urllib.parse.SplitResult) -> str:
+        """
+        Retrieve the origin-form request target of `url`.
+        """
+        return urllib.parse.urlunsplit(("", "") + url[2:]) or "/"
+
+    @staticmethod
+    def _decode(
+            raw: Union[bytes, memoryview],
+            content_type: str = "",
+    ) -> Dict:
+        """
+        Decode a response body according to its content type.
+
+        Bodies that are neither msgpack nor CBOR are decoded as JSON.
+        """
+        decoder = DECODERS.get(media_type(content_type))
+        if decoder:
+            return decoder(raw)  # type: ignore
+
+        try:
+            return json_loads(raw)  # type: ignore
+        except ValueError:
+            # This is ugly, but Flask-HTTPAuth is not RESTful.  Assume
+            # that all non-json payloads are error messages to be
+            # wrapped in "message".
+            return {"message": bytes(raw).decode("utf-8")}
+
+    @staticmethod
+    def _error(status: int, body: Any) -> WWWError:
+        """
+        Create the error for a failed response from the "message" of
+        its body, or from its status if the body has no message.
+        """
+        message = body.get("message") if isinstance(body, dict) else None
+        if not message or not isinstance(message, str):
+            return WWWError("HTTP {}".format(status))
+        return WWWError(message)
+
+
+class WWW(BaseWWW):
+    """
+    A HTTP(S) client for the pklookup API.
+
+    `connect_timeout` and `read_timeout` bound every connection attempt
+    and every read from the socket.  If `deadline` is given, every
+    request made by the instance must finish within that many seconds
+    from its creation; requests issued after the deadline fail
+    immediately.
+
+    Every callable in `hooks` is called with a `Timing` once a request
+    has finished or failed, including requests that are retried.  Hooks
+    may be called from several threads at once.
+
+    Requests with a method in `retry_methods` are retried up to
+    `retries` times on connection errors and on 429, 502, 503 and 504
+    responses.  The delay before each retry is drawn uniformly from
+    [0, `backoff` * 2^attempt], capped at `backoff_max`, unless the
+    server asks for a specific delay with Retry-After.
+
+    If `hedge_delay` is given, a GET request that has not received a
+    response after the 95th percentile of recent response times (or
+    `hedge_delay` until enough responses have been seen) is sent once
+    more, and the first response wins.
+
+    If `rate_limit` is given, at most that many requests per second are
+    sent on average, in bursts of up to `rate_burst` requests.  If
+    `max_concurrency` is given, the number of requests in flight adapts
+    between one and `max_concurrency`, starting at `pool_size`; it
+    shrinks when the server responds with 429 or 503 or slows down.
+    Both limits are shared by all requests made by the instance.
+
+    If `cache_dir` is given, GET responses with an ETag or Last-Modified
+    header are cached there and revalidated by later requests; when the
+    server responds with 304, the cached response is served.
+    """
+
+    def __init__(
+            self,
+            url: str,
+            token: Optional[str] = None,
+            cafile: Optional[str] = None,
+            pool_size: int = 4,
+            connect_timeout: Optional[float] = None,
+            read_timeout: Optional[float] = None,
+            deadline: Optional[float] = None,
+            retries: int = 0,
+            backoff: float = 0.5,
+            backoff_max: float = 30,
+            retry_methods: Iterable[str] = ("GET", "DELETE"),
+            hedge_delay: Optional[float] = None,
+            rate_limit: Optional[float] = None,
+            rate_burst: Optional[int] = None,
+            max_concurrency: Optional[int] = None,
+            hooks: Iterable[Callable[[Timing], None]] = (),
+            compress_min: Optional[int] = None,
+            cache_dir: Optional[str] = None,
+    ) -> None:
+        super().__init__(url, token, cafile, compress_min)
+        self._cache = None  # type: Optional[ResponseCache]
+        if cache_dir:
+            self._cache = ResponseCache(cache_dir)
+        self._pool_size = pool_size
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._deadline = None  # type: Optional[float]
+        if deadline is not None:
+            self._deadline = time.monotonic() + deadline
+        self._retries = retries
+        self._backoff = backoff
+        self._backoff_max = backoff_max
+        self._retry_methods = {m.upper() for m in retry_methods}
+        self._hedge_delay = hedge_delay
+        self._hedger = None  # type: Optional[concurrent.futures.Executor]
+        self._latencies = collections.deque(maxlen=100)  # type: Deque[float]
+        self._rate_limiter = None  # type: Optional[RateLimiter]
+        if rate_limit:
+            self._rate_limiter = RateLimiter(rate_limit, rate_burst)
+        self._concurrency = None  # type: Optional[ConcurrencyLimiter]
+        if max_concurrency:
+            self._concurrency = ConcurrencyLimiter(
+                initial=pool_size, maximum=max_concurrency
+            )
+        self.hooks = list(hooks)
+        self._local = threading.local()
+        self._pools = {}  # type: Dict[Tuple[str, str, int], ConnectionPool]
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "WWW":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close all pooled connections.
+        """
+        with self._lock:
+            pools, self._pools = self._pools, {}
+            executor, self._hedger = self._hedger, None
+        for pool in pools.values():
+            pool.close()
+        if executor:
+            executor.shutdown(wait=False)
 
     def get(self, path: str = "/", **kwargs: Any) -> Dict:
         """
@@ -39,44 +771,728 @@ class WWW:
         """
         return self._send(path, "POST", **kwargs)
 
+    def batch(
+            self,
+            requests: Iterable[Request],
+            workers: Optional[int] = None,
+    ) -> List[Union[Dict, WWWError]]:
+        """
+        Send many requests concurrently.
+
+        Each request is a (method, path, kwargs) tuple.  The requests
+        are sent by at most `workers` threads (the pool size by
+        default) over the pooled connections.  The results are returned
+        in the order of `requests`, with a WWWError in place of every
+        request that failed.
+        """
+        workers = workers or self._pool_size
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            return list(executor.map(self._batch_send, requests))
+
+    def paginate(
+            self,
+            path: str,
+            key: str,
+            page_size: int = 0,
+            limit: Optional[int] = None,
+            prefetch: int = 2,
+            **kwargs: Any,
+    ) -> Generator[Any, None, None]:
+        """
+        Iterate over the array `key` of a collection, page by page.
+
+        Pages are requested with `offset` and `limit` parameters.  If
+        the server returns a `next` cursor, subsequent pages are instead
+        requested with `cursor`.  Up to `prefetch` pages are fetched
+        concurrently while the current page is being consumed, and no
+        more pages are requested once `limit` records have been
+        yielded.
+
+        A server that ignores the paging parameters is detected when it
+        returns more than `page_size` records or the same page twice.
+        If `page_size` is 0, the collection is streamed in a single
+        request.
+        """
+        if not page_size:
+            stream = self.stream(path, key, **kwargs)
+            yield from itertools.islice(stream, limit)
+            return
+
+        workers = max(prefetch, 1)
+        executor = concurrent.futures.ThreadPoolExecutor(workers)
+        pending = collections.deque()  # type: collections.deque
+        pages = 0
+        count = 0
+        first = None
+
+        def fetch(**params: Any) -> None:
+            nonlocal pages
+            params = dict(kwargs, limit=page_size, **params)
+            future = executor.submit(self.get, path, **params)
+            pending.append((pages, future))
+            pages += 1
+
+        try:
+            fetch(offset=0)
+            while pending:
+                index, future = pending.popleft()
+                page = future.result()
+                records = page[key]
+                if not isinstance(records, list):
+                    raise TypeError("expected an array")
+
+                cursor = page.get("next")
+                if cursor:
+                    done = False
+                elif len(records) > page_size or (
+                        index and records and records[0] == first
+                ):
+                    # The server does not support paging.
+                    records = records if index == 0 else []
+                    done = True
+                else:
+                    done = len(records) < page_size
+
+                if index == 0 and records:
+                    first = records[0]
+
+                wanted = limit is None or count + len(records) < limit
+                if not done and wanted:
+                    if cursor:
+                        if not pending:
+                            fetch(cursor=cursor)
+                    else:
+                        while len(pending) < workers:
+                            fetch(offset=pages * page_size)
+
+                for record in records:
+                    if limit is not None and count >= limit:
+                        return
+                    count += 1
+                    yield record
+                if done:
+                    return
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _batch_send(self, request: Request) -> Union[Dict, WWWError]:
+        """
+        Send a single request on behalf of `batch()`.
+        """
+        method, path, kwargs = request
+        try:
+            if method.upper() not in ("GET", "POST", "DELETE"):
+                raise WWWError("unsupported method: {}".format(method))
+            send = getattr(self, method.lower())
+            return send(path, **kwargs)  # type: ignore
+        except WWWError as e:
+            return e
+
     def _send(self, path: str, method: str, **kwargs: Any) -> Dict:
         """
         Send a HTTP(S) request.
         """
-        data = None
-        headers = {}
+        key = self._cache_key("get", path, kwargs) if method == "GET" else None
+        cached = None  # type: Optional[Tuple[Dict[str, Any], BinaryIO]]
+        if self._cache is not None and key is not None:
+            cached = self._cache.open(key)
+        conditions = ResponseCache.conditions(cached[0]) if cached else {}
 
-        if self._token:
-            headers["authorization"] = "bearer {}".format(self._token)
+        try:
+            pool, conn, res, timing = self._open(
+                path, method, kwargs, conditions
+            )
+            try:
+                if cached is not None and res.status == 304:
+                    # Only the body of the cached entry is decoded.
+                    timing.received = len(res.read())
+                    meta, f = cached
+                    body = self._decode_body(
+                        f.read(),
+                        self._coding(meta["content_encoding"]),
+                        meta["content_type"],
+                        timing,
+                    )  # type: Dict
+                else:
+                    body = self._read(res, timing, key)
+            except BaseException as e:
+                conn.close()
+                timing.error = e
+                raise
+            finally:
+                self._emit(timing)
+        except ERRORS as e:
+            raise WWWError(e)
+        finally:
+            if cached is not None:
+                cached[1].close()
 
-        if kwargs:
-            data = json.dumps(kwargs).encode("utf-8")
-            headers["content-type"] = "application/json"
+        self._release(pool, conn, res)
 
-        req = urllib.request.Request(
-            "{}/{}".format(self._url, path),
-            data=data,
-            headers=headers,
-            method=method,
-        )
+        if res.status >= 400:
+            raise self._error(res.status, body)
+        return body
+
+    def stream(
+            self,
+            path: str,
+            key: str,
+            **kwargs: Any,
+    ) -> Generator[Any, None, None]:
+        """
+        Send a GET request and iterate over the array `key` in the
+        response.
+
+        JSON and msgpack responses are decoded incrementally and each
+        member of the array is yielded as soon as it has been read.
+        Raises KeyError if `key` is missing and TypeError if the
+        response is not an object with an array `key`.
+        """
+        cache_key = self._cache_key("stream", path, kwargs)
+        cached = None  # type: Optional[Tuple[Dict[str, Any], BinaryIO]]
+        if self._cache is not None and cache_key is not None:
+            cached = self._cache.open(cache_key)
+        try:
+            yield from self._stream(path, key, kwargs, cache_key, cached)
+        finally:
+            if cached is not None:
+                cached[1].close()
+
+    def _stream(
+            self,
+            path: str,
+            key: str,
+            kwargs: Dict[str, Any],
+            cache_key: Optional[str],
+            cached: Optional[Tuple[Dict[str, Any], BinaryIO]],
+    ) -> Generator[Any, None, None]:
+        """
+        Stream a response on behalf of `stream()`, revalidating the
+        cached entry `cached` if there is one.
+        """
+        conditions = ResponseCache.conditions(cached[0]) if cached else {}
         try:
-            with urllib.request.urlopen(req, cafile=self._cafile) as res:
-                return self._json_decode(res)
-        except urllib.error.HTTPError as e:
-            raise WWWError(self._json_decode(e)["message"])
-        except (ssl.CertificateError, urllib.error.URLError) as e:
+            pool, conn, res, timing = self._open(
+                path, "GET", kwargs, conditions
+            )
+        except ERRORS as e:
             raise WWWError(e)
 
+        content_type = res.getheader("content-type", "")
+        encoding = self._content_encoding(res)
+        # The body is read from `source`, which is the raw body of the
+        # cached entry if the response is 304.
+        source = res  # type: Any
+        meta = {}  # type: Dict[str, Any]
+        hit = cached is not None and res.status == 304
+        if cached is not None and hit:
+            meta, source = cached
+            content_type = meta["content_type"]
+            encoding = self._coding(meta["content_encoding"])
+
+        # Wire bytes are counted by the outermost reader.
+        reader = source  # type: Any
+        parser = JSONStream(source)  # type: Union[JSONStream, MsgpackStream]
+        counter = parser  # type: Any
+        writer = None  # type: Optional[CacheWriter]
+        try:
+            timing.phases["body"] = 0.0
+            start = time.monotonic()
+            kind = media_type(content_type)
+            if hit:
+                timing.received = len(res.read())
+            if res.status >= 400:
+                raise self._error(res.status, self._read(res, timing))
+            elif kind in DECODERS and kind != MSGPACK:
+                # Formats without a streaming decoder are decoded in
+                # one go.
+                if hit:
+                    body = self._decode_body(
+                        source.read(), encoding, content_type, timing
+                    )
+                else:
+                    body = self._read(res, timing, cache_key)
+                members = iterate_member(body, key)
+            else:
+                if self._cache is not None and cache_key is not None and \
+                        res.status == 200:
+                    writer = self._cache.writer(cache_key, res, res)
+                    if writer is not None:
+                        reader = source = writer
+                if encoding:
+                    reader = counter = DecompressingReader(source, encoding)
+                if kind == MSGPACK:
+                    parser = MsgpackStream(reader)
+                else:
+                    parser = JSONStream(reader)
+                if not encoding:
+                    counter = parser
+                members = parser.iterate(key)
+
+            # Only the time spent reading and decoding is recorded, not
+            # the time that the caller spends between members.
+            for obj in members:
+                timing.phases["body"] += time.monotonic() - start
+                yield obj
+                start = time.monotonic()
+            while True:
+                data = reader.read(CHUNK_SIZE)
+                if counter is parser:
+                    parser.received += len(data)
+                if not data:
+                    break
+            timing.phases["body"] += time.monotonic() - start
+            if writer is not None:
+                writer.commit()
+        except BaseException as e:
+            # Includes GeneratorExit if the caller stops early, in which
+            # case the rest of the response is left unread.
+            if writer is not None:
+                writer.abort()
+            conn.close()
+            if not isinstance(e, (GeneratorExit, WWWError)):
+                timing.error = e
+            if isinstance(e, ERRORS):
+                raise WWWError(e)
+            raise
+        finally:
+            # Bytes read from the cache were not received.
+            if not hit:
+                timing.received += counter.received
+            self._emit(timing)
+
+        self._release(pool, conn, res)
+
+    def _read(
+            self,
+            res: http.client.HTTPResponse,
+            timing: Timing,
+            cache_key: Optional[str] = None,
+    ) -> Dict:
+        """
+        Read and decode a response body.
+
+        If `cache_key` is given, the body of a 200 response is cached as
+        it was received, once it has been decoded.
+        """
+        start = time.monotonic()
+        data = self._read_body(res)
+        timing.phases["body"] = time.monotonic() - start
+        timing.received = len(data)
+
+        body = self._decode_body(
+            data,
+            self._content_encoding(res),
+            res.getheader("content-type", ""),
+            timing,
+        )
+        if self._cache is not None and cache_key is not None and \
+                res.status == 200:
+            self._cache.store(cache_key, res, data)
+        return body
+
+    def _decode_body(
+            self,
+            data: Union[bytes, memoryview],
+            encoding: Optional[str],
+            content_type: str,
+            timing: Timing,
+    ) -> Dict:
+        """
+        Decompress and decode a response body.
+        """
+        if encoding:
+            start = time.monotonic()
+            data = decompress(data, encoding)
+            timing.phases["decompress"] = time.monotonic() - start
+
+        start = time.monotonic()
+        body = self._decode(data, content_type)
+        timing.phases["decode"] = time.monotonic() - start
+        return body
+
+    @classmethod
+    def _content_encoding(
+            cls,
+            res: http.client.HTTPResponse,
+    ) -> Optional[str]:
+        """
+        Retrieve the content coding of a response, if any.
+        """
+        return cls._coding(res.getheader("content-encoding", ""))
+
     @staticmethod
-    def _json_decode(res: Union[http.client.HTTPResponse, BinaryIO]) -> Dict:
+    def _coding(value: str) -> Optional[str]:
         """
-        Decode a JSON response.
+        Normalize a content-encoding header value, or return None for
+        the identity coding.
         """
-        data = res.read().decode("utf-8")
+        encoding = value.strip().lower()
+        if encoding in ("", "identity"):
+            return None
+        return encoding
+
+    def _cache_key(
+            self,
+            kind: str,
+            path: str,
+            kwargs: Dict[str, Any],
+    ) -> Optional[str]:
+        """
+        Retrieve the cache key of a GET request, or None without a
+        cache.  `kind` separates decoded from streamed entries.
+        """
+        if self._cache is None:
+            return None
+        return self._cache.key(
+            kind,
+            "{}/{}".format(self._url, path),
+            json.dumps(kwargs, sort_keys=True),
+            self._token or "",
+        )
+
+    def _read_body(
+            self,
+            res: http.client.HTTPResponse,
+    ) -> Union[bytes, memoryview]:
+        """
+        Read a response body.
+
+        Bodies with a known length are read with `readinto()` into a
+        buffer that is reused by later requests from the same thread,
+        which saves an allocation and a copy per response.  The returned
+        memoryview is only valid until the next request.
+        """
+        length = getattr(res, "length", None)
+        if not length:
+            return res.read()
+
+        buf = getattr(self._local, "buffer", None)  # type: Optional[bytearray]
+        if buf is None or len(buf) < length:
+            buf = bytearray(length)
+            if length <= MAX_BUFFER_SIZE:
+                self._local.buffer = buf
+
+        view = memoryview(buf)[:length]
+        pos = 0
+        while pos < length:
+            n = res.readinto(view[pos:])
+            if not n:
+                raise http.client.IncompleteRead(
+                    bytes(view[:pos]), length - pos
+                )
+            pos += n
+        return view
+
+    def _emit(self, timing: Timing) -> None:
+        """
+        Pass the timing of a finished request to the hooks.
+        """
+        for hook in self.hooks:
+            hook(timing)
+
+    def _open(
+            self,
+            path: str,
+            method: str,
+            kwargs: Dict[str, Any],
+            conditions: Optional[Dict[str, str]] = None,
+    ) -> Tuple[ConnectionPool, Connection, http.client.HTTPResponse, Timing]:
+        """
+        Send a request and wait for the response headers.
+
+        `conditions` are added to the headers of conditional requests.
+        Failed attempts are retried according to the retry policy.
+        """
+        url, data, headers = self._prepare(path, method, kwargs)
+        headers.update(conditions or {})
+        pool = self._get_pool(url)
+        target = pool.target(self._target(url))
+        retry = method in self._retry_methods
+
+        for attempt in itertools.count():
+            try:
+                conn, res, timing = self._hedge(
+                    pool, method, target, data, headers
+                )
+            except RETRY_ERRORS:
+                if retry and self._sleep(attempt):
+                    continue
+                raise
+
+            if res.status == 415 and "content-encoding" in headers:
+                # The server does not accept compressed bodies; send
+                # this and any later requests uncompressed.
+                self._compress_min = None
+                url, data, headers = self._prepare(path, method, kwargs)
+                headers.update(conditions or {})
+                try:
+                    timing.received = len(res.read())
+                finally:
+                    self._release(pool, conn, res)
+                    self._emit(timing)
+                continue
+
+            if res.status in RETRY_STATUSES and retry and \
+                    self._sleep(attempt, res.getheader("retry-after")):
+                try:
+                    timing.received = len(res.read())
+                finally:
+                    self._release(pool, conn, res)
+                    self._emit(timing)
+                continue
+            return pool, conn, res, timing
+        raise AssertionError("unreachable")
+
+    def _sleep(self, attempt: int, retry_after: Optional[str] = None) -> bool:
+        """
+        Sleep before retrying a failed attempt.
+
+        Returns False without sleeping if there are no retries left or
+        if the retry would not start before the deadline.
+        """
+        if attempt >= self._retries:
+            return False
+
+        delay = random.uniform(
+            0, min(self._backoff * 2**attempt, self._backoff_max)
+        )
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    date = email.utils.parsedate_to_datetime(retry_after)
+                    delay = date.timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+            delay = min(max(delay, 0), self._backoff_max)
+
+        if self._deadline is not None and \
+                time.monotonic() + delay >= self._deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+    def _hedge(
+            self,
+            pool: ConnectionPool,
+            method: str,
+            target: str,
+            data: Optional[bytes],
+            headers: Dict[str, str],
+    ) -> Tuple[Connection, http.client.HTTPResponse, Timing]:
+        """
+        Send a request, and hedge slow GET requests with a second one.
+
+        The connection of the losing request is closed once it has
+        received its response.
+        """
+        args = (pool, method, target, data, headers)
+        if method != "GET" or self._hedge_delay is None:
+            return self._request(*args)
+
+        with self._lock:
+            latencies = sorted(self._latencies)
+            if self._hedger is None:
+                self._hedger = concurrent.futures.ThreadPoolExecutor(
+                    self._pool_size * 2
+                )
+            executor = self._hedger
+
+        delay = self._hedge_delay
+        if len(latencies) >= 20:
+            delay = latencies[int(len(latencies) * 0.95)]
+
+        futures = [executor.submit(self._request, *args)]
+        done, _ = concurrent.futures.wait(futures, timeout=delay)
+        if not done:
+            futures.append(executor.submit(self._request, *args))
+
+        while True:
+            done, _ = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    futures.remove(future)
+                    for loser in futures:
+                        loser.add_done_callback(self._close_loser)
+                    return future.result()
+                if len(futures) == 1:
+                    return future.result()
+                futures.remove(future)
+
+    @staticmethod
+    def _close_loser(future: concurrent.futures.Future) -> None:
+        """
+        Close the connection of a hedged request that lost.
+        """
+        if future.exception() is None:
+            conn, _res, _timing = future.result()
+            conn.close()
+
+    def _remaining(self) -> Optional[float]:
+        """
+        Retrieve the number of seconds until the deadline.
+        """
+        if self._deadline is None:
+            return None
+
+        remaining = self._deadline - time.monotonic()
+        if remaining <= 0:
+            raise WWWError("deadline exceeded")
+        return remaining
+
+    def _timeouts(self) -> Tuple[Optional[float], Optional[float]]:
+        """
+        Retrieve the connect and read timeouts for a new request.
+
+        Both are capped by the time that remains until the deadline.
+        """
+        remaining = self._remaining()
+        if remaining is None:
+            return self._connect_timeout, self._read_timeout
+        return (
+            min(self._connect_timeout or remaining, remaining),
+            min(self._read_timeout or remaining, remaining),
+        )
+
+    @staticmethod
+    def _release(
+            pool: ConnectionPool,
+            conn: http.client.HTTPConnection,
+            res: http.client.HTTPResponse,
+    ) -> None:
+        """
+        Return a connection with a fully read response to its pool.
+        """
+        if res.will_close:
+            conn.close()
+        else:
+            pool.release(conn)
+
+    def _get_pool(self, url: urllib.parse.SplitResult) -> ConnectionPool:
+        """
+        Retrieve the connection pool for the host in `url`.
+        """
+        key = self._address(url)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(*key, self._pool_size, self._context)
+                self._pools[key] = pool
+        return pool
+
+    def _request(
+            self,
+            pool: ConnectionPool,
+            method: str,
+            target: str,
+            data: Optional[bytes],
+            headers: Dict[str, str],
+    ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse, Timing]:
+        """
+        Send a request within the rate and concurrency limits.
+
+        A concurrency slot is held until the response headers arrive.
+        Hooks are called right away if the request fails.
+        """
+        timing = Timing(method, target)
         try:
-            return json.loads(data)  # type: ignore
-        except json.JSONDecodeError:
-            # This is ugly, but Flask-HTTPAuth is not RESTful.  Assume
-            # that all non-json payloads are error messages to be
-            # wrapped in "message".
-            return {"message": data}
+            return self._limit(pool, method, target, data, headers, timing)
+        except Exception as e:
+            timing.error = e
+            self._emit(timing)
+            raise
+
+    def _limit(
+            self,
+            pool: ConnectionPool,
+            method: str,
+            target: str,
+            data: Optional[bytes],
+            headers: Dict[str, str],
+            timing: Timing,
+    ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse, Timing]:
+        """
+        Wait for the rate and concurrency limits and send a request.
+        """
+        args = (pool, method, target, data, headers, timing)
+        limiter = self._rate_limiter
+        concurrency = self._concurrency
+        if limiter is None and concurrency is None:
+            return self._exchange(*args)
+
+        start = time.monotonic()
+        if limiter and not limiter.acquire(self._remaining()):
+            raise WWWError("deadline exceeded")
+        if concurrency is None:
+            timing.phases["queue"] = time.monotonic() - start
+            return self._exchange(*args)
+        if not concurrency.acquire(self._remaining()):
+            raise WWWError("deadline exceeded")
+        timing.phases["queue"] = time.monotonic() - start
+
+        start = time.monotonic()
+        overloaded = True
+        try:
+            conn, res, timing = self._exchange(*args)
+            overloaded = res.status in (429, 503)
+            return conn, res, timing
+        finally:
+            concurrency.release(time.monotonic() - start, overloaded)
+
+    def _exchange(
+            self,
+            pool: ConnectionPool,
+            method: str,
+            target: str,
+            data: Optional[bytes],
+            headers: Dict[str, str],
+            timing: Timing,
+    ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse, Timing]:
+        """
+        Send a request on a pooled connection.
+
+        Idle connections may have been closed by the server; these are
+        replaced by a fresh connection.  The request is sent again only
+        if it could not be written, or if its method is in
+        `retry_methods`, since the server may already have acted on it.
+        """
+        connect_timeout, read_timeout = self._timeouts()
+        conn, reused = pool.acquire()
+        replay = method in self._retry_methods
+        while True:
+            sent = False
+            try:
+                conn.timeout = connect_timeout
+                if conn.sock is None:
+                    conn.connect()
+                    timing.phases.update(getattr(conn, "phases", {}))
+                conn.sock.settimeout(read_timeout)
+                start = time.monotonic()
+                conn.request(method, target, body=data, headers=headers)
+                sent = True
+                res = conn.getresponse()
+                if self._deadline is not None and \
+                        isinstance(res, HTTPResponse):
+                    res.read_timeout = lambda: self._timeouts()[1]
+                latency = time.monotonic() - start
+                timing.phases["ttfb"] = latency
+                timing.sent = len(data or b"")
+                timing.status = res.status
+                if method == "GET":
+                    with self._lock:
+                        self._latencies.append(latency)
+                return conn, res, timing
+            except STALE_ERRORS:
+                conn.close()
+                if not reused or (sent and not replay):
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+            conn, reused = pool.connect(), False
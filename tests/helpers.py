@@ -1,24 +1,103 @@
-from typing import Any, Optional
+import copy
+from typing import Any, Dict, List, Optional, Union
 
 
-class ContextManagerMock:
-    def __enter__(self) -> "ContextManagerMock":
-        return self
-
-    def __exit__(self, *args: Any, **kwargs: Any) -> None:
-        return
-
-
-class URLOpenMock(ContextManagerMock):
+class HTTPResponseMock:
     def __init__(
             self,
             data: bytes = b"",
+            status: int = 200,
+            headers: Optional[Dict[str, str]] = None,
             exception: Optional[Exception] = None,
     ) -> None:
+        self.status = status
+        self.reason = ""
+        self.will_close = False
         self._data = data
+        self._headers = {k.lower(): v for k, v in (headers or {}).items()}
         self._exception = exception
 
     def read(self, amt: Optional[int] = None) -> bytes:
         if self._exception:
             raise self._exception
-        return self._data[:amt or len(self._data)]
+        if amt is None:
+            amt = len(self._data)
+        data, self._data = self._data[:amt], self._data[amt:]
+        return data
+
+    def getheader(self, name: str, default: Any = None) -> Any:
+        return self._headers.get(name.lower(), default)
+
+    def close(self) -> None:
+        return
+
+
+class SocketMock:
+    def __init__(self) -> None:
+        self.timeout = None  # type: Optional[float]
+
+    def settimeout(self, timeout: Optional[float]) -> None:
+        self.timeout = timeout
+
+
+class HTTPConnectionMock:
+    """
+    Stand-in for `http.client.HTTPConnection`.
+
+    Each request pops the next response from `responses`, and the last
+    one is repeated.  Exceptions in `responses` are raised by
+    `getresponse()`.
+    """
+
+    def __init__(self, *responses: Union[HTTPResponseMock, Exception]) -> None:
+        self.responses = list(responses) or [HTTPResponseMock()]
+        self.requests = []  # type: List[Dict[str, Any]]
+        self.closed = False
+        self.sock = None  # type: Any
+        self.timeout = None  # type: Optional[float]
+
+    @property
+    def method(self) -> str:
+        return str(self.requests[-1]["method"])
+
+    @property
+    def url(self) -> str:
+        return str(self.requests[-1]["url"])
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return dict(self.requests[-1]["headers"])
+
+    @property
+    def body(self) -> Optional[bytes]:
+        return self.requests[-1]["body"]  # type: ignore
+
+    def connect(self) -> None:
+        self.sock = SocketMock()
+
+    def request(
+            self,
+            method: str,
+            url: str,
+            body: Optional[bytes] = None,
+            headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.requests.append({
+            "method": method,
+            "url": url,
+            "body": body,
+            "headers": headers or {},
+        })
+
+    def getresponse(self) -> HTTPResponseMock:
+        if len(self.responses) > 1:
+            res = self.responses.pop(0)
+        else:
+            res = copy.copy(self.responses[0])
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    def close(self) -> None:
+        self.closed = True
+        self.sock = None
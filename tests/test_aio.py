@@ -0,0 +1,275 @@
+import asyncio
+import gzip
+import json
+import time
+from typing import Any, Callable, List, Optional
+from unittest import TestCase
+from unittest.mock import patch
+
+from pklookup import aio, www
+
+# Returns the response to a request, b"" to close the connection, or
+# None to never answer.
+Handler = Callable[[bytes], Optional[bytes]]
+
+
+def response(
+        body: bytes = b"{}",
+        status: int = 200,
+        headers: str = "",
+) -> bytes:
+    return "HTTP/1.1 {} X\r\ncontent-length: {}\r\n{}\r\n".format(
+        status, len(body), headers
+    ).encode("latin-1") + body
+
+
+class AsyncWWWTest(TestCase):
+    def setUp(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.requests = []  # type: List[bytes]
+        self.connections = 0
+        self.handler = lambda req: response()  # type: Handler
+        self.close_after = 0
+        self.tasks = []  # type: List[asyncio.Task]
+
+        def serve(
+                reader: asyncio.StreamReader,
+                writer: asyncio.StreamWriter,
+        ) -> None:
+            self.tasks.append(self.loop.create_task(
+                self._serve(reader, writer)
+            ))
+
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(serve, "127.0.0.1", 0)
+        )
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = "http://127.0.0.1:{}/api".format(port)
+
+    def tearDown(self) -> None:
+        self.server.close()
+        for task in self.tasks:
+            task.cancel()
+        if self.tasks:
+            self.loop.run_until_complete(
+                asyncio.gather(*self.tasks, return_exceptions=True)
+            )
+        self.loop.close()
+
+    async def _serve(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+    ) -> None:
+        self.connections += 1
+        served = 0
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                req = head + await reader.readexactly(length)
+                self.requests.append(req)
+                res = self.handler(req)
+                if res is None:
+                    await asyncio.sleep(60)
+                if not res:
+                    break
+                writer.write(res)
+                await writer.drain()
+                served += 1
+                if served == self.close_after:
+                    break
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+
+    def run_coro(self, coro: Any) -> Any:
+        return self.loop.run_until_complete(coro)
+
+    def test_get(self) -> None:
+        self.handler = lambda req: response(b'{"servers": []}')
+
+        res = self.run_coro(aio.AsyncWWW(self.url, token="abc").get("server"))
+
+        self.assertEqual(res, {"servers": []})
+        req = self.requests[0]
+        self.assertTrue(req.startswith(b"GET /api/server HTTP/1.1\r\n"))
+        self.assertTrue(b"authorization: bearer abc\r\n" in req)
+
+    def test_post_data(self) -> None:
+        self.run_coro(aio.AsyncWWW(self.url).post("token", role="admin"))
+
+        head, body = self.requests[0].split(b"\r\n\r\n", 1)
+        self.assertTrue(head.startswith(b"POST /api/token HTTP/1.1\r\n"))
+        self.assertTrue(b"content-type: application/json" in head)
+        self.assertEqual(json.loads(body.decode("utf-8")), {"role": "admin"})
+
+    def test_delete(self) -> None:
+        self.run_coro(aio.AsyncWWW(self.url).delete("server", id=1))
+
+        self.assertTrue(self.requests[0].startswith(b"DELETE /api/server"))
+
+    def test_chunked(self) -> None:
+        self.handler = lambda req: (
+            b"HTTP/1.1 200 OK\r\ntransfer-encoding: chunked\r\n\r\n"
+            b"3\r\n{\"a\r\n6;x=y\r\n\": 12}\r\n0\r\n\r\n"
+        )
+
+        res = self.run_coro(aio.AsyncWWW(self.url).get())
+
+        self.assertEqual(res, {"a": 12})
+
+    def test_gzip(self) -> None:
+        body = gzip.compress(b'{"a": 1}')
+        self.handler = lambda req: response(
+            body, headers="content-encoding: gzip\r\n"
+        )
+
+        res = self.run_coro(aio.AsyncWWW(self.url).get())
+
+        self.assertEqual(res, {"a": 1})
+        self.assertIn(b"accept-encoding: gzip", self.requests[0])
+
+    def test_corrupt_gzip(self) -> None:
+        self.handler = lambda req: response(
+            b"xyz", headers="content-encoding: gzip\r\n"
+        )
+
+        with self.assertRaises(www.WWWError):
+            self.run_coro(aio.AsyncWWW(self.url).get())
+
+    def test_http_error_message(self) -> None:
+        self.handler = lambda req: response(b'{"message": "xyz"}', 403)
+
+        with self.assertRaisesRegex(www.WWWError, "^xyz$"):
+            self.run_coro(aio.AsyncWWW(self.url).get())
+
+    def test_http_error_no_message(self) -> None:
+        self.handler = lambda req: response(b"Unauthorized Access", 401)
+
+        with self.assertRaisesRegex(www.WWWError, "^Unauthorized Access$"):
+            self.run_coro(aio.AsyncWWW(self.url).get())
+
+    def test_http_error_other_body(self) -> None:
+        self.handler = lambda req: response(b'{"detail": "xyz"}', 409)
+
+        with self.assertRaisesRegex(www.WWWError, "^HTTP 409$"):
+            self.run_coro(aio.AsyncWWW(self.url).get())
+
+    def test_bad_chunk_size(self) -> None:
+        self.handler = lambda req: (
+            b"HTTP/1.1 200 OK\r\ntransfer-encoding: chunked\r\n\r\n"
+            b"xyz\r\n"
+        )
+
+        with self.assertRaisesRegex(www.WWWError, "IncompleteRead"):
+            self.run_coro(aio.AsyncWWW(self.url).get())
+
+    def test_read_timeout(self) -> None:
+        self.handler = lambda req: None
+
+        start = time.monotonic()
+        with self.assertRaisesRegex(www.WWWError, "timed out"):
+            self.run_coro(aio.AsyncWWW(self.url, read_timeout=0.05).get())
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_connect_timeout(self) -> None:
+        async def never(*args: Any, **kwargs: Any) -> None:
+            await asyncio.sleep(60)
+
+        w = aio.AsyncWWW(self.url, connect_timeout=0.05)
+        with patch("asyncio.open_connection", never):
+            with self.assertRaisesRegex(www.WWWError, "timed out"):
+                self.run_coro(w.get())
+
+    def test_bad_status_line(self) -> None:
+        self.handler = lambda req: b"garbage\r\n\r\n"
+
+        with self.assertRaises(www.WWWError):
+            self.run_coro(aio.AsyncWWW(self.url).get())
+
+    def test_connection_refused(self) -> None:
+        self.server.close()
+        self.run_coro(self.server.wait_closed())
+
+        with self.assertRaises(www.WWWError):
+            self.run_coro(aio.AsyncWWW(self.url).get())
+
+    def test_reuse(self) -> None:
+        async def run() -> None:
+            async with aio.AsyncWWW(self.url) as w:
+                for _ in range(5):
+                    await w.get()
+
+        self.run_coro(run())
+
+        self.assertEqual(len(self.requests), 5)
+        self.assertEqual(self.connections, 1)
+
+    def test_connection_close(self) -> None:
+        self.handler = lambda req: response(headers="connection: close\r\n")
+
+        async def run() -> None:
+            w = aio.AsyncWWW(self.url)
+            await w.get()
+            await w.get()
+
+        self.run_coro(run())
+
+        self.assertEqual(self.connections, 2)
+
+    def test_stale(self) -> None:
+        self.close_after = 1
+
+        async def run() -> None:
+            w = aio.AsyncWWW(self.url)
+            await w.get()
+            await asyncio.sleep(0.01)
+            await w.get()
+
+        self.run_coro(run())
+
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.connections, 2)
+
+    def test_stale_post(self) -> None:
+        self.handler = lambda req: b"" if req.startswith(b"POST") else \
+            response()
+
+        async def run() -> None:
+            w = aio.AsyncWWW(self.url)
+            await w.get()
+            with self.assertRaises(www.WWWError):
+                await w.post()
+
+        self.run_coro(run())
+
+        methods = [req.split()[0] for req in self.requests]
+        self.assertEqual(methods, [b"GET", b"POST"])
+
+    def test_concurrent(self) -> None:
+        async def run() -> List[Any]:
+            w = aio.AsyncWWW(self.url, pool_size=8, limit=8)
+            res = await asyncio.gather(*[w.get(i=i) for i in range(200)])
+            w.close()
+            return list(res)
+
+        res = self.run_coro(run())
+
+        self.assertEqual(res, [{}] * 200)
+        self.assertLessEqual(self.connections, 8)
+
+    def test_burst(self) -> None:
+        async def run() -> None:
+            w = aio.AsyncWWW(self.url, limit=16)
+            for _ in range(3):
+                await asyncio.gather(*[w.get(i=i) for i in range(16)])
+            w.close()
+
+        self.run_coro(run())
+
+        self.assertEqual(len(self.requests), 48)
+        self.assertLessEqual(self.connections, 16)
@@ -0,0 +1,123 @@
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from pklookup.cache import ResponseCache
+
+from .helpers import HTTPResponseMock
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.tmp.name, "cache"))
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_key(self) -> None:
+        key = self.cache.key("get", "https://example.com/server", "token")
+        self.assertEqual(len(key), 64)
+        self.assertNotEqual(
+            key, self.cache.key("get", "https://example.com/server", "other")
+        )
+        self.assertNotEqual(
+            self.cache.key("ab", "c"), self.cache.key("a", "bc")
+        )
+
+    def test_store(self) -> None:
+        res = HTTPResponseMock(headers={
+            "etag": '"abc"',
+            "last-modified": "Sat, 17 Oct 2026 00:00:00 GMT",
+        })
+        self.cache.store("key", res, b'{"servers": [1, 2]}')  # type: ignore
+
+        entry = self.cache.open("key")
+        assert entry is not None
+        meta, f = entry
+        with f:
+            self.assertEqual(f.read(), b'{"servers": [1, 2]}')
+        self.assertEqual(self.cache.conditions(meta), {
+            "if-none-match": '"abc"',
+            "if-modified-since": "Sat, 17 Oct 2026 00:00:00 GMT",
+        })
+        self.assertEqual(os.stat(self.cache.directory).st_mode & 0o777, 0o700)
+
+    def test_not_cacheable(self) -> None:
+        for headers in ({}, {"etag": "x", "cache-control": "no-store"}):
+            res = HTTPResponseMock(headers=headers)
+            self.cache.store("key", res, b"{}")  # type: ignore
+            self.assertIsNone(self.cache.load("key"))
+            self.assertIsNone(
+                self.cache.writer("key", res, res)  # type: ignore
+            )
+
+    def test_writer(self) -> None:
+        res = HTTPResponseMock(headers={"etag": "x"})
+        writer = self.cache.writer(
+            "key", res, io.BytesIO(b"abcdef")  # type: ignore
+        )
+        assert writer is not None
+        self.assertEqual(writer.read(4), b"abcd")
+        self.assertIsNone(self.cache.load("key"))
+        self.assertEqual(writer.read(4), b"ef")
+        writer.commit()
+
+        entry = self.cache.open("key")
+        assert entry is not None
+        meta, f = entry
+        with f:
+            self.assertEqual(meta["etag"], "x")
+            self.assertNotIn("body", meta)
+            self.assertEqual(f.read(), b"abcdef")
+
+    def test_abort(self) -> None:
+        res = HTTPResponseMock(headers={"etag": "x"})
+        writer = self.cache.writer(
+            "key", res, io.BytesIO(b"abc")  # type: ignore
+        )
+        assert writer is not None
+        writer.read(2)
+        writer.abort()
+        self.assertIsNone(self.cache.load("key"))
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_corrupt(self) -> None:
+        os.makedirs(self.cache.directory)
+        with open(os.path.join(self.cache.directory, "key"), "wb") as f:
+            f.write(b"garbage")
+        self.assertIsNone(self.cache.load("key"))
+        self.assertIsNone(self.cache.load("missing"))
+
+    def test_format(self) -> None:
+        res = HTTPResponseMock(headers={"etag": "x"})
+        self.cache.store("key", res, memoryview(b"\n\xff"))  # type: ignore
+        with open(os.path.join(self.cache.directory, "key"), "rb") as f:
+            self.assertEqual(json.loads(f.readline().decode()), {
+                "etag": "x",
+                "last_modified": None,
+                "content_type": "",
+                "content_encoding": "",
+            })
+            self.assertEqual(f.read(), b"\n\xff")
+
+    def test_unsafe_directory(self) -> None:
+        res = HTTPResponseMock(headers={"etag": "x"})
+        os.makedirs(self.cache.directory)
+        os.chmod(self.cache.directory, 0o777)
+        self.cache.store("key", res, b"{}")  # type: ignore
+        self.assertEqual(os.listdir(self.cache.directory), [])
+        self.assertIsNone(self.cache.writer("key", res, res))  # type: ignore
+
+        os.chmod(self.cache.directory, 0o700)
+        self.cache.store("key", res, b"{}")  # type: ignore
+        self.assertIsNotNone(self.cache.load("key"))
+        os.chmod(self.cache.directory, 0o720)
+        self.assertIsNone(self.cache.load("key"))
+
+        os.chmod(self.cache.directory, 0o700)
+        with patch("os.getuid", return_value=os.getuid() + 1):
+            self.assertIsNone(self.cache.load("key"))
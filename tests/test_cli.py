@@ -1,10 +1,18 @@
+import io
+import json
+import os
 import tempfile
+import time
+from typing import Any, Dict, Iterator
 from unittest import TestCase
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, call, patch
 
 from click.testing import CliRunner
 
 from pklookup import cli, www
+from pklookup.mirror import Mirror
+
+from .helpers import HTTPConnectionMock, HTTPResponseMock
 
 
 class CliTest(TestCase):
@@ -28,8 +36,9 @@ class CliTest(TestCase):
             result = runner.invoke(cli.cli, args)
             self.assertNotEqual(result.exit_code, 0)
 
+    @patch("pklookup.cli.WWW")
     @patch("getpass.getpass")
-    def test_no_token(self, mock: MagicMock) -> None:
+    def test_no_token(self, mock: MagicMock, _www: MagicMock) -> None:
         with tempfile.NamedTemporaryFile() as tmp:
             tmp.write(
                 b"""
@@ -44,11 +53,175 @@ class CliTest(TestCase):
                 tmp.name,
                 "token",
                 "add",
+                "--role=admin",
             ]
             runner = CliRunner()
             runner.invoke(cli.cli, args)
             self.assertEqual(mock.call_count, 1)
 
+    @patch("pklookup.cli.WWW")
+    def test_timeouts(self, mock: MagicMock) -> None:
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write(
+                b"""
+                [pklookup]\n
+                url = https://url\n
+                admin_token = abcd\n
+                connect_timeout = 2\n
+                deadline = 30\n
+                """
+            )
+            tmp.flush()
+
+            args = [
+                "--config-file",
+                tmp.name,
+                "token",
+                "list",
+            ]
+            runner = CliRunner()
+            runner.invoke(cli.cli, args)
+            _args, kwargs = mock.call_args
+            self.assertEqual(kwargs["connect_timeout"], 2)
+            self.assertEqual(kwargs["read_timeout"], 60)
+            self.assertEqual(kwargs["deadline"], 30)
+
+            runner.invoke(cli.cli, ["--deadline=5"] + args)
+            _args, kwargs = mock.call_args
+            self.assertEqual(kwargs["deadline"], 5)
+
+    @patch("pklookup.www.ConnectionPool.connect")
+    def test_timings(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b'{"tokens": []}')
+        )
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write(
+                b"""
+                [pklookup]\n
+                url = https://url\n
+                admin_token = abcd\n
+                """
+            )
+            tmp.flush()
+
+            args = [
+                "--config-file",
+                tmp.name,
+                "--timings",
+                "token",
+                "list",
+            ]
+            runner = CliRunner()
+            result = runner.invoke(cli.cli, args)
+            self.assertEqual(result.exit_code, 0)
+            for phase in ["ttfb", "body", "render", "wall"]:
+                self.assertRegex(result.output, r"\n{} +\d".format(phase))
+            self.assertIn("requests: 1, failed: 0", result.output)
+
+            result = runner.invoke(cli.cli, args[:2] + args[3:])
+            self.assertNotIn("wall", result.output)
+
+    def test_print_timings(self) -> None:
+        timing = www.Timing("GET", "/server")
+        timing.phases.update([("ttfb", 0.5), ("decompress", 0.25)])
+        phases = {"render_table": 1.0}
+
+        with patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            cli.print_timings([timing], phases, time.monotonic())
+        lines = stderr.getvalue().splitlines()
+        self.assertEqual(
+            [line.split()[0] for line in lines[:5]],
+            ["phase", "ttfb", "decompress", "render_table", "wall"],
+        )
+        self.assertEqual(len(set(line.index(".") for line in lines[1:5])), 1)
+        self.assertEqual(len(set(len(line) for line in lines[:4])), 1)
+
+    @patch("pklookup.www.ConnectionPool.connect")
+    def test_metrics(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b'{"tokens": []}')
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pklookup.prom")
+            config = os.path.join(tmp, "pklookup.ini")
+            with open(config, "w") as f:
+                f.write(
+                    "[pklookup]\n"
+                    "url = https://url\n"
+                    "admin_token = abcd\n"
+                    "metrics_file = {}\n".format(path)
+                )
+
+            args = ["--config-file", config, "token", "list"]
+            runner = CliRunner()
+            result = runner.invoke(cli.cli, args)
+            self.assertEqual(result.exit_code, 0)
+            with open(path) as f:
+                self.assertIn(
+                    'pklookup_requests_total{method="GET",path="token",'
+                    'status="200"} 1\n',
+                    f.read(),
+                )
+
+            with open(config, "a") as f:
+                f.write("metrics_format = xml\n")
+            result = runner.invoke(cli.cli, args)
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn("invalid metrics_format", result.output)
+
+    @patch("pklookup.cli.WWW")
+    def test_limits(self, mock: MagicMock) -> None:
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write(
+                b"""
+                [pklookup]\n
+                url = https://url\n
+                admin_token = abcd\n
+                rate_limit = 50\n
+                max_concurrency = 16\n
+                """
+            )
+            tmp.flush()
+
+            args = [
+                "--config-file",
+                tmp.name,
+                "server",
+                "delete",
+                "--id=1-3",
+            ]
+            runner = CliRunner()
+            runner.invoke(cli.cli, args)
+            _args, kwargs = mock.call_args
+            self.assertEqual(kwargs["rate_limit"], 50)
+            self.assertEqual(kwargs["rate_burst"], None)
+            self.assertEqual(kwargs["max_concurrency"], 16)
+            _args, kwargs = mock.return_value.batch.call_args
+            self.assertEqual(_args[1], 16)
+
+    @patch("pklookup.cli.WWW")
+    def test_cache_dir(self, mock: MagicMock) -> None:
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write(
+                b"""
+                [pklookup]\n
+                url = https://url\n
+                admin_token = abcd\n
+                cache_dir = ~/.cache/pklookup\n
+                """
+            )
+            tmp.flush()
+
+            runner = CliRunner()
+            runner.invoke(
+                cli.cli, ["--config-file", tmp.name, "server", "list"]
+            )
+            _args, kwargs = mock.call_args
+            self.assertEqual(
+                kwargs["cache_dir"], os.path.expanduser("~/.cache/pklookup")
+            )
+
 
 class AddTokenTest(TestCase):
     def setUp(self) -> None:
@@ -268,6 +441,45 @@ class DeleteTokenTest(TestCase):
         self.assertTrue("invalid response" in result.output)
         self.assertEqual(result.exit_code, 1)
 
+    @patch("pklookup.www.WWW.delete")
+    def test_success_many(self, mock: MagicMock) -> None:
+        mock.return_value = {"message": "deleted"}
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "token",
+            "delete",
+            "--id=3",
+            "--id=5-7",
+            "--id=6",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+
+        ids = sorted(kwargs["id"] for _, kwargs in mock.call_args_list)
+        self.assertEqual(ids, [3, 5, 6, 7])
+        self.assertTrue("token: id 5: deleted" in result.output)
+        self.assertTrue("4 succeeded, 0 failed" in result.output)
+        self.assertEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.delete")
+    def test_invalid_range(self, mock: MagicMock) -> None:
+        for value in ["7-5", "x", "1-", "-1"]:
+            args = [
+                "--config-file",
+                self.config.name,
+                "token",
+                "delete",
+                "--id={}".format(value),
+            ]
+            runner = CliRunner()
+            result = runner.invoke(cli.cli, args)
+
+            self.assertTrue("invalid id" in result.output)
+            self.assertEqual(result.exit_code, 1)
+        self.assertEqual(mock.call_count, 0)
+
 
 class ListTokenTest(TestCase):
     def setUp(self) -> None:
@@ -284,9 +496,9 @@ class ListTokenTest(TestCase):
     def tearDown(self) -> None:
         self.config.close()
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_invalid_type(self, mock: MagicMock) -> None:
-        mock.return_value = "abcd"
+        mock.side_effect = TypeError("expected an object")
 
         args = [
             "--config-file",
@@ -299,16 +511,9 @@ class ListTokenTest(TestCase):
         self.assertTrue("invalid token list" in result.output)
         self.assertEqual(result.exit_code, 1)
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_missing_tokens(self, mock: MagicMock) -> None:
-        mock.return_value = {
-            "abc": [{
-                "id": 0,
-                "role": "x",
-                "description": "y",
-                "created": "..."
-            }]
-        }
+        mock.side_effect = KeyError("tokens")
 
         args = [
             "--config-file",
@@ -321,15 +526,13 @@ class ListTokenTest(TestCase):
         self.assertTrue("invalid token list" in result.output)
         self.assertEqual(result.exit_code, 1)
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_missing_id_field(self, mock: MagicMock) -> None:
-        mock.return_value = {
-            "tokens": [{
-                "role": "x",
-                "description": "y",
-                "created": "...",
-            }]
-        }
+        mock.return_value = iter([{
+            "role": "x",
+            "description": "y",
+            "created": "...",
+        }])
 
         args = [
             "--config-file",
@@ -342,7 +545,7 @@ class ListTokenTest(TestCase):
         self.assertTrue("invalid token list" in result.output)
         self.assertEqual(result.exit_code, 1)
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_failure_exception(self, mock: MagicMock) -> None:
         mock.side_effect = www.WWWError
 
@@ -356,16 +559,15 @@ class ListTokenTest(TestCase):
         result = runner.invoke(cli.cli, args)
         self.assertEqual(result.exit_code, 1)
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_success(self, mock: MagicMock) -> None:
-        mock.return_value = {
-            "tokens": [{
-                "id": "1234",
-                "role": "rrrrr",
-                "description": "ddddd",
-                "created": "cccc",
-            }]
+        row = {
+            "id": "1234",
+            "role": "rrrrr",
+            "description": "ddddd",
+            "created": "cccc",
         }
+        mock.return_value = iter([row])
 
         args = [
             "--config-file",
@@ -376,7 +578,8 @@ class ListTokenTest(TestCase):
         runner = CliRunner()
         result = runner.invoke(cli.cli, args)
 
-        for key, value in mock.return_value["tokens"][0].items():
+        mock.assert_called_once_with("token", "tokens")
+        for key, value in row.items():
             self.assertTrue(key in result.output)
             self.assertTrue(value in result.output)
 
@@ -461,7 +664,7 @@ class AddServerTest(TestCase):
         mock.return_value = {"message": "xyz"}
 
         with tempfile.NamedTemporaryFile() as tmp:
-            tmp.write(b"  first line\n second line\n")
+            tmp.write(b"  first line\n\n# comment\n second line\n")
             tmp.flush()
 
             args = [
@@ -474,12 +677,123 @@ class AddServerTest(TestCase):
             runner = CliRunner()
             result = runner.invoke(cli.cli, args)
 
-        args, kwargs = mock.call_args
-        self.assertEqual(args, ("server", ))
-        self.assertEqual(kwargs, {"public_key": "first line"})
-        self.assertEqual(mock.call_count, 1)
+        keys = sorted(kw["public_key"] for _, kw in mock.call_args_list)
+        self.assertEqual(keys, ["first line", "second line"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue("{}:1: xyz".format(tmp.name) in result.output)
+        self.assertTrue("{}:4: xyz".format(tmp.name) in result.output)
+        self.assertTrue("2 succeeded, 0 failed" in result.output)
+
+    @patch("pklookup.www.WWW.post")
+    def test_success_directory(self, mock: MagicMock) -> None:
+        mock.return_value = {"message": "xyz"}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ["a.pub", "b.pub", "c.txt"]:
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write("key {}\n".format(name))
+
+            args = [
+                "--config-file",
+                self.config.name,
+                "server",
+                "add",
+                "--public-key=@{}".format(tmp),
+            ]
+            runner = CliRunner()
+            result = runner.invoke(cli.cli, args)
+
+        keys = sorted(kw["public_key"] for _, kw in mock.call_args_list)
+        self.assertEqual(keys, ["key a.pub", "key b.pub"])
+        self.assertEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.post")
+    def test_success_glob(self, mock: MagicMock) -> None:
+        mock.return_value = {"message": "xyz"}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ["a.pub", "b.key", "c.key"]:
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write("key {}\n".format(name))
+
+            args = [
+                "--config-file",
+                self.config.name,
+                "server",
+                "add",
+                "--public-key=@{}".format(os.path.join(tmp, "*.key")),
+            ]
+            runner = CliRunner()
+            result = runner.invoke(cli.cli, args)
+
+        keys = sorted(kw["public_key"] for _, kw in mock.call_args_list)
+        self.assertEqual(keys, ["key b.key", "key c.key"])
         self.assertEqual(result.exit_code, 0)
-        self.assertTrue("xyz" in result.output)
+
+    @patch("pklookup.www.WWW.post")
+    def test_success_stdin(self, mock: MagicMock) -> None:
+        mock.return_value = {"message": "xyz"}
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "server",
+            "add",
+            "--public-key=-",
+            "--public-key=abc",
+            "--parallel=2",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args, input="key1\nkey2\n")
+
+        keys = sorted(kw["public_key"] for _, kw in mock.call_args_list)
+        self.assertEqual(keys, ["abc", "key1", "key2"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue("3 succeeded, 0 failed" in result.output)
+
+    @patch("pklookup.www.WWW.post")
+    def test_partial_failure(self, mock: MagicMock) -> None:
+        def post(_path: str, public_key: str) -> Dict:
+            if public_key == "bad":
+                raise www.WWWError("invalid key")
+            return {"message": "added"}
+
+        mock.side_effect = post
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "server",
+            "add",
+            "--public-key=good",
+            "--public-key=bad",
+            "--public-key=good",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+
+        self.assertEqual(mock.call_count, 3)
+        self.assertTrue("argument 1: added" in result.output)
+        self.assertTrue("ERROR: argument 2: invalid key" in result.output)
+        self.assertTrue("argument 3: added" in result.output)
+        self.assertTrue("2 succeeded, 1 failed" in result.output)
+        self.assertEqual(result.exit_code, 1)
+
+    @patch("pklookup.www.WWW.post")
+    def test_no_keys(self, mock: MagicMock) -> None:
+        args = [
+            "--config-file",
+            self.config.name,
+            "server",
+            "add",
+            "--public-key=-",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args, input="\n")
+
+        self.assertEqual(mock.call_count, 0)
+        self.assertTrue("no public keys" in result.output)
+        self.assertEqual(result.exit_code, 1)
 
     @patch("pklookup.www.WWW.post")
     def test_invalid_type(self, mock: MagicMock) -> None:
@@ -603,6 +917,74 @@ class DeleteServerTest(TestCase):
         self.assertTrue("invalid response" in result.output)
         self.assertEqual(result.exit_code, 1)
 
+    @patch("pklookup.www.WWW.delete")
+    def test_success_stdin(self, mock: MagicMock) -> None:
+        mock.return_value = {"message": "deleted"}
+        stdin = (
+            "+----+----------+---------+\n"
+            "| id | token_id |   ip    |\n"
+            "+====+==========+=========+\n"
+            "| 12 | 1        | 1.2.3.4 |\n"
+            "+----+----------+---------+\n"
+            "| 13 | 1        | 1.2.3.5 |\n"
+            "+----+----------+---------+\n"
+            "20-21\n"
+        )
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "server",
+            "delete",
+            "--id=-",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args, input=stdin)
+
+        ids = sorted(kwargs["id"] for _, kwargs in mock.call_args_list)
+        self.assertEqual(ids, [12, 13, 20, 21])
+        self.assertEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.delete")
+    def test_partial_failure(self, mock: MagicMock) -> None:
+        def delete(_path: str, **kwargs: int) -> Dict:
+            if kwargs["id"] == 2:
+                raise www.WWWError("no such server")
+            return {"message": "deleted"}
+
+        mock.side_effect = delete
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "server",
+            "delete",
+            "--id=1-3",
+            "--parallel=2",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+
+        self.assertEqual(mock.call_count, 3)
+        self.assertTrue("ERROR: id 2: no such server" in result.output)
+        self.assertTrue("server: id 3: deleted" in result.output)
+        self.assertTrue("2 succeeded, 1 failed" in result.output)
+        self.assertEqual(result.exit_code, 1)
+
+    def test_no_ids(self) -> None:
+        args = [
+            "--config-file",
+            self.config.name,
+            "server",
+            "delete",
+            "--id=-",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args, input="")
+
+        self.assertTrue("no ids" in result.output)
+        self.assertEqual(result.exit_code, 1)
+
 
 class ListServerTest(TestCase):
     def setUp(self) -> None:
@@ -619,9 +1001,9 @@ class ListServerTest(TestCase):
     def tearDown(self) -> None:
         self.config.close()
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_invalid_type(self, mock: MagicMock) -> None:
-        mock.return_value = "abcd"
+        mock.side_effect = TypeError("expected an object")
 
         args = [
             "--config-file",
@@ -634,19 +1016,9 @@ class ListServerTest(TestCase):
         self.assertTrue("invalid server list" in result.output)
         self.assertEqual(result.exit_code, 1)
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_missing_servers(self, mock: MagicMock) -> None:
-        mock.return_value = {
-            "abc": [{
-                "id": 0,
-                "token_id": "1",
-                "ip": "1.2.3.4",
-                "port": "1234",
-                "key_type": "rsa",
-                "public_key": "...",
-                "created": "...",
-            }]
-        }
+        mock.side_effect = KeyError("servers")
 
         args = [
             "--config-file",
@@ -659,18 +1031,16 @@ class ListServerTest(TestCase):
         self.assertTrue("invalid server list" in result.output)
         self.assertEqual(result.exit_code, 1)
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_missing_id_field(self, mock: MagicMock) -> None:
-        mock.return_value = {
-            "servers": [{
-                "token_id": "1",
-                "ip": "1.2.3.4",
-                "port": "1234",
-                "key_type": "rsa",
-                "public_key": "...",
-                "created": "..."
-            }]
-        }
+        mock.return_value = iter([{
+            "token_id": "1",
+            "ip": "1.2.3.4",
+            "port": "1234",
+            "key_type": "rsa",
+            "public_key": "...",
+            "created": "..."
+        }])
 
         args = [
             "--config-file",
@@ -683,7 +1053,7 @@ class ListServerTest(TestCase):
         self.assertTrue("invalid server list" in result.output)
         self.assertEqual(result.exit_code, 1)
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_failure_exception(self, mock: MagicMock) -> None:
         mock.side_effect = www.WWWError
 
@@ -697,36 +1067,254 @@ class ListServerTest(TestCase):
         result = runner.invoke(cli.cli, args)
         self.assertEqual(result.exit_code, 1)
 
-    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
     def test_success(self, mock: MagicMock) -> None:
-        mock.return_value = {
-            "servers": [{
-                "id": "0",
+        row = {
+            "id": "0",
+            "token_id": "1",
+            "ip": "1.2.3.4",
+            "port": "1234",
+            "key_type": "rsa",
+            "key_data": "...",
+            "key_comment": "xyz",
+            "created": "...",
+        }
+        mock.return_value = iter([row])
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "server",
+            "list",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+
+        mock.assert_called_once_with("server", "servers")
+        for key, value in row.items():
+            self.assertTrue(key in result.output)
+            self.assertTrue(value in result.output)
+
+        self.assertEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.get")
+    def test_page_size(self, mock: MagicMock) -> None:
+        def get(_path: str, offset: int, limit: int) -> Dict:
+            servers = [{
+                "id": str(i),
                 "token_id": "1",
                 "ip": "1.2.3.4",
-                "port": "1234",
-                "key_type": "rsa",
+                "port": "22",
+                "key_type": "ssh-rsa",
                 "key_data": "...",
-                "key_comment": "xyz",
+                "key_comment": "...",
                 "created": "...",
-            }]
-        }
+            } for i in range(offset, offset + limit)]
+            return {"servers": servers}
+
+        mock.side_effect = get
 
         args = [
             "--config-file",
             self.config.name,
             "server",
             "list",
+            "--page-size=2",
+            "--limit=3",
         ]
         runner = CliRunner()
         result = runner.invoke(cli.cli, args)
 
-        for key, value in mock.return_value["servers"][0].items():
-            self.assertTrue(key in result.output)
-            self.assertTrue(value in result.output)
+        self.assertTrue("| 2 " in result.output)
+        self.assertFalse("| 3 " in result.output)
+        self.assertEqual(result.exit_code, 0)
+
+
+class FilterTest(TestCase):
+    def setUp(self) -> None:
+        self.config = tempfile.NamedTemporaryFile()
+        self.config.write(
+            b"""
+            [pklookup]\n
+            url = https://url:port\n
+            admin_token = abcd\n
+            """
+        )
+        self.config.flush()
+        self.servers = [{
+            "id": str(i),
+            "token_id": str(i % 2),
+            "ip": "1.2.3.{}".format(i),
+            "port": "22",
+            "key_type": "ssh-rsa",
+            "key_data": "...",
+            "key_comment": "...",
+            "created": "2026-10-{:02d}T00:00:00Z".format(i + 1),
+        } for i in range(10)]
+
+    def tearDown(self) -> None:
+        self.config.close()
+
+    def invoke(self, *args: str) -> Any:
+        runner = CliRunner()
+        args = ("--config-file", self.config.name, "server", "list") + args
+        return runner.invoke(cli.cli, args)
+
+    @patch("pklookup.www.WWW.stream")
+    def test_filters(self, mock: MagicMock) -> None:
+        # The server ignores the filters.
+        mock.return_value = iter(self.servers)
 
+        result = self.invoke(
+            "--token-id=1", "--created-after=2026-10-05", "--limit=2"
+        )
+        mock.assert_called_once_with(
+            "server", "servers", token_id=1, created_after="2026-10-05"
+        )
+        self.assertIn("1.2.3.5 ", result.output)
+        self.assertIn("1.2.3.7 ", result.output)
+        self.assertNotIn("1.2.3.9 ", result.output)
+        self.assertNotIn("1.2.3.3 ", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.get")
+    def test_filters_limit(self, mock: MagicMock) -> None:
+        def get(_path: str, offset: int, limit: int, **kwargs: Any) -> Dict:
+            servers = self.servers
+            if filtered:
+                servers = [s for s in servers if s["token_id"] == "1"]
+            return {"servers": servers[offset:offset + limit]}
+
+        mock.side_effect = get
+
+        filtered = True
+        result = self.invoke("--page-size=5", "--token-id=1", "--limit=2")
+        self.assertEqual(
+            mock.call_args_list[0],
+            call("server", token_id=1, limit=2, offset=0),
+        )
+        self.assertIn("1.2.3.3 ", result.output)
+        self.assertNotIn("1.2.3.5 ", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+        # The server ignores the filters.
+        filtered = False
+        mock.reset_mock()
+        result = self.invoke("--page-size=5", "--token-id=1", "--limit=2")
+        self.assertIn("1.2.3.1 ", result.output)
+        self.assertIn("1.2.3.3 ", result.output)
+        self.assertNotIn("1.2.3.5 ", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.stream")
+    def test_ip(self, mock: MagicMock) -> None:
+        mock.return_value = iter(self.servers[2:3])
+
+        result = self.invoke("--ip=1.2.3.2", "--port=22")
+        mock.assert_called_once_with(
+            "server", "servers", ip="1.2.3.2", port=22
+        )
+        self.assertIn("1.2.3.2 ", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.stream")
+    def test_format(self, mock: MagicMock) -> None:
+        mock.return_value = iter(self.servers)
+
+        result = self.invoke("--format=ndjson", "--token-id=0")
+        lines = result.output.splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0]), self.servers[0])
+        self.assertEqual(result.exit_code, 0)
+
+        mock.return_value = iter(self.servers)
+        result = self.invoke("--format=csv")
+        self.assertTrue(result.output.startswith("id,token_id,ip,"))
+        self.assertEqual(len(result.output.splitlines()), 11)
+
+        result = self.invoke("--format=xml")
+        self.assertNotEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.stream")
+    def test_sort(self, mock: MagicMock) -> None:
+        # The server ignores the sort order and the limit.
+        mock.return_value = iter(self.servers)
+
+        result = self.invoke(
+            "--sort=-created", "--limit=3", "--format=ndjson"
+        )
+        mock.assert_called_once_with("server", "servers", sort="-created")
+        ids = [json.loads(line)["id"] for line in result.output.splitlines()]
+        self.assertEqual(ids, ["9", "8", "7"])
+        self.assertEqual(result.exit_code, 0)
+
+        mock.return_value = iter(self.servers)
+        result = self.invoke("--sort=token_id", "--token-id=1", "--limit=2")
+        self.assertIn("1.2.3.1 ", result.output)
+        self.assertIn("1.2.3.3 ", result.output)
+        self.assertNotIn("1.2.3.5 ", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+        result = self.invoke("--sort=fingerprint")
+        self.assertNotEqual(result.exit_code, 0)
+
+    @patch("shutil.get_terminal_size")
+    @patch("pklookup.www.WWW.stream")
+    def test_overflow(self, mock: MagicMock, size: MagicMock) -> None:
+        size.return_value = os.terminal_size((80, 24))
+        for server in self.servers:
+            server["key_data"] = "AAAA" + "x" * 40 + "ZZZZ"
+
+        mock.return_value = iter(self.servers)
+        result = self.invoke()
+        lines = result.output.splitlines()
+        self.assertTrue(all(len(line) == 80 for line in lines))
+        self.assertIn("| AAA...ZZ |", result.output)
         self.assertEqual(result.exit_code, 0)
 
+        mock.return_value = iter(self.servers)
+        result = self.invoke("--overflow=truncate", "--pager")
+        self.assertIn("| AAAAx... |", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+        mock.return_value = iter(self.servers)
+        result = self.invoke("--overflow=none")
+        self.assertIn(self.servers[0]["key_data"], result.output)
+
+    @patch("pklookup.www.WWW.stream")
+    def test_stats(self, mock: MagicMock) -> None:
+        self.servers[3]["ip"] = "1.2.3.1"
+        mock.return_value = iter(self.servers)
+
+        runner = CliRunner()
+        args = ["--config-file", self.config.name, "server", "stats"]
+        result = runner.invoke(cli.cli, args)
+        mock.assert_called_once_with("server", "servers")
+        self.assertIn("servers: 10\n", result.output)
+        self.assertIn("| ssh-rsa  | 10    |", result.output)
+        self.assertIn("| 2026-10 | 10    |", result.output)
+        self.assertIn("| 1.2.3.1 | 2     | 1 3 |", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+        mock.return_value = iter(self.servers)
+        result = runner.invoke(cli.cli, args + ["--format=json"])
+        data = json.loads(result.output)
+        self.assertEqual(data["token_id"], {"0": 5, "1": 5})
+        self.assertEqual(data["duplicate_keys"], {"...": [
+            s["id"] for s in self.servers
+        ]})
+        self.assertEqual(result.exit_code, 0)
+
+        mock.return_value = iter([{"id": 1}])
+        result = runner.invoke(cli.cli, args)
+        self.assertIn("invalid server list", result.output)
+        self.assertEqual(result.exit_code, 1)
+
+    def test_invalid_time(self) -> None:
+        result = self.invoke("--created-after=yesterday")
+        self.assertIn("invalid timestamp", result.output)
+        self.assertNotEqual(result.exit_code, 0)
+
 
 class SaveKeyTest(TestCase):
     def setUp(self) -> None:
@@ -918,5 +1506,197 @@ class SaveKeyTest(TestCase):
         runner = CliRunner()
         result = runner.invoke(cli.cli, args)
 
-        self.assertEqual(self.known_hosts.read(), b"1.2.3.4 ssh-rsa data\n")
+        with open(self.known_hosts.name, "rb") as f:
+            self.assertEqual(f.read(), b"1.2.3.4 ssh-rsa data\n")
+        self.assertEqual(result.exit_code, 0)
+
+        result = runner.invoke(cli.cli, args)
+        self.assertIn("already saved", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+        mock.return_value["servers"][0]["key_data"] = "new"
+        result = runner.invoke(cli.cli, args)
+        self.assertIn("removed 1 old entries", result.output)
+        with open(self.known_hosts.name, "rb") as f:
+            self.assertEqual(f.read(), b"1.2.3.4 ssh-rsa new\n")
         self.assertEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.get")
+    def test_unwritable(self, mock: MagicMock) -> None:
+        mock.return_value = {"servers": [{
+            "ip": "1.2.3.4", "key_type": "ssh-rsa", "key_data": "data",
+        }]}
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(self.config.name, "w") as f:
+                f.write(
+                    "[pklookup]\nurl = https://url:port\nadmin_token = a\n"
+                    "known_hosts = {}\n".format(os.path.join(tmp, "x", "y"))
+                )
+            result = CliRunner().invoke(cli.cli, [
+                "--config-file", self.config.name, "server", "save-key",
+                "--id=0",
+            ])
+        self.assertIn("unable to update known_hosts", result.output)
+        self.assertEqual(result.exit_code, 1)
+
+
+class MirrorTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.known_hosts = os.path.join(self.tmp.name, "known_hosts")
+        self.config = os.path.join(self.tmp.name, "config")
+        with open(self.config, "w") as f:
+            f.write(
+                """
+                [pklookup]\n
+                url = https://url:port\n
+                admin_token = abcd\n
+                known_hosts = {}\n
+                mirror_file = {}\n
+                """.format(
+                    self.known_hosts, os.path.join(self.tmp.name, "mirror")
+                )
+            )
+        self.servers = [{
+            "id": str(i),
+            "token_id": "1",
+            "ip": "1.2.3.{}".format(i),
+            "port": "22",
+            "key_type": "ssh-rsa",
+            "key_data": "data{}".format(i),
+            "key_comment": "comment",
+            "created": "...",
+        } for i in range(3)]
+        self.tokens = [
+            {"id": 1, "role": "admin", "description": "xyz", "created": "..."}
+        ]
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def invoke(self, *args: str) -> Any:
+        runner = CliRunner()
+        return runner.invoke(cli.cli, ["--config-file", self.config, *args])
+
+    def stream(self, path: str, _key: str) -> Iterator[Dict]:
+        return iter(self.servers if path == "server" else self.tokens)
+
+    @patch("pklookup.www.WWW.stream")
+    def test_sync(self, mock: MagicMock) -> None:
+        mock.side_effect = self.stream
+
+        result = self.invoke("sync")
+        self.assertIn("server: 3 added, 0 deleted", result.output)
+        self.assertIn("token: 1 added, 0 deleted", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+        del self.servers[1]
+        result = self.invoke("sync")
+        self.assertIn("server: 0 added, 1 deleted", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+    @patch("pklookup.www.WWW.stream")
+    def test_sync_invalid(self, mock: MagicMock) -> None:
+        mock.side_effect = self.stream
+        del self.servers[0]["ip"]
+
+        result = self.invoke("sync")
+        self.assertIn("invalid server list", result.output)
+        self.assertEqual(result.exit_code, 1)
+
+    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
+    def test_cached(self, stream: MagicMock, get: MagicMock) -> None:
+        stream.side_effect = self.stream
+        self.invoke("sync")
+        stream.reset_mock()
+
+        result = self.invoke("server", "list", "--cached", "--limit=2")
+        self.assertIn("1.2.3.1", result.output)
+        self.assertNotIn("1.2.3.2", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+        result = self.invoke("token", "list", "--cached")
+        self.assertIn("xyz", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+        result = self.invoke("server", "save-key", "--cached", "--id=2")
+        with open(self.known_hosts) as f:
+            self.assertEqual(f.read(), "1.2.3.2 ssh-rsa data2\n")
+        self.assertEqual(result.exit_code, 0)
+
+        result = self.invoke("server", "save-key", "--cached", "--id=5")
+        self.assertIn("invalid server id", result.output)
+        self.assertEqual(result.exit_code, 1)
+
+        stream.assert_not_called()
+        get.assert_not_called()
+
+    @patch("getpass.getpass")
+    @patch("pklookup.www.WWW.stream")
+    def test_cached_offline(
+            self,
+            stream: MagicMock,
+            getpass: MagicMock,
+    ) -> None:
+        stream.side_effect = self.stream
+        self.invoke("sync")
+        with open(self.config, "w") as f:
+            f.write("[pklookup]\nmirror_file = {}\n".format(
+                os.path.join(self.tmp.name, "mirror")
+            ))
+
+        with patch("pklookup.cli.WWW") as mock:
+            for args in [
+                    ["server", "list", "--cached"],
+                    ["server", "lookup", "--cached", "1.2.3.1"],
+                    ["server", "stats", "--cached"],
+                    ["token", "list", "--cached"],
+            ]:
+                result = self.invoke(*args)
+                self.assertEqual(result.exit_code, 0, result.output)
+            mock.assert_not_called()
+        getpass.assert_not_called()
+
+        result = self.invoke("server", "lookup", "1.2.3.1")
+        self.assertIn("no 'url'", result.output)
+        self.assertEqual(result.exit_code, 1)
+
+    def test_cached_unsynced(self) -> None:
+        result = self.invoke("server", "list", "--cached")
+        self.assertIn("run 'pklookup sync' first", result.output)
+        self.assertEqual(result.exit_code, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "mirror")))
+
+        Mirror(os.path.join(self.tmp.name, "mirror")).close()
+        result = self.invoke("server", "list", "--cached")
+        self.assertIn("run 'pklookup sync' first", result.output)
+        self.assertEqual(result.exit_code, 1)
+
+    @patch("pklookup.www.WWW.get")
+    @patch("pklookup.www.WWW.stream")
+    def test_lookup(self, stream: MagicMock, get: MagicMock) -> None:
+        stream.side_effect = self.stream
+        get.return_value = {"servers": self.servers}
+
+        result = self.invoke("server", "lookup", "1.2.3.1:22")
+        get.assert_called_once_with("server", ip="1.2.3.1", port=22)
+        self.assertIn("data1", result.output)
+        self.assertNotIn("data2", result.output)
+        self.assertEqual(result.exit_code, 0)
+
+        self.invoke("sync")
+        get.reset_mock()
+        args = ["server", "lookup", "--cached", "--known-hosts", "1.2.3.2"]
+        result = self.invoke(*args)
+        self.assertEqual(result.output, "1.2.3.2 ssh-rsa data2\n")
+        self.assertEqual(result.exit_code, 0)
+        get.assert_not_called()
+
+        result = self.invoke("server", "lookup", "--cached", "1.2.3.9")
+        self.assertIn("no matching server", result.output)
+        self.assertEqual(result.exit_code, 1)
+
+        result = self.invoke("server", "lookup", "example.com")
+        self.assertIn("invalid query", result.output)
+        self.assertEqual(result.exit_code, 1)
@@ -0,0 +1,91 @@
+import gzip
+import io
+import zlib
+from unittest import TestCase
+
+from pklookup import compression
+
+
+class DecompressTest(TestCase):
+    def test_gzip(self) -> None:
+        data = gzip.compress(b"abc" * 100)
+        self.assertEqual(compression.decompress(data, "gzip"), b"abc" * 100)
+        self.assertEqual(compression.decompress(data, " GZIP"), b"abc" * 100)
+
+    def test_deflate(self) -> None:
+        data = zlib.compress(b"abc")
+        self.assertEqual(compression.decompress(data, "deflate"), b"abc")
+
+    def test_memoryview(self) -> None:
+        data = memoryview(gzip.compress(b"abc"))
+        self.assertEqual(compression.decompress(data, "gzip"), b"abc")
+
+    def test_unsupported(self) -> None:
+        with self.assertRaisesRegex(ValueError, "unsupported"):
+            compression.decompress(b"abc", "compress")
+
+    def test_truncated(self) -> None:
+        data = gzip.compress(b"abc" * 100)
+        with self.assertRaisesRegex(ValueError, "truncated"):
+            compression.decompress(data[:-10], "gzip")
+
+    def test_corrupt(self) -> None:
+        with self.assertRaises(ValueError):
+            compression.decompress(b"not gzip", "gzip")
+
+    def test_compress(self) -> None:
+        data = compression.compress(b"abc")
+        self.assertEqual(gzip.decompress(data), b"abc")
+
+    def test_accept_encoding(self) -> None:
+        self.assertIn("gzip", compression.ACCEPT_ENCODING.split(", "))
+
+
+class DecompressingReaderTest(TestCase):
+    def setUp(self) -> None:
+        self.data = b"".join(b"%d," % i for i in range(10000))
+        self.compressed = gzip.compress(self.data)
+
+    def reader(self, size: int = 100) -> compression.DecompressingReader:
+        return compression.DecompressingReader(
+            io.BytesIO(self.compressed), "gzip", size
+        )
+
+    def test_read_all(self) -> None:
+        reader = self.reader()
+        self.assertEqual(reader.read(), self.data)
+        self.assertEqual(reader.read(), b"")
+        self.assertEqual(reader.received, len(self.compressed))
+
+    def test_read_chunks(self) -> None:
+        for amt in [1, 7, 1000, 100000]:
+            reader = self.reader()
+            chunks = []
+            while True:
+                chunk = reader.read(amt)
+                if not chunk:
+                    break
+                self.assertLessEqual(len(chunk), amt)
+                chunks.append(chunk)
+            self.assertEqual(b"".join(chunks), self.data)
+
+    def test_mixed(self) -> None:
+        reader = self.reader()
+        start = reader.read(5)
+        self.assertEqual(start + reader.read(-1), self.data)
+
+    def test_truncated(self) -> None:
+        reader = compression.DecompressingReader(
+            io.BytesIO(self.compressed[:-10]), "gzip"
+        )
+        with self.assertRaisesRegex(ValueError, "truncated"):
+            reader.read()
+
+    def test_corrupt(self) -> None:
+        reader = compression.DecompressingReader(io.BytesIO(b"xyz"), "gzip")
+        with self.assertRaises(ValueError):
+            reader.read(10)
+
+    def test_unsupported(self) -> None:
+        with self.assertRaises(ValueError):
+            compression.DecompressingReader(io.BytesIO(b""), "xz")
@@ -0,0 +1,86 @@
+import io
+from unittest import TestCase, skipUnless
+
+from pklookup import formats
+
+try:
+    import msgpack
+    HAVE_MSGPACK = True
+except ImportError:
+    HAVE_MSGPACK = False
+
+
+class MediaTypeTest(TestCase):
+    def test_media_type(self) -> None:
+        self.assertEqual(
+            formats.media_type("Application/JSON; charset=utf-8"),
+            "application/json",
+        )
+        self.assertEqual(
+            formats.media_type("application/x-msgpack"), formats.MSGPACK
+        )
+        self.assertEqual(formats.media_type(""), "")
+
+    def test_accept(self) -> None:
+        types = [t.split(";")[0] for t in formats.ACCEPT.split(", ")]
+        self.assertEqual(types, formats.FORMATS)
+        self.assertEqual(types[-1], formats.JSON)
+        self.assertNotIn(";", formats.ACCEPT.split(", ")[0])
+
+
+class IterateMemberTest(TestCase):
+    def test_iterate(self) -> None:
+        obj = {"servers": [1, 2]}
+        self.assertEqual(list(formats.iterate_member(obj, "servers")), [1, 2])
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(TypeError):
+            formats.iterate_member([], "servers")
+        with self.assertRaises(TypeError):
+            formats.iterate_member({"servers": 1}, "servers")
+        with self.assertRaises(KeyError):
+            formats.iterate_member({}, "servers")
+
+
+@skipUnless(HAVE_MSGPACK, "msgpack is not installed")
+class MsgpackStreamTest(TestCase):
+    @staticmethod
+    def pack(obj: object) -> bytes:
+        return bytes(msgpack.packb(obj))
+
+    def test_chunk_sizes(self) -> None:
+        servers = [{"id": i, "key": "x" * i} for i in range(100)]
+        data = self.pack({"a": {"b": [1]}, "servers": servers, "z": 1})
+
+        for size in [1, 2, 7, 64, 100000]:
+            stream = formats.MsgpackStream(io.BytesIO(data), size)
+            self.assertEqual(list(stream.iterate("servers")), servers)
+
+    def test_received(self) -> None:
+        data = self.pack({"servers": [1, 2, 3]})
+        stream = formats.MsgpackStream(io.BytesIO(data), 2)
+        list(stream.iterate("servers"))
+        self.assertLessEqual(stream.received, len(data))
+        self.assertGreater(stream.received, 0)
+
+    def test_empty_array(self) -> None:
+        data = self.pack({"servers": []})
+        stream = formats.MsgpackStream(io.BytesIO(data))
+        self.assertEqual(list(stream.iterate("servers")), [])
+
+    def test_missing_key(self) -> None:
+        data = self.pack({"tokens": []})
+        with self.assertRaises(KeyError):
+            list(formats.MsgpackStream(io.BytesIO(data)).iterate("servers"))
+
+    def test_invalid_type(self) -> None:
+        for obj in [[1], {"servers": 1}]:
+            stream = formats.MsgpackStream(io.BytesIO(self.pack(obj)))
+            with self.assertRaises(TypeError):
+                list(stream.iterate("servers"))
+
+    def test_truncated(self) -> None:
+        data = self.pack({"servers": [1, 2, 3]})[:-1]
+        stream = formats.MsgpackStream(io.BytesIO(data))
+        with self.assertRaisesRegex(ValueError, "truncated"):
+            list(stream.iterate("servers"))
@@ -0,0 +1,121 @@
+import base64
+import hashlib
+import hmac
+import os
+import stat
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pklookup.known_hosts import KnownHosts
+
+
+def hashed(host: str, salt: bytes = b"s" * 20) -> str:
+    digest = hmac.new(salt, host.encode(), hashlib.sha1).digest()
+    return "|1|{}|{}".format(
+        base64.b64encode(salt).decode(), base64.b64encode(digest).decode()
+    )
+
+
+class KnownHostsTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "known_hosts")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def write(self, data: str) -> None:
+        with open(self.path, "w") as f:
+            f.write(data)
+
+    def read(self) -> str:
+        with open(self.path) as f:
+            return f.read()
+
+    def add(self, host: str, key_type: str, key_data: str) -> tuple:
+        with KnownHosts(self.path) as known_hosts:
+            return known_hosts.add(host, key_type, key_data)
+
+    def test_new(self) -> None:
+        self.assertEqual(self.add("1.2.3.4", "ssh-rsa", "a"), (1, 0))
+        self.assertEqual(self.read(), "1.2.3.4 ssh-rsa a\n")
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+        with KnownHosts(self.path) as known_hosts:
+            for host, key_type, key_data, added in [
+                    ("1.2.3.4", "ssh-ed25519", "b", 1),
+                    ("1.2.3.5", "ssh-rsa", "a", 1),
+                    ("1.2.3.5", "ssh-rsa", "a", 0),
+            ]:
+                self.assertEqual(
+                    known_hosts.add(host, key_type, key_data), (added, 0)
+                )
+        self.assertEqual(self.read(), (
+            "1.2.3.4 ssh-rsa a\n"
+            "1.2.3.4 ssh-ed25519 b\n"
+            "1.2.3.5 ssh-rsa a\n"
+        ))
+
+    def test_duplicate(self) -> None:
+        self.write("# comment\n1.2.3.4,host ssh-rsa a comment\n")
+        os.chmod(self.path, 0o644)
+        inode = os.stat(self.path).st_ino
+        self.assertEqual(self.add("1.2.3.4", "ssh-rsa", "a"), (0, 0))
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+
+        self.write("1.2.3.4 ssh-rsa a\nx ssh-rsa a\n1.2.3.4 ssh-rsa a\n")
+        self.assertEqual(self.add("1.2.3.4", "ssh-rsa", "a"), (0, 1))
+        self.assertEqual(self.read(), "1.2.3.4 ssh-rsa a\nx ssh-rsa a\n")
+
+    def test_replace(self) -> None:
+        self.write(
+            "# 1.2.3.4 ssh-rsa old\n"
+            "1.2.3.4 ssh-rsa old\n"
+            "1.2.3.4 ssh-ed25519 other\n"
+            "host,1.2.3.4,1.2.3.5 ssh-rsa old comment\n"
+            "@revoked 1.2.3.4 ssh-rsa old\n"
+            "{} ssh-rsa old\n"
+            "{} ssh-rsa old\n"
+            "1.2.3.* ssh-rsa old"
+            .format(hashed("1.2.3.4"), hashed("1.2.3.5"))
+        )
+        os.chmod(self.path, 0o640)
+        self.assertEqual(self.add("1.2.3.4", "ssh-rsa", "new"), (1, 3))
+        self.assertEqual(self.read(), (
+            "# 1.2.3.4 ssh-rsa old\n"
+            "1.2.3.4 ssh-ed25519 other\n"
+            "host,1.2.3.5 ssh-rsa old comment\n"
+            "@revoked 1.2.3.4 ssh-rsa old\n"
+            "{} ssh-rsa old\n"
+            "1.2.3.* ssh-rsa old\n"
+            "1.2.3.4 ssh-rsa new\n"
+            .format(hashed("1.2.3.5"))
+        ))
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o640)
+
+    def test_hashed(self) -> None:
+        self.write("{} ssh-rsa a\n|1|x|y ssh-rsa a\n".format(
+            hashed("1.2.3.4")
+        ))
+        self.assertEqual(self.add("1.2.3.4", "ssh-rsa", "a"), (0, 0))
+        self.assertEqual(self.add("1.2.3.5", "ssh-rsa", "a"), (1, 0))
+
+    def test_symlink(self) -> None:
+        target = os.path.join(self.tmp.name, "target")
+        with open(target, "w") as f:
+            f.write("1.2.3.4 ssh-rsa a")
+        os.symlink(target, self.path)
+
+        self.assertEqual(self.add("1.2.3.5", "ssh-rsa", "b"), (1, 0))
+        self.assertTrue(os.path.islink(self.path))
+        self.assertEqual(self.read(), "1.2.3.4 ssh-rsa a\n1.2.3.5 ssh-rsa b\n")
+
+    @patch("os.replace")
+    def test_failure(self, mock: MagicMock) -> None:
+        mock.side_effect = OSError("failure")
+        self.write("1.2.3.4 ssh-rsa a\n")
+        with self.assertRaises(OSError):
+            self.add("1.2.3.4", "ssh-rsa", "b")
+        self.assertEqual(os.listdir(self.tmp.name), ["known_hosts"])
+        self.assertEqual(self.read(), "1.2.3.4 ssh-rsa a\n")
@@ -0,0 +1,148 @@
+import threading
+import time
+from typing import List
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pklookup import limits
+
+
+@patch("time.sleep")
+@patch("time.monotonic")
+class RateLimiterTest(TestCase):
+    def test_burst(self, monotonic: MagicMock, sleep: MagicMock) -> None:
+        monotonic.return_value = 100
+        limiter = limits.RateLimiter(10, burst=3)
+
+        for _ in range(3):
+            self.assertTrue(limiter.acquire())
+        self.assertEqual(sleep.call_count, 0)
+
+        self.assertTrue(limiter.acquire())
+        sleep.assert_called_once_with(0.1)
+
+    def test_refill(self, monotonic: MagicMock, sleep: MagicMock) -> None:
+        monotonic.return_value = 100
+        limiter = limits.RateLimiter(2, burst=2)
+        limiter.acquire()
+        limiter.acquire()
+
+        monotonic.return_value = 101
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(sleep.call_count, 0)
+
+        monotonic.return_value = 200
+        for _ in range(2):
+            limiter.acquire()
+        self.assertEqual(sleep.call_count, 0)
+
+    def test_queue(self, monotonic: MagicMock, sleep: MagicMock) -> None:
+        monotonic.return_value = 100
+        limiter = limits.RateLimiter(4, burst=1)
+
+        for _ in range(4):
+            limiter.acquire()
+
+        delays = [args[0] for args, _ in sleep.call_args_list]
+        self.assertEqual(delays, [0.25, 0.5, 0.75])
+
+    def test_timeout(self, monotonic: MagicMock, sleep: MagicMock) -> None:
+        monotonic.return_value = 100
+        limiter = limits.RateLimiter(1, burst=1)
+
+        self.assertTrue(limiter.acquire(timeout=0))
+        self.assertFalse(limiter.acquire(timeout=0.5))
+        self.assertTrue(limiter.acquire(timeout=1))
+        sleep.assert_called_once_with(1)
+
+    def test_invalid(self, monotonic: MagicMock, sleep: MagicMock) -> None:
+        with self.assertRaises(ValueError):
+            limits.RateLimiter(0)
+
+
+class ConcurrencyLimiterTest(TestCase):
+    def test_increase(self) -> None:
+        limiter = limits.ConcurrencyLimiter(initial=2, maximum=4)
+
+        for _ in range(100):
+            limiter.acquire()
+            limiter.release(0.1)
+
+        self.assertEqual(limiter.limit, 4)
+
+    def test_overloaded(self) -> None:
+        limiter = limits.ConcurrencyLimiter(initial=8, maximum=8)
+
+        limiter.acquire()
+        limiter.release(0.1, overloaded=True)
+
+        self.assertEqual(limiter.limit, 4)
+
+    def test_minimum(self) -> None:
+        limiter = limits.ConcurrencyLimiter(initial=8, minimum=2)
+
+        for _ in range(10):
+            limiter.acquire()
+            limiter.release(0, overloaded=True)
+
+        self.assertEqual(limiter.limit, 2)
+
+    @patch("time.monotonic")
+    def test_once_per_round_trip(self, monotonic: MagicMock) -> None:
+        monotonic.return_value = 100
+        limiter = limits.ConcurrencyLimiter(initial=8, maximum=8)
+
+        for _ in range(3):
+            limiter.acquire()
+        for _ in range(3):
+            limiter.release(1, overloaded=True)
+        self.assertEqual(limiter.limit, 4)
+
+        monotonic.return_value = 101
+        limiter.acquire()
+        limiter.release(1, overloaded=True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_latency(self) -> None:
+        limiter = limits.ConcurrencyLimiter(initial=8, maximum=8)
+
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(0.1)
+        self.assertEqual(limiter.limit, 8)
+
+        limiter.acquire()
+        limiter.release(0.15)
+        self.assertEqual(limiter.limit, 8)
+
+        limiter.acquire()
+        limiter.release(1)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_timeout(self) -> None:
+        limiter = limits.ConcurrencyLimiter(initial=1)
+
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        limiter.release(0)
+        self.assertTrue(limiter.acquire(timeout=0.01))
+
+    def test_threads(self) -> None:
+        limiter = limits.ConcurrencyLimiter(initial=3, maximum=3)
+        peak = []  # type: List[int]
+
+        def work() -> None:
+            limiter.acquire()
+            peak.append(limiter.inflight)
+            time.sleep(0.01)
+            limiter.release(0.01)
+
+        threads = [threading.Thread(target=work) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(max(peak), 3)
+        self.assertEqual(limiter.inflight, 0)
@@ -0,0 +1,162 @@
+import json
+import os
+import stat
+import tempfile
+from typing import Optional
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pklookup import metrics, www
+
+
+def timing(
+        target: str = "/api/v1/server",
+        method: str = "GET",
+        status: Optional[int] = 200,
+        seconds: float = 0.02,
+        error: Optional[BaseException] = None,
+) -> www.Timing:
+    res = www.Timing(method, target)
+    res.status = status
+    res.phases["ttfb"] = seconds
+    res.error = error
+    return res
+
+
+class HistogramTest(TestCase):
+    def test_buckets(self) -> None:
+        hist = metrics.Histogram()
+        for value in [0.001, 0.02, 0.02, 100]:
+            hist.observe(value)
+
+        buckets = dict(hist.buckets())
+        self.assertEqual(buckets["0.005"], 1)
+        self.assertEqual(buckets["0.01"], 1)
+        self.assertEqual(buckets["0.025"], 3)
+        self.assertEqual(buckets["60"], 3)
+        self.assertEqual(buckets["+Inf"], 4)
+        self.assertEqual(hist.count, 4)
+        self.assertAlmostEqual(hist.sum, 100.041)
+
+    def test_quantile(self) -> None:
+        hist = metrics.Histogram()
+        self.assertEqual(hist.quantile(0.99), 0)
+
+        for _ in range(100):
+            hist.observe(0.2)
+        self.assertAlmostEqual(hist.quantile(0.5), 0.175)
+        self.assertAlmostEqual(hist.quantile(1), 0.25)
+
+        hist.observe(1000)
+        self.assertEqual(hist.quantile(1), 60)
+
+
+class MetricsTest(TestCase):
+    def test_counters(self) -> None:
+        m = metrics.Metrics()
+        m(timing())
+        m(timing())
+        m(timing("/api/v1/token?limit=5", "POST", 403))
+        m(timing(status=None, error=ConnectionRefusedError()))
+
+        self.assertEqual(m.requests[("GET", "server", "200")], 2)
+        self.assertEqual(m.requests[("GET", "server", "error")], 1)
+        self.assertEqual(m.requests[("POST", "token", "403")], 1)
+        self.assertEqual(m.errors[("POST", "token", "HTTP 403")], 1)
+        self.assertEqual(
+            m.errors[("GET", "server", "ConnectionRefusedError")], 1
+        )
+        self.assertEqual(m.latencies[("GET", "server")].count, 3)
+
+    def test_absolute_target(self) -> None:
+        m = metrics.Metrics()
+        m(timing("http://example.com:80/api/v1/token/"))
+        m(timing("/"))
+
+        self.assertEqual(m.requests[("GET", "token", "200")], 1)
+        self.assertEqual(m.requests[("GET", "/", "200")], 1)
+
+    def test_prometheus(self) -> None:
+        m = metrics.Metrics()
+        m(timing(seconds=0.02))
+        m(timing(status=503))
+
+        text = m.prometheus()
+        self.assertIn("# TYPE pklookup_requests_total counter\n", text)
+        self.assertIn(
+            'pklookup_requests_total{method="GET",path="server",'
+            'status="200"} 1\n',
+            text,
+        )
+        self.assertIn(
+            'pklookup_request_errors_total{cause="HTTP 503",method="GET",'
+            'path="server"} 1\n',
+            text,
+        )
+        self.assertIn(
+            'pklookup_request_duration_seconds_bucket{le="0.01",'
+            'method="GET",path="server"} 0\n',
+            text,
+        )
+        self.assertIn(
+            'pklookup_request_duration_seconds_bucket{le="+Inf",'
+            'method="GET",path="server"} 2\n',
+            text,
+        )
+        self.assertIn(
+            'pklookup_request_duration_seconds_count{method="GET",'
+            'path="server"} 2\n',
+            text,
+        )
+
+    def test_escape(self) -> None:
+        self.assertEqual(
+            metrics._labels(a='x"y\\z\n'), '{a="x\\"y\\\\z\\n"}'
+        )
+
+    def test_json(self) -> None:
+        m = metrics.Metrics()
+        for _ in range(10):
+            m(timing())
+
+        doc = json.loads(m.json())
+        self.assertEqual(len(doc["requests"]), 1)
+        self.assertEqual(doc["requests"][0]["status"], "200")
+        self.assertEqual(doc["requests"][0]["count"], 10)
+        self.assertEqual(doc["errors"], [])
+        latency = doc["latency"][0]
+        self.assertEqual(latency["count"], 10)
+        self.assertEqual(latency["buckets"]["+Inf"], 10)
+        self.assertTrue(0.01 < latency["p99"] <= 0.025)
+
+    def test_write(self) -> None:
+        m = metrics.Metrics()
+        m(timing())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pklookup.prom")
+            with open(path, "w") as f:
+                f.write("old")
+
+            m.write(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), m.prometheus())
+            self.assertEqual(os.listdir(tmp), ["pklookup.prom"])
+            self.assertTrue(os.stat(path).st_mode & stat.S_IROTH)
+
+            m.write(path, "json")
+            with open(path) as f:
+                self.assertEqual(json.load(f)["requests"][0]["count"], 1)
+
+    @patch("os.replace")
+    def test_write_failure(self, mock: MagicMock) -> None:
+        mock.side_effect = OSError("failure")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(OSError):
+                metrics.Metrics().write(os.path.join(tmp, "x.prom"))
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_invalid_format(self) -> None:
+        with self.assertRaises(ValueError):
+            metrics.Metrics().write("x", "xml")
@@ -0,0 +1,274 @@
+import os
+import sqlite3
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional
+from unittest import TestCase
+
+from pklookup.mirror import (
+    Mirror,
+    fingerprint,
+    matches,
+    parse_query,
+    parse_time,
+    sort_records,
+)
+
+KEY = "AAAAC3NzaC1lZDI1NTE5AAAAIF6fuN6TrGWvymbGwMGmmxvrsiMcyLo459m0glLeSE8M"
+FINGERPRINT = "SHA256:nQ4r5T1dQHBPpQCZCrbZEQ3XuJGrLr5jJHbIEyXyq+E"
+
+
+def server(i: int) -> Dict:
+    return {
+        "id": str(i),
+        "token_id": "1",
+        "ip": "10.0.0.{}".format(i),
+        "port": "22",
+        "key_type": "ssh-ed25519",
+        "key_data": KEY if i == 1 else "AAAA{:04d}".format(i),
+        "key_comment": "",
+        "created": "2026-10-{:02d}".format(i),
+    }
+
+
+class MirrorTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mirror = Mirror(os.path.join(self.tmp.name, "sub", "db"))
+
+    def tearDown(self) -> None:
+        self.mirror.close()
+        self.tmp.cleanup()
+
+    def test_sync(self) -> None:
+        self.assertIsNone(self.mirror.synced("server"))
+        servers = [server(i) for i in range(1, 4)]
+        self.assertEqual(self.mirror.sync("server", servers), (3, 0))
+        self.assertIsNotNone(self.mirror.synced("server"))
+        self.assertIsNone(self.mirror.synced("token"))
+
+        records = list(self.mirror.records("server"))
+        self.assertEqual([r["id"] for r in records], [1, 2, 3])
+        self.assertEqual(records[0]["ip"], "10.0.0.1")
+        self.assertEqual(len(list(self.mirror.records("server", 2))), 2)
+
+        servers = [server(i) for i in (1, 3, 4, 5)]
+        self.assertEqual(self.mirror.sync("server", servers), (2, 1))
+        ids = [r["id"] for r in self.mirror.records("server")]
+        self.assertEqual(ids, [1, 3, 4, 5])
+        self.assertEqual(self.mirror.sync("server", servers), (0, 0))
+
+    def test_get(self) -> None:
+        self.mirror.sync("token", [
+            {"id": 7, "role": "admin", "description": "", "created": "x"},
+        ])
+        token = self.mirror.get("token", 7)
+        assert token is not None
+        self.assertEqual(token["role"], "admin")
+        self.assertIsNone(self.mirror.get("token", 8))
+
+    def test_failure(self) -> None:
+        self.mirror.sync("server", [server(1), server(2)])
+
+        def records() -> Iterator[Dict]:
+            yield server(3)
+            raise sqlite3.OperationalError("failure")
+
+        with self.assertRaises(sqlite3.OperationalError):
+            self.mirror.sync("server", records())
+        ids = [r["id"] for r in self.mirror.records("server")]
+        self.assertEqual(ids, [1, 2])
+
+        with self.assertRaises(KeyError):
+            self.mirror.sync("server", [{"id": 9}])
+        with self.assertRaises(TypeError):
+            self.mirror.sync("server", [dict(server(9), id="x")])
+        self.assertEqual(len(list(self.mirror.records("server"))), 2)
+
+    def test_lookup(self) -> None:
+        servers = [server(i) for i in range(1, 4)]
+        servers[2]["ip"] = "10.0.0.1"
+        servers[2]["port"] = 2222
+        self.mirror.sync("server", servers)
+
+        def ids(query: str) -> List[int]:
+            return [r["id"] for r in self.mirror.lookup(parse_query(query))]
+
+        self.assertEqual(ids("10.0.0.1"), [1, 3])
+        self.assertEqual(ids("10.0.0.1:22"), [1])
+        self.assertEqual(ids("[10.0.0.1]:2222"), [3])
+        self.assertEqual(ids("10.0.0.9"), [])
+        self.assertEqual(ids(FINGERPRINT), [1])
+        self.assertEqual(ids(KEY), [1])
+        self.assertEqual(ids("ssh-ed25519 {} comment".format(KEY)), [1])
+        self.assertEqual(ids("ssh-rsa {}".format(KEY)), [])
+        record = self.mirror.lookup(parse_query(KEY))[0]
+        self.assertEqual(record["ip"], "10.0.0.1")
+        self.assertEqual(record["fingerprint"], FINGERPRINT)
+
+    def test_filters(self) -> None:
+        self.mirror.sync("server", [server(i) for i in range(1, 6)])
+
+        def ids(limit: Optional[int] = None, **filters: Any) -> List[int]:
+            records = self.mirror.records("server", limit, filters)
+            return [r["id"] for r in records]
+
+        self.assertEqual(ids(port=22, ip="10.0.0.2"), [2])
+        self.assertEqual(ids(created_after="2026-10-02"), [3, 4, 5])
+        self.assertEqual(ids(2, created_after="2026-10-02"), [3, 4])
+        self.assertEqual(ids(2, token_id=1), [1, 2])
+        with self.assertRaises(ValueError):
+            ids(role="admin")
+
+    def test_sort(self) -> None:
+        servers = [server(i) for i in range(1, 6)]
+        servers[1]["port"] = 2222
+        servers[3]["port"] = 80
+        self.mirror.sync("server", servers)
+
+        def ids(limit: Optional[int] = None, **kwargs: Any) -> List[int]:
+            records = self.mirror.records("server", limit, **kwargs)
+            return [r["id"] for r in records]
+
+        self.assertEqual(ids(sort="-id"), [5, 4, 3, 2, 1])
+        self.assertEqual(ids(2, sort="-port"), [2, 4])
+        self.assertEqual(ids(3, sort="port"), [1, 3, 5])
+        self.assertEqual(
+            ids(2, sort="-created", filters={"created_after": "2026-10-02"}),
+            [5, 4],
+        )
+        with self.assertRaises(ValueError):
+            ids(sort="fingerprint")
+
+    def test_sort_rfc_1123(self) -> None:
+        servers = [server(i) for i in range(1, 5)]
+        for record, created in zip(servers, [
+                "Mon, 05 Oct 2026 10:00:00 GMT",
+                "Fri, 02 Oct 2026 10:00:00 GMT",
+                "Tue, 06 Oct 2026 10:00:00 GMT",
+                "Thu, 01 Oct 2026 10:00:00 GMT",
+        ]):
+            record["created"] = created
+        self.mirror.sync("server", servers)
+
+        def ids(limit: Optional[int] = None, **kwargs: Any) -> List[int]:
+            records = self.mirror.records("server", limit, **kwargs)
+            return [r["id"] for r in records]
+
+        self.assertEqual(ids(sort="created"), [4, 2, 1, 3])
+        self.assertEqual(ids(2, sort="-created"), [3, 1])
+        self.assertEqual(
+            ids(1, sort="created", filters={"token_id": 1}), [4]
+        )
+
+    def test_migrate(self) -> None:
+        path = os.path.join(self.tmp.name, "old")
+        with sqlite3.connect(path) as conn:
+            conn.execute(
+                "CREATE TABLE server (id INTEGER PRIMARY KEY, token_id, ip, "
+                "port, key_type, key_data, key_comment, created)"
+            )
+            conn.execute(
+                "INSERT INTO server VALUES (1, 1, 'a', 22, 't', ?, '', '')",
+                (KEY,),
+            )
+        conn.close()
+
+        with Mirror(path) as mirror:
+            self.assertEqual(
+                [r["id"] for r in mirror.lookup({"fingerprint": FINGERPRINT})],
+                [1],
+            )
+
+    def test_old_sync_table(self) -> None:
+        path = os.path.join(self.tmp.name, "old")
+        with sqlite3.connect(path) as conn:
+            conn.execute(
+                "CREATE TABLE sync (name TEXT PRIMARY KEY, watermark INTEGER, "
+                "created, synced REAL)"
+            )
+        conn.close()
+
+        with Mirror(path) as mirror:
+            mirror.sync("server", [server(1)])
+            self.assertIsNotNone(mirror.synced("server"))
+
+
+class QueryTest(TestCase):
+    def test_fingerprint(self) -> None:
+        self.assertEqual(fingerprint(KEY), FINGERPRINT)
+        self.assertIsNone(fingerprint("not base64!"))
+
+    def test_parse(self) -> None:
+        self.assertEqual(parse_query(" 1.2.3.4 "), {"ip": "1.2.3.4"})
+        self.assertEqual(
+            parse_query("1.2.3.4:22"), {"ip": "1.2.3.4", "port": 22}
+        )
+        self.assertEqual(parse_query("::1"), {"ip": "::1"})
+        self.assertEqual(parse_query("[::1]:22"), {"ip": "::1", "port": 22})
+        self.assertEqual(
+            parse_query(FINGERPRINT), {"fingerprint": FINGERPRINT}
+        )
+        self.assertEqual(parse_query(KEY), {"key_data": KEY})
+        self.assertEqual(parse_query(KEY + " user"), {"key_data": KEY})
+        self.assertEqual(
+            parse_query("ssh-ed25519 " + KEY),
+            {"key_type": "ssh-ed25519", "key_data": KEY},
+        )
+        for query in ["", "example.com", "[::1]", "1.2.3.4:ssh"]:
+            with self.assertRaises(ValueError):
+                parse_query(query)
+
+    def test_matches(self) -> None:
+        record = server(1)
+        self.assertTrue(matches(record, {"ip": "10.0.0.1", "port": 22}))
+        self.assertTrue(matches(record, {"fingerprint": FINGERPRINT}))
+        self.assertFalse(matches(record, {"ip": "10.0.0.2"}))
+        self.assertFalse(matches(server(2), {"fingerprint": FINGERPRINT}))
+
+    def test_created_after(self) -> None:
+        record = server(3)
+        self.assertTrue(matches(record, {"created_after": "2026-10-02"}))
+        self.assertFalse(matches(record, {"created_after": "2026-10-03"}))
+        record["created"] = "..."
+        self.assertTrue(matches(record, {"created_after": "2026-10-03"}))
+
+    def test_parse_time(self) -> None:
+        expected = 1792198923.0
+        for value in [
+                expected,
+                "1792198923",
+                "2026-10-17T01:02:03",
+                "2026-10-17T01:02:03Z",
+                "2026-10-17 03:32:03+02:30",
+                "Sat, 17 Oct 2026 01:02:03 GMT",
+        ]:
+            self.assertEqual(parse_time(value), expected, value)
+        self.assertEqual(parse_time("2026-10-17T01:02:03.25"), expected + .25)
+        for value in ["yesterday", "2026-13-01", "2026-10-17T01"]:
+            with self.assertRaises(ValueError):
+                parse_time(value)
+
+    def test_sort_records(self) -> None:
+        records = [server(i) for i in (3, 1, 2, 4)]
+        records[0]["port"] = "2222"
+        records[2]["port"] = 80
+        records[3]["created"] = "..."
+
+        def ids(sort: str, limit: Optional[int] = None) -> List[str]:
+            return [r["id"] for r in sort_records(records, sort, limit)]
+
+        self.assertEqual(ids("id"), ["1", "2", "3", "4"])
+        self.assertEqual(ids("-id", 2), ["4", "3"])
+        self.assertEqual(ids("port"), ["1", "4", "2", "3"])
+        self.assertEqual(ids("-port", 1), ["3"])
+        self.assertEqual(ids("created", 3), ["1", "2", "3"])
+        self.assertEqual(ids("-created", 1), ["4"])
+        self.assertEqual(ids("key_type", 2), ["3", "1"])
+        self.assertEqual(ids("ip", 0), [])
+
+        def generate() -> Iterator[Dict]:
+            yield from records
+            yield {"id": "5"}
+
+        with self.assertRaises(KeyError):
+            sort_records(generate(), "port", 2)
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from unittest import TestCase
+
+from pklookup.output import (
+    CSVWriter,
+    JSONWriter,
+    NDJSONWriter,
+    TSVWriter,
+    Writer,
+)
+
+HEADER = ["id", "ip", "key_comment"]
+ROWS = [
+    {"id": 1, "ip": "1.2.3.4", "key_comment": "a, \"b\"\tc\nd\\", "x": 0},
+    {"id": 2, "ip": "::1", "key_comment": None},
+]
+
+
+class WriterTest(TestCase):
+    def write(self, cls: type) -> str:
+        out = io.StringIO()
+        writer = cls(out, HEADER)  # type: Writer
+        for row in ROWS:
+            writer.write(row)
+        writer.close()
+        return out.getvalue()
+
+    def test_json(self) -> None:
+        data = self.write(JSONWriter)
+        self.assertEqual(
+            json.loads(data), [{k: r[k] for k in HEADER} for r in ROWS]
+        )
+        self.assertEqual(len(data.splitlines()), 4)
+
+        out = io.StringIO()
+        JSONWriter(out, HEADER).close()
+        self.assertEqual(json.loads(out.getvalue()), [])
+
+    def test_ndjson(self) -> None:
+        lines = self.write(NDJSONWriter).splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{k: r[k] for k in HEADER} for r in ROWS],
+        )
+        self.assertEqual(list(json.loads(lines[0])), HEADER)
+
+    def test_csv(self) -> None:
+        rows = list(csv.reader(io.StringIO(self.write(CSVWriter))))
+        self.assertEqual(rows[0], HEADER)
+        self.assertEqual(rows[1], ["1", "1.2.3.4", ROWS[0]["key_comment"]])
+        self.assertEqual(rows[2], ["2", "::1", ""])
+
+    def test_tsv(self) -> None:
+        self.assertEqual(self.write(TSVWriter), (
+            "id\tip\tkey_comment\n"
+            "1\t1.2.3.4\ta, \"b\"\\tc\\nd\\\\\n"
+            "2\t::1\t\n"
+        ))
+
+    def test_missing_column(self) -> None:
+        writer = NDJSONWriter(io.StringIO(), HEADER)
+        with self.assertRaises(KeyError):
+            writer.write({"id": 1})
+
+    def test_streaming(self) -> None:
+        out = io.StringIO()
+        writer = NDJSONWriter(out, HEADER)
+        writer.write(ROWS[0])
+        self.assertEqual(len(out.getvalue().splitlines()), 1)
+        self.assertEqual(writer.count, 1)
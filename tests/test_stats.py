@@ -0,0 +1,77 @@
+import json
+from typing import Dict
+from unittest import TestCase
+
+from pklookup.stats import ServerStats
+
+KEY = "AAAAC3NzaC1lZDI1NTE5AAAAIF6fuN6TrGWvymbGwMGmmxvrsiMcyLo459m0glLeSE8M"
+FINGERPRINT = "SHA256:nQ4r5T1dQHBPpQCZCrbZEQ3XuJGrLr5jJHbIEyXyq+E"
+
+
+def server(i: int) -> Dict:
+    return {
+        "id": i,
+        "token_id": i % 2,
+        "ip": "10.0.0.{}".format(i % 3),
+        "port": 22,
+        "key_type": "ssh-ed25519" if i < 3 else "ssh-rsa",
+        "key_data": KEY if i % 4 == 0 else "AAAA{}".format(i),
+        "key_comment": "",
+        "created": "2026-{:02d}-17T00:00:00Z".format(i // 2 + 1),
+    }
+
+
+class ServerStatsTest(TestCase):
+    def setUp(self) -> None:
+        self.stats = ServerStats()
+        for i in range(6):
+            self.stats.add(server(i))
+
+    def test_counts(self) -> None:
+        self.assertEqual(self.stats.count, 6)
+        self.assertEqual(
+            self.stats.key_types, {"ssh-ed25519": 3, "ssh-rsa": 3}
+        )
+        self.assertEqual(self.stats.token_ids, {"0": 3, "1": 3})
+
+    def test_histogram(self) -> None:
+        self.stats.add(dict(server(6), created="..."))
+        self.stats.add(dict(server(7), created=1e20))
+        self.stats.add(dict(server(8), created="2026-03-01"))
+        self.stats.add(dict(server(9), created="2026-13-01"))
+        self.stats.add(dict(server(10), created="2026-01-01T12:00+14:00"))
+        self.assertEqual(self.stats.histogram(), [
+            {"created": "2025-12", "count": 1, "histogram": "#" * 13},
+            {"created": "2026-01", "count": 2, "histogram": "#" * 27},
+            {"created": "2026-02", "count": 2, "histogram": "#" * 27},
+            {"created": "2026-03", "count": 3, "histogram": "#" * 40},
+            {"created": "unknown", "count": 3, "histogram": "#" * 40},
+        ])
+
+        stats = ServerStats("year")
+        stats.add(server(1))
+        self.assertEqual(stats.histogram()[0]["created"], "2026")
+        self.assertEqual(ServerStats().histogram(), [])
+
+    def test_duplicates(self) -> None:
+        self.assertEqual(self.stats.duplicate_keys, {FINGERPRINT: [0, 4]})
+        self.assertEqual(self.stats.duplicate_ips, {
+            "10.0.0.0": [0, 3],
+            "10.0.0.1": [1, 4],
+            "10.0.0.2": [2, 5],
+        })
+
+        self.stats.add(dict(server(6), key_data="AAAA1"))
+        self.assertEqual(self.stats.duplicate_keys["AAAA1"], [1, 6])
+
+    def test_to_dict(self) -> None:
+        data = json.loads(json.dumps(self.stats.to_dict()))
+        self.assertEqual(data["count"], 6)
+        self.assertEqual(data["created"], {
+            "2026-01": 2, "2026-02": 2, "2026-03": 2,
+        })
+        self.assertEqual(data["duplicate_keys"], {FINGERPRINT: [0, 4]})
+
+    def test_missing_column(self) -> None:
+        with self.assertRaises(KeyError):
+            self.stats.add({"id": 9})
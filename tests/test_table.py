@@ -0,0 +1,66 @@
+from typing import Any, Dict, List
+from unittest import TestCase
+
+from pklookup.table import Table
+
+HEADER = ["id", "ip", "key_data"]
+KEY = "AAAAC3NzaC1lZDI1NTE5AAAAIF6fuN6TrGWvymbGwMGmmxvrsiMcyLo459m0glLeSE8M"
+
+
+def rows(*ids: int) -> List[Dict[str, Any]]:
+    return [
+        {"id": i, "ip": "10.0.0.{}".format(i), "key_data": KEY, "x": None}
+        for i in ids
+    ]
+
+
+class TableTest(TestCase):
+    def test_lines(self) -> None:
+        lines = list(Table(HEADER).lines(rows(1, 2)))
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[0], "+----+----------+{}+".format(
+            "-" * (len(KEY) + 2)
+        ))
+        self.assertEqual(lines[1].split("|")[1:3], [" id ", "    ip    "])
+        self.assertEqual(lines[2], lines[0].replace("-", "="))
+        self.assertEqual(lines[3], "| 1  | 10.0.0.1 | {} |".format(KEY))
+        self.assertEqual(lines[5], lines[0])
+        self.assertEqual(len(set(len(line) for line in lines)), 1)
+
+    def test_empty(self) -> None:
+        lines = list(Table(HEADER).lines([]))
+        self.assertEqual(lines[1], "| id | ip | key_data |")
+        self.assertEqual(len(lines), 4)
+
+    def test_sample(self) -> None:
+        lines = list(Table(HEADER, sample=1).lines(rows(1, 10)))
+        self.assertEqual(lines[3], "| 1  | 10.0.0.1 | {} |".format(KEY))
+        self.assertEqual(lines[4], "| 10 | 10.0.0.10 | {} |".format(KEY))
+
+    def test_elide(self) -> None:
+        lines = list(Table(HEADER, max_width=40).lines(rows(1, 2)))
+        self.assertTrue(all(len(line) == 40 for line in lines))
+        self.assertEqual(lines[3], "| 1  | 10.0.0.1 | AAAAC3Nza...glLeSE8M |")
+
+    def test_truncate(self) -> None:
+        table = Table(HEADER, max_width=40, overflow="truncate")
+        lines = list(table.lines(rows(1)))
+        self.assertEqual(lines[3], "| 1  | 10.0.0.1 | AAAAC3NzaC1lZDI1N... |")
+
+    def test_none(self) -> None:
+        table = Table(HEADER, max_width=40, overflow="none")
+        lines = list(table.lines(rows(1)))
+        self.assertIn(KEY, lines[3])
+
+    def test_narrow(self) -> None:
+        table = Table(HEADER, max_width=10)
+        lines = list(table.lines(rows(1)))
+        self.assertEqual(lines[3], "| 1  | 10.0.0.1 | AAA...8M |")
+
+    def test_row(self) -> None:
+        lines = list(Table(["id", "x"]).lines([{"id": "a\r\nb", "x": None}]))
+        self.assertEqual(lines[3], "| a  b | None |")
+        with self.assertRaises(KeyError):
+            list(Table(HEADER).lines([{"id": 1}]))
+        with self.assertRaises(ValueError):
+            Table(HEADER, overflow="wrap")
@@ -1,15 +1,37 @@
+import email.utils
+import gzip
+import http.client
 import io
 import json
 import os
+import socket
 import ssl
-from typing import Any, Optional
-from unittest import TestCase, TestResult
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+from typing import Any, Dict, List, Optional
+from unittest import TestCase, TestResult, skipUnless
 from unittest.mock import MagicMock, patch
-from urllib.error import HTTPError
 
 from pklookup import www
+from pklookup.compression import ACCEPT_ENCODING
+from pklookup.formats import ACCEPT
 
-from .helpers import URLOpenMock
+from .helpers import HTTPConnectionMock, HTTPResponseMock
+
+try:
+    import cbor2
+    HAVE_CBOR = True
+except ImportError:
+    HAVE_CBOR = False
+
+try:
+    import msgpack
+    HAVE_MSGPACK = True
+except ImportError:
+    HAVE_MSGPACK = False
 
 
 # pylint: disable=protected-access,too-many-public-methods
@@ -124,148 +146,1690 @@ class SendOnlineTest(TestCase):
 # pylint: enable=protected-access,too-many-public-methods
 
 
-@patch("urllib.request.urlopen")
+@patch("pklookup.www.ConnectionPool.connect")
 class GetTest(TestCase):
     def test_method(self, mock: MagicMock) -> None:
-        mock.return_value = URLOpenMock()
+        mock.return_value = HTTPConnectionMock()
 
         www.WWW("https://example.com").get()
 
-        args, _kwargs = mock.call_args
-        req = args[0]
-        self.assertEqual(req.method, "GET")
+        self.assertEqual(mock.return_value.method, "GET")
 
     def test_auth_header(self, mock: MagicMock) -> None:
-        mock.return_value = URLOpenMock()
+        mock.return_value = HTTPConnectionMock()
 
         www.WWW("https://example.com", token="abcd").get()
 
-        args, _kwargs = mock.call_args
-        req = args[0]
-
-        self.assertEqual(req.headers, {"Authorization": "bearer abcd"})
+        headers = mock.return_value.headers
+        self.assertEqual(headers, {
+            "accept": ACCEPT,
+            "accept-encoding": ACCEPT_ENCODING,
+            "authorization": "bearer abcd",
+        })
 
     def test_data(self, mock: MagicMock) -> None:
-        mock.return_value = URLOpenMock()
+        mock.return_value = HTTPConnectionMock()
 
-        www.WWW("https://example.com", token="abc").get(a="b", x="y")
-
-        args, _kwargs = mock.call_args
-        req = args[0]
+        www.WWW("https://example.com", token="abc").get(a="b", x="y z")
 
         headers = {
-            "Authorization": "bearer abc",
-            "Content-type": "application/json"
+            "accept": ACCEPT,
+            "accept-encoding": ACCEPT_ENCODING,
+            "authorization": "bearer abc",
         }
-        self.assertEqual(req.headers, headers)
+        self.assertEqual(mock.return_value.headers, headers)
+        self.assertTrue(mock.return_value.url.endswith("/?a=b&x=y+z"))
+        self.assertIsNone(mock.return_value.body)
 
-        data = {
-            "a": "b",
-            "x": "y",
-        }
-        self.assertEqual(json.loads(req.data.decode("utf-8")), data)
+    def test_query(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock()
+
+        www.WWW("https://example.com/api").get(
+            "server", id=[1, 2], ip=None, raw=True, q="a&b=c"
+        )
+
+        self.assertEqual(
+            mock.return_value.url,
+            "/api/server?id=1&id=2&q=a%26b%3Dc&raw=true",
+        )
+
+    def test_url(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock()
+
+        www.WWW("https://example.com/api/v1").get("server")
+
+        self.assertEqual(mock.return_value.url, "/api/v1/server")
+
+    def test_json(self, mock: MagicMock) -> None:
+        data = json.dumps({"servers": []}).encode("utf-8")
+        mock.return_value = HTTPConnectionMock(HTTPResponseMock(data))
+
+        res = www.WWW("https://example.com").get()
+
+        self.assertEqual(res, {"servers": []})
 
     def test_http_error_messsage(self, mock: MagicMock) -> None:
-        fp = io.BytesIO(json.dumps({"message": "xyz"}).encode("utf-8"))
-        exc = HTTPError("url", 403, "forbidden", {}, fp)
-        mock.return_value = URLOpenMock(b"msg", exc)
+        data = json.dumps({"message": "xyz"}).encode("utf-8")
+        res = HTTPResponseMock(data, status=403)
+        mock.return_value = HTTPConnectionMock(res)
 
-        with self.assertRaises(www.WWWError):
+        with self.assertRaisesRegex(www.WWWError, "^xyz$"):
             www.WWW("https://example.com").get()
 
     def test_http_error_no_messsage(self, mock: MagicMock) -> None:
-        fp = io.BytesIO(b"abcd")
-        exc = HTTPError("url", 403, "forbidden", {}, fp)
-        mock.return_value = URLOpenMock(b"msg", exc)
+        res = HTTPResponseMock(b"abcd", status=403)
+        mock.return_value = HTTPConnectionMock(res)
 
-        with self.assertRaises(www.WWWError):
+        with self.assertRaisesRegex(www.WWWError, "^abcd$"):
             www.WWW("https://example.com").get()
 
     def test_certificate_error(self, mock: MagicMock) -> None:
         exc = ssl.CertificateError()
-        mock.return_value = URLOpenMock(b"msg", exc)
+        mock.return_value = HTTPConnectionMock(exc)
 
         with self.assertRaises(www.WWWError):
             www.WWW("https://example.com").get()
 
+    def test_read_error(self, mock: MagicMock) -> None:
+        res = HTTPResponseMock(exception=ConnectionResetError())
+        mock.return_value = HTTPConnectionMock(res)
 
-@patch("urllib.request.urlopen")
+        with self.assertRaises(www.WWWError):
+            www.WWW("https://example.com").get()
+        self.assertTrue(mock.return_value.closed)
+
+    def test_invalid_scheme(self, mock: MagicMock) -> None:
+        with self.assertRaises(www.WWWError):
+            www.WWW("ftp://example.com").get()
+        self.assertEqual(mock.call_count, 0)
+
+
+@patch("pklookup.www.ConnectionPool.connect")
 class PostTest(TestCase):
     def test_method(self, mock: MagicMock) -> None:
-        mock.return_value = URLOpenMock()
+        mock.return_value = HTTPConnectionMock()
 
         www.WWW("https://example.com").post()
 
-        args, _kwargs = mock.call_args
-        req = args[0]
-        self.assertEqual(req.method, "POST")
+        self.assertEqual(mock.return_value.method, "POST")
 
     def test_auth_header(self, mock: MagicMock) -> None:
-        mock.return_value = URLOpenMock()
+        mock.return_value = HTTPConnectionMock()
 
         www.WWW("https://example.com", token="xyz").post()
 
-        args, _kwargs = mock.call_args
-        req = args[0]
-        self.assertEqual(req.headers, {"Authorization": "bearer xyz"})
+        headers = mock.return_value.headers
+        self.assertEqual(headers, {
+            "accept": ACCEPT,
+            "accept-encoding": ACCEPT_ENCODING,
+            "authorization": "bearer xyz",
+        })
 
     def test_data(self, mock: MagicMock) -> None:
-        mock.return_value = URLOpenMock()
+        mock.return_value = HTTPConnectionMock()
 
         www.WWW("https://example.com", token="abc").post(a="b", x="y")
 
-        args, _kwargs = mock.call_args
-        req = args[0]
-
         headers = {
-            "Authorization": "bearer abc",
-            "Content-type": "application/json"
+            "accept": ACCEPT,
+            "accept-encoding": ACCEPT_ENCODING,
+            "authorization": "bearer abc",
+            "content-type": "application/json"
         }
-        self.assertEqual(req.headers, headers)
+        self.assertEqual(mock.return_value.headers, headers)
 
         data = {
             "a": "b",
             "x": "y",
         }
-        self.assertEqual(json.loads(req.data.decode("utf-8")), data)
+        body = mock.return_value.body
+        self.assertEqual(json.loads(body.decode("utf-8")), data)
 
 
-@patch("urllib.request.urlopen")
+@patch("pklookup.www.ConnectionPool.connect")
 class DeleteTest(TestCase):
     def test_method(self, mock: MagicMock) -> None:
-        mock.return_value = URLOpenMock()
+        mock.return_value = HTTPConnectionMock()
 
         www.WWW("https://example.com").delete()
 
-        args, _kwargs = mock.call_args
-        req = args[0]
-        self.assertEqual(req.method, "DELETE")
+        self.assertEqual(mock.return_value.method, "DELETE")
 
     def test_auth_header(self, mock: MagicMock) -> None:
-        mock.return_value = URLOpenMock()
+        mock.return_value = HTTPConnectionMock()
 
         www.WWW("https://example.com", token="xyz").delete()
 
-        args, _kwargs = mock.call_args
-        req = args[0]
-        self.assertEqual(req.headers, {"Authorization": "bearer xyz"})
+        headers = mock.return_value.headers
+        self.assertEqual(headers, {
+            "accept": ACCEPT,
+            "accept-encoding": ACCEPT_ENCODING,
+            "authorization": "bearer xyz",
+        })
 
     def test_data(self, mock: MagicMock) -> None:
-        mock.return_value = URLOpenMock()
+        mock.return_value = HTTPConnectionMock()
 
         www.WWW("https://example.com", token="abc").delete(a="b", x="y")
 
-        args, _kwargs = mock.call_args
-        req = args[0]
-
         headers = {
-            "Authorization": "bearer abc",
-            "Content-type": "application/json",
+            "accept": ACCEPT,
+            "accept-encoding": ACCEPT_ENCODING,
+            "authorization": "bearer abc",
+            "content-type": "application/json",
         }
-        self.assertEqual(req.headers, headers)
+        self.assertEqual(mock.return_value.headers, headers)
 
         data = {
             "a": "b",
             "x": "y",
         }
-        self.assertEqual(json.loads(req.data.decode("utf-8")), data)
+        body = mock.return_value.body
+        self.assertEqual(json.loads(body.decode("utf-8")), data)
+
+
+# pylint: disable=protected-access
+@patch("pklookup.www.ConnectionPool.connect")
+class PoolTest(TestCase):
+    def test_reuse(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock()
+
+        w = www.WWW("https://example.com")
+        w.get("token")
+        w.post("server")
+        w.delete("server")
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(len(mock.return_value.requests), 3)
+
+    def test_will_close(self, mock: MagicMock) -> None:
+        res = HTTPResponseMock()
+        res.will_close = True
+        mock.side_effect = [HTTPConnectionMock(res), HTTPConnectionMock()]
+
+        w = www.WWW("https://example.com")
+        w.get()
+        w.get()
+
+        self.assertEqual(mock.call_count, 2)
+
+    def test_stale(self, mock: MagicMock) -> None:
+        stale = HTTPConnectionMock(
+            HTTPResponseMock(),
+            http.client.RemoteDisconnected("closed"),
+        )
+        fresh = HTTPConnectionMock(HTTPResponseMock(b"{}"))
+        mock.side_effect = [stale, fresh]
+
+        w = www.WWW("https://example.com")
+        w.get()
+        self.assertEqual(w.get(), {})
+
+        self.assertTrue(stale.closed)
+        self.assertEqual(mock.call_count, 2)
+        self.assertEqual(len(fresh.requests), 1)
+
+    def test_stale_write(self, mock: MagicMock) -> None:
+        class BrokenConnectionMock(HTTPConnectionMock):
+            def request(self, *args: Any, **kwargs: Any) -> None:
+                if self.requests:
+                    raise BrokenPipeError()
+                super().request(*args, **kwargs)
+
+        stale = BrokenConnectionMock(HTTPResponseMock())
+        fresh = HTTPConnectionMock(HTTPResponseMock(b"{}"))
+        mock.side_effect = [stale, fresh]
+
+        w = www.WWW("https://example.com")
+        w.get()
+        self.assertEqual(w.post(), {})
+        self.assertEqual(fresh.method, "POST")
+
+    def test_stale_post(self, mock: MagicMock) -> None:
+        stale = HTTPConnectionMock(
+            HTTPResponseMock(),
+            http.client.RemoteDisconnected("closed"),
+        )
+        mock.side_effect = [stale, HTTPConnectionMock()]
+
+        w = www.WWW("https://example.com")
+        w.get()
+        with self.assertRaisesRegex(www.WWWError, "closed"):
+            w.post()
+        self.assertEqual(mock.call_count, 1)
+
+    def test_fresh_reset(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(ConnectionResetError())
+
+        with self.assertRaises(www.WWWError):
+            www.WWW("https://example.com").get()
+        self.assertEqual(mock.call_count, 1)
+
+    def test_pool_size(self, mock: MagicMock) -> None:
+        conns = [HTTPConnectionMock() for _ in range(3)]
+        pool = www.ConnectionPool("https", "example.com", 443, maxsize=2)
+        mock.side_effect = conns
+
+        acquired = [pool.acquire()[0] for _ in range(3)]
+        for conn in acquired:
+            pool.release(conn)
+
+        self.assertEqual([c.closed for c in conns], [False, False, True])
+        self.assertEqual(pool.acquire(), (conns[1], True))
+
+    def test_threads(self, mock: MagicMock) -> None:
+        mock.side_effect = lambda: HTTPConnectionMock()
+        w = www.WWW("https://example.com", pool_size=2)
+
+        threads = [threading.Thread(target=w.get) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        pool = w._get_pool(urllib.parse.urlsplit("https://example.com"))
+        self.assertLessEqual(len(pool._idle), 2)
+        self.assertLessEqual(mock.call_count, 16)
+
+    def test_close(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock()
+
+        with www.WWW("https://example.com") as w:
+            w.get()
+        self.assertTrue(mock.return_value.closed)
+
+    @patch("ssl.create_default_context")
+    def test_context(self, context: MagicMock, mock: MagicMock) -> None:
+        mock.side_effect = lambda: HTTPConnectionMock()
+
+        w = www.WWW("https://example.com", cafile="ca.pem")
+        w.get()
+        w.get()
+
+        context.assert_called_once_with(cafile="ca.pem")
+
+
+# pylint: enable=protected-access
+
+
+class BatchTest(TestCase):
+    @patch("pklookup.www.ConnectionPool.connect")
+    def test_order(self, mock: MagicMock) -> None:
+        mock.side_effect = lambda: HTTPConnectionMock(
+            HTTPResponseMock(b'{"message": "ok"}')
+        )
+        requests = [("POST", "server", {"public_key": str(i)})
+                    for i in range(50)]
+
+        res = www.WWW("https://example.com", pool_size=4).batch(requests)
+
+        self.assertEqual(res, [{"message": "ok"}] * 50)
+        self.assertLessEqual(mock.call_count, 4)
+
+    @patch("pklookup.www.ConnectionPool.connect")
+    def test_error_without_message(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b'{"message": "ok"}'),
+            HTTPResponseMock(b'{"detail": "conflict"}', status=409),
+            HTTPResponseMock(b"[]", status=500),
+            HTTPResponseMock(b'{"message": "ok"}'),
+        )
+        requests = [("POST", "server", {"public_key": str(i)})
+                    for i in range(4)]
+
+        res = www.WWW("https://example.com").batch(requests, workers=1)
+
+        self.assertEqual(res[0], {"message": "ok"})
+        self.assertEqual(str(res[1]), "HTTP 409")
+        self.assertEqual(str(res[2]), "HTTP 500")
+        self.assertEqual(res[3], {"message": "ok"})
+
+    @patch("pklookup.www.WWW.delete")
+    @patch("pklookup.www.WWW.get")
+    def test_dispatch(self, get: MagicMock, delete: MagicMock) -> None:
+        get.side_effect = lambda path, **kwargs: {"id": kwargs["id"]}
+        delete.side_effect = www.WWWError("msg")
+        requests = [
+            ("get", "server", {"id": 1}),
+            ("DELETE", "server", {"id": 2}),
+            ("GET", "server", {"id": 3}),
+            ("PUT", "server", {}),
+        ]
+
+        res = www.WWW("https://example.com").batch(requests, workers=2)
+
+        self.assertEqual(res[0], {"id": 1})
+        self.assertTrue(isinstance(res[1], www.WWWError))
+        self.assertEqual(str(res[1]), "msg")
+        self.assertEqual(res[2], {"id": 3})
+        self.assertTrue(isinstance(res[3], www.WWWError))
+        delete.assert_called_once_with("server", id=2)
+
+    @patch("pklookup.www.WWW.get")
+    def test_workers(self, mock: MagicMock) -> None:
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def get(_path: str) -> Dict:
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+            return {}
+
+        mock.side_effect = get
+        w = www.WWW("https://example.com")
+        w.batch([("GET", "token", {})] * 20, workers=3)
+
+        self.assertEqual(mock.call_count, 20)
+        self.assertLessEqual(active[1], 3)
+
+
+class LengthResponseMock(HTTPResponseMock):
+    """
+    A response with a known length that is read in small pieces.
+    """
+
+    def __init__(self, data: bytes, length: Optional[int] = None) -> None:
+        super().__init__(data)
+        self.length = len(data) if length is None else length
+
+    def readinto(self, buf: memoryview) -> int:
+        data = self.read(min(len(buf), 3))
+        buf[:len(data)] = data
+        return len(data)
+
+
+class JSONDecodeTest(TestCase):
+    def test_stdlib(self) -> None:
+        with patch.dict("sys.modules", {"orjson": None, "ujson": None}):
+            loads = www.get_json_loads()
+        self.assertEqual(loads(b'{"a": [1]}'), {"a": [1]})
+        self.assertEqual(loads(memoryview(b'{"a": 2}')), {"a": 2})
+        with self.assertRaises(ValueError):
+            loads(b"Unauthorized Access")
+        with self.assertRaises(ValueError):
+            loads(b"\xff")
+
+        # Python 3.5 only decodes text.
+        with patch("json.loads", wraps=json.loads) as mock:
+            loads(b"{}")
+        self.assertIsInstance(mock.call_args[0][0], str)
+
+    def test_memoryview(self) -> None:
+        data = memoryview(bytearray(b'{"a": "\xc3\xa5"}xyz'))[:-3]
+        self.assertEqual(www.BaseWWW._decode(data), {"a": "\xe5"})
+
+    def test_message(self) -> None:
+        data = memoryview(b"Unauthorized Access")
+        self.assertEqual(
+            www.BaseWWW._decode(data), {"message": "Unauthorized Access"}
+        )
+
+    def test_invalid_utf8(self) -> None:
+        with self.assertRaises(ValueError):
+            www.BaseWWW._decode(b"\xff")
+
+
+@patch("pklookup.www.ConnectionPool.connect")
+class ReadIntoTest(TestCase):
+    def test_reuse(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            LengthResponseMock(b'{"servers": [1, 2, 3]}'),
+            LengthResponseMock(b'{"servers": []}'),
+        )
+
+        w = www.WWW("https://example.com")
+        self.assertEqual(w.get(), {"servers": [1, 2, 3]})
+        buf = w._local.buffer
+        self.assertEqual(w.get(), {"servers": []})
+        self.assertIs(w._local.buffer, buf)
+
+    def test_grow(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            LengthResponseMock(b"{}"),
+            LengthResponseMock(b'{"a": 1}'),
+        )
+
+        w = www.WWW("https://example.com")
+        w.get()
+        w.get()
+        self.assertEqual(len(w._local.buffer), 8)
+
+    def test_large(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(LengthResponseMock(b"{}"))
+
+        w = www.WWW("https://example.com")
+        with patch("pklookup.www.MAX_BUFFER_SIZE", 1):
+            self.assertEqual(w.get(), {})
+        self.assertFalse(hasattr(w._local, "buffer"))
+
+    def test_incomplete(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            LengthResponseMock(b'{"a": 1}', length=20)
+        )
+
+        w = www.WWW("https://example.com")
+        with self.assertRaisesRegex(www.WWWError, "IncompleteRead"):
+            w.get()
+        self.assertTrue(mock.return_value.closed)
+
+    def test_message(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            LengthResponseMock(b"Unauthorized Access")
+        )
+        mock.return_value.responses[0].status = 401
+
+        w = www.WWW("https://example.com")
+        with self.assertRaisesRegex(www.WWWError, "^Unauthorized Access$"):
+            w.get()
+
+
+@patch("pklookup.www.ConnectionPool.connect")
+class CompressionTest(TestCase):
+    def test_get(self, mock: MagicMock) -> None:
+        data = gzip.compress(b'{"servers": [1, 2]}')
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(data, headers={"Content-Encoding": "gzip"})
+        )
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW("https://example.com", hooks=[timings.append])
+        self.assertEqual(w.get("server"), {"servers": [1, 2]})
+        self.assertEqual(timings[0].received, len(data))
+        self.assertIn("decompress", timings[0].phases)
+
+    def test_readinto(self, mock: MagicMock) -> None:
+        res = LengthResponseMock(zlib.compress(b'{"a": 1}'))
+        res._headers["content-encoding"] = "deflate"
+        mock.return_value = HTTPConnectionMock(res)
+
+        self.assertEqual(www.WWW("https://example.com").get(), {"a": 1})
+
+    def test_identity(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"{}", headers={"content-encoding": "identity"})
+        )
+
+        self.assertEqual(www.WWW("https://example.com").get(), {})
+
+    def test_message(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(
+                gzip.compress(b"Unauthorized Access"),
+                status=401,
+                headers={"content-encoding": "gzip"},
+            )
+        )
+
+        with self.assertRaisesRegex(www.WWWError, "^Unauthorized Access$"):
+            www.WWW("https://example.com").get()
+
+    def test_unsupported(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"{}", headers={"content-encoding": "xz"})
+        )
+
+        with self.assertRaisesRegex(www.WWWError, "unsupported"):
+            www.WWW("https://example.com").get()
+        with self.assertRaisesRegex(www.WWWError, "unsupported"):
+            list(www.WWW("https://example.com").stream("server", "servers"))
+
+    def test_stream(self, mock: MagicMock) -> None:
+        servers = [{"id": i, "key_data": "AAAA" * 20} for i in range(2000)]
+        data = gzip.compress(json.dumps({"servers": servers}).encode())
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(data, headers={"content-encoding": "gzip"})
+        )
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW("https://example.com", hooks=[timings.append])
+        self.assertEqual(list(w.stream("server", "servers")), servers)
+        self.assertEqual(timings[0].received, len(data))
+
+    def test_stream_truncated(self, mock: MagicMock) -> None:
+        data = gzip.compress(b'{"servers": [1, 2]}')[:-4]
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(data, headers={"content-encoding": "gzip"})
+        )
+
+        with self.assertRaisesRegex(www.WWWError, "truncated"):
+            list(www.WWW("https://example.com").stream("server", "servers"))
+
+    def test_compress_post(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock()
+
+        w = www.WWW("https://example.com", compress_min=100)
+        w.post("server", public_key="abc")
+        self.assertNotIn("content-encoding", mock.return_value.headers)
+
+        w.post("server", public_key="a" * 100)
+        self.assertEqual(mock.return_value.headers["content-encoding"], "gzip")
+        body = json.loads(gzip.decompress(mock.return_value.body).decode())
+        self.assertEqual(body, {"public_key": "a" * 100})
+
+    def test_compress_unsupported(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"unsupported", status=415),
+            HTTPResponseMock(b'{"message": "ok"}'),
+        )
+
+        w = www.WWW("https://example.com", compress_min=0)
+        self.assertEqual(w.post("server", public_key="abc")["message"], "ok")
+        requests = mock.return_value.requests
+        self.assertEqual(len(requests), 2)
+        self.assertNotIn("content-encoding", requests[1]["headers"])
+        body = json.loads(requests[1]["body"].decode())
+        self.assertEqual(body, {"public_key": "abc"})
+
+        w.post("server", public_key="abc")
+        self.assertNotIn("content-encoding", requests[2]["headers"])
+
+
+@skipUnless(HAVE_MSGPACK and HAVE_CBOR, "msgpack or cbor2 is missing")
+@patch("pklookup.www.ConnectionPool.connect")
+class FormatTest(TestCase):
+    @staticmethod
+    def response(
+            data: bytes,
+            content_type: str,
+            status: int = 200,
+            encoding: Optional[str] = None,
+    ) -> HTTPResponseMock:
+        headers = {"content-type": content_type}
+        if encoding:
+            headers["content-encoding"] = encoding
+        return HTTPResponseMock(data, status, headers)
+
+    def test_accept(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock()
+
+        www.WWW("https://example.com").get()
+
+        accept = mock.return_value.headers["accept"]
+        self.assertTrue(accept.startswith("application/msgpack, "))
+        self.assertIn("application/json", accept)
+
+    def test_msgpack(self, mock: MagicMock) -> None:
+        data = msgpack.packb({"servers": [{"id": 1}]})
+        mock.return_value = HTTPConnectionMock(
+            self.response(data, "application/x-msgpack"),
+        )
+
+        w = www.WWW("https://example.com")
+        self.assertEqual(w.get("server"), {"servers": [{"id": 1}]})
+        self.assertEqual(
+            list(w.stream("server", "servers")), [{"id": 1}]
+        )
+
+    def test_msgpack_gzip(self, mock: MagicMock) -> None:
+        servers = [{"id": i} for i in range(5000)]
+        data = gzip.compress(msgpack.packb({"servers": servers}))
+        mock.return_value = HTTPConnectionMock(
+            self.response(data, "application/msgpack", encoding="gzip")
+        )
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW("https://example.com", hooks=[timings.append])
+        self.assertEqual(list(w.stream("server", "servers")), servers)
+        self.assertEqual(timings[0].received, len(data))
+        self.assertEqual(w.get("server"), {"servers": servers})
+
+    def test_msgpack_error(self, mock: MagicMock) -> None:
+        data = msgpack.packb({"message": "xyz"})
+        mock.return_value = HTTPConnectionMock(
+            self.response(data, "application/msgpack", 403)
+        )
+
+        w = www.WWW("https://example.com")
+        with self.assertRaisesRegex(www.WWWError, "^xyz$"):
+            w.get()
+        with self.assertRaisesRegex(www.WWWError, "^xyz$"):
+            list(w.stream("server", "servers"))
+
+    def test_msgpack_invalid(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            self.response(b"\xc1", "application/msgpack")
+        )
+
+        with self.assertRaises(www.WWWError):
+            www.WWW("https://example.com").get()
+
+    def test_cbor(self, mock: MagicMock) -> None:
+        data = cbor2.dumps({"servers": [1, 2]})
+        mock.return_value = HTTPConnectionMock(
+            self.response(data, "application/cbor")
+        )
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW("https://example.com", hooks=[timings.append])
+        self.assertEqual(w.get("server"), {"servers": [1, 2]})
+        self.assertEqual(list(w.stream("server", "servers")), [1, 2])
+        self.assertEqual(timings[1].received, len(data))
+        with self.assertRaises(KeyError):
+            list(w.stream("token", "tokens"))
+
+    def test_json_fallback(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            self.response(b'{"servers": [1]}', "application/json"),
+            self.response(b'{"servers": [2]}', "text/plain"),
+            HTTPResponseMock(b'{"servers": [3]}'),
+        )
+
+        w = www.WWW("https://example.com")
+        self.assertEqual(w.get(), {"servers": [1]})
+        self.assertEqual(w.get(), {"servers": [2]})
+        self.assertEqual(list(w.stream("server", "servers")), [3])
+
+
+@patch("pklookup.www.ConnectionPool.connect")
+class CacheTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def www(self, **kwargs: Any) -> www.WWW:
+        return www.WWW(
+            "https://example.com", "token", cache_dir=self.tmp.name, **kwargs
+        )
+
+    def test_get(self, mock: MagicMock) -> None:
+        date = "Sat, 17 Oct 2026 00:00:00 GMT"
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(
+                b'{"servers": [1]}',
+                headers={"etag": '"v1"', "last-modified": date},
+            ),
+            HTTPResponseMock(status=304),
+        )
+        timings = []  # type: List[www.Timing]
+
+        w = self.www(hooks=[timings.append])
+        self.assertEqual(w.get("server"), {"servers": [1]})
+        self.assertNotIn("if-none-match", mock.return_value.headers)
+
+        self.assertEqual(w.get("server"), {"servers": [1]})
+        self.assertEqual(mock.return_value.headers["if-none-match"], '"v1"')
+        self.assertEqual(mock.return_value.headers["if-modified-since"], date)
+        self.assertEqual(timings[1].status, 304)
+        self.assertEqual(timings[1].received, 0)
+
+        # Entries are not shared between tokens or parameters.
+        www.WWW(
+            "https://example.com", "other", cache_dir=self.tmp.name
+        ).get("server")
+        self.assertNotIn("if-none-match", mock.return_value.headers)
+        w.get("server", ip="10.0.0.1")
+        self.assertNotIn("if-none-match", mock.return_value.headers)
+
+    def test_cached_body_not_decoded(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b'{"a": 1}', headers={"etag": "v1"}),
+        )
+
+        w = self.www()
+        w.get()
+        # The cached body is only decoded if the server answers 304.
+        with patch("pklookup.www.json_loads", wraps=www.json_loads) as loads:
+            self.assertEqual(w.get(), {"a": 1})
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual(mock.return_value.headers["if-none-match"], "v1")
+
+    def test_compressed(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(
+                gzip.compress(b'{"a": 1}'),
+                headers={"etag": "v1", "content-encoding": "gzip"},
+            ),
+            HTTPResponseMock(status=304),
+        )
+
+        w = self.www()
+        self.assertEqual(w.get(), {"a": 1})
+        self.assertEqual(w.get(), {"a": 1})
+        self.assertEqual(mock.return_value.headers["if-none-match"], "v1")
+
+    def test_modified(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b'{"a": 1}', headers={"etag": "v1"}),
+            HTTPResponseMock(b'{"a": 2}', headers={"etag": "v2"}),
+            HTTPResponseMock(status=304),
+        )
+
+        w = self.www()
+        self.assertEqual(w.get(), {"a": 1})
+        self.assertEqual(w.get(), {"a": 2})
+        self.assertEqual(w.get(), {"a": 2})
+        self.assertEqual(mock.return_value.headers["if-none-match"], "v2")
+
+    def test_uncacheable(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b'{"a": 1}'),
+            HTTPResponseMock(b"nope", status=404, headers={"etag": "v1"}),
+            HTTPResponseMock(b'{"a": 1}', headers={"etag": "v1"}),
+        )
+
+        w = self.www()
+        w.get()
+        with self.assertRaises(www.WWWError):
+            w.get()
+        w.post(a=1)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+        w.get()
+        self.assertNotIn("if-none-match", mock.return_value.headers)
+
+    def test_stream(self, mock: MagicMock) -> None:
+        servers = [{"id": i} for i in range(1000)]
+        data = gzip.compress(json.dumps({"servers": servers}).encode())
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(
+                data, headers={"etag": "v1", "content-encoding": "gzip"}
+            ),
+            HTTPResponseMock(status=304),
+        )
+        timings = []  # type: List[www.Timing]
+
+        w = self.www(hooks=[timings.append])
+        self.assertEqual(list(w.stream("server", "servers")), servers)
+        self.assertEqual(list(w.stream("server", "servers")), servers)
+        self.assertEqual(mock.return_value.headers["if-none-match"], "v1")
+        self.assertEqual(timings[0].received, len(data))
+        self.assertEqual(timings[1].received, 0)
+
+    def test_stream_early_stop(self, mock: MagicMock) -> None:
+        data = json.dumps({"servers": list(range(100000))}).encode()
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(data, headers={"etag": "v1"}),
+        )
+
+        w = self.www()
+        stream = w.stream("server", "servers")
+        self.assertEqual(next(stream), 0)
+        stream.close()
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+        self.assertEqual(len(list(w.stream("server", "servers"))), 100000)
+        self.assertEqual(len(os.listdir(self.tmp.name)), 1)
+
+    @skipUnless(HAVE_CBOR, "cbor2 is missing")
+    def test_stream_cbor(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(
+                cbor2.dumps({"servers": [1, 2]}),
+                headers={"etag": "v1", "content-type": "application/cbor"},
+            ),
+            HTTPResponseMock(status=304),
+        )
+
+        w = self.www()
+        self.assertEqual(list(w.stream("server", "servers")), [1, 2])
+        self.assertEqual(list(w.stream("server", "servers")), [1, 2])
+        self.assertEqual(mock.return_value.headers["if-none-match"], "v1")
+
+
+class JSONStreamTest(TestCase):
+    doc = {
+        "message": "a \\\"quoted\\\" [string]",
+        "nested": {"servers": [1, 2]},
+        "servers": [
+            {"id": 1, "key_data": "\u00e5\u00e4\u00f6 \u2603", "port": 22},
+            {"id": 2, "list": [1.5e3, -2, True, None], "obj": {}},
+            123456789,
+            -1.25e-7,
+            "string",
+            [],
+        ],
+        "after": "ignored",
+    }
+
+    def test_chunk_sizes(self) -> None:
+        data = json.dumps(self.doc, indent=1).encode("utf-8")
+        for size in range(1, 40):
+            stream = www.JSONStream(io.BytesIO(data), size)
+            self.assertEqual(
+                list(stream.iterate("servers")), self.doc["servers"]
+            )
+
+    def test_compact(self) -> None:
+        data = json.dumps(self.doc, separators=(",", ":")).encode("utf-8")
+        for size in [1, 2, 3, 7, 4096]:
+            stream = www.JSONStream(io.BytesIO(data), size)
+            self.assertEqual(
+                list(stream.iterate("servers")), self.doc["servers"]
+            )
+
+    def test_empty_array(self) -> None:
+        stream = www.JSONStream(io.BytesIO(b' { "tokens" : [ ] } '), 1)
+        self.assertEqual(list(stream.iterate("tokens")), [])
+
+    def test_incremental(self) -> None:
+        fp = MagicMock()
+        fp.read.side_effect = [b'{"servers": [{"id": 1},', b""]
+        it = www.JSONStream(fp, 1).iterate("servers")
+
+        self.assertEqual(next(it), {"id": 1})
+        self.assertEqual(fp.read.call_count, 1)
+
+    def test_missing_key(self) -> None:
+        for data in [b"{}", b'{"a": [1]}', b'{"a": {"servers": []}}']:
+            with self.assertRaises(KeyError):
+                list(www.JSONStream(io.BytesIO(data)).iterate("servers"))
+
+    def test_invalid_type(self) -> None:
+        for data in [b"", b"[]", b'"abc"', b'{"servers": {}}']:
+            with self.assertRaises(TypeError):
+                list(www.JSONStream(io.BytesIO(data)).iterate("servers"))
+
+    def test_invalid_json(self) -> None:
+        for data in [b"{x", b'{"servers": [1 2]}', b'{"servers": [{]}']:
+            with self.assertRaises(ValueError):
+                list(www.JSONStream(io.BytesIO(data)).iterate("servers"))
+
+    def test_truncated(self) -> None:
+        with self.assertRaises(ValueError):
+            data = b'{"servers": [{"id": 1}, {"id"'
+            list(www.JSONStream(io.BytesIO(data)).iterate("servers"))
+
+
+@patch("pklookup.www.ConnectionPool.connect")
+class StreamTest(TestCase):
+    def test_stream(self, mock: MagicMock) -> None:
+        data = b'{"servers": [{"id": 1}, {"id": 2}], "x": 1}'
+        mock.return_value = HTTPConnectionMock(HTTPResponseMock(data))
+
+        w = www.WWW("https://example.com", token="abc")
+        res = list(w.stream("server", "servers", id=1))
+
+        self.assertEqual(res, [{"id": 1}, {"id": 2}])
+        self.assertEqual(mock.return_value.method, "GET")
+        self.assertEqual(mock.return_value.url, "/server?id=1")
+        self.assertFalse(mock.return_value.closed)
+
+        list(w.stream("server", "servers"))
+        self.assertEqual(mock.call_count, 1)
+
+    def test_stop_early(self, mock: MagicMock) -> None:
+        data = b'{"servers": [{"id": 1}, {"id": 2}]}'
+        mock.return_value = HTTPConnectionMock(HTTPResponseMock(data))
+
+        it = www.WWW("https://example.com").stream("server", "servers")
+        self.assertEqual(next(it), {"id": 1})
+        it.close()
+
+        self.assertTrue(mock.return_value.closed)
+
+    def test_http_error(self, mock: MagicMock) -> None:
+        res = HTTPResponseMock(b"Unauthorized Access", status=401)
+        mock.return_value = HTTPConnectionMock(res)
+
+        w = www.WWW("https://example.com")
+        with self.assertRaisesRegex(www.WWWError, "^Unauthorized Access$"):
+            list(w.stream("server", "servers"))
+
+    def test_invalid_json(self, mock: MagicMock) -> None:
+        res = HTTPResponseMock(b'{"servers": [{"id": 1}, xyz]}')
+        mock.return_value = HTTPConnectionMock(res)
+
+        w = www.WWW("https://example.com")
+        with self.assertRaises(www.WWWError):
+            list(w.stream("server", "servers"))
+        self.assertTrue(mock.return_value.closed)
+
+    def test_missing_key(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(HTTPResponseMock(b"{}"))
+
+        w = www.WWW("https://example.com")
+        with self.assertRaises(KeyError):
+            list(w.stream("server", "servers"))
+
+    def test_connection_error(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(ConnectionRefusedError())
+
+        w = www.WWW("https://example.com")
+        with self.assertRaises(www.WWWError):
+            list(w.stream("server", "servers"))
+
+
+class PaginateTest(TestCase):
+    @staticmethod
+    def offset_pages(total: int) -> Any:
+        def get(_path: str, offset: int, limit: int) -> Dict:
+            ids = range(offset, min(offset + limit, total))
+            return {"servers": [{"id": i} for i in ids]}
+
+        return get
+
+    @patch("pklookup.www.WWW.get")
+    def test_offset(self, mock: MagicMock) -> None:
+        mock.side_effect = self.offset_pages(25)
+
+        w = www.WWW("https://example.com")
+        res = list(w.paginate("server", "servers", page_size=10))
+
+        self.assertEqual(res, [{"id": i} for i in range(25)])
+        offsets = sorted(kwargs["offset"] for _, kwargs in mock.call_args_list)
+        self.assertEqual(offsets[:3], [0, 10, 20])
+
+    @patch("pklookup.www.WWW.get")
+    def test_exact_multiple(self, mock: MagicMock) -> None:
+        mock.side_effect = self.offset_pages(20)
+
+        w = www.WWW("https://example.com")
+        res = list(w.paginate("server", "servers", page_size=10))
+
+        self.assertEqual(res, [{"id": i} for i in range(20)])
+
+    @patch("pklookup.www.WWW.get")
+    def test_limit(self, mock: MagicMock) -> None:
+        mock.side_effect = self.offset_pages(1000)
+
+        w = www.WWW("https://example.com")
+        res = list(
+            w.paginate("server", "servers", page_size=10, limit=15, prefetch=1)
+        )
+
+        self.assertEqual(res, [{"id": i} for i in range(15)])
+        self.assertEqual(mock.call_count, 2)
+
+    @patch("pklookup.www.WWW.get")
+    def test_prefetch(self, mock: MagicMock) -> None:
+        mock.side_effect = self.offset_pages(1000)
+
+        w = www.WWW("https://example.com")
+        it = w.paginate("server", "servers", page_size=10, prefetch=3)
+        next(it)
+        for _ in range(100):
+            if mock.call_count == 4:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(mock.call_count, 4)
+        it.close()
+
+    @patch("pklookup.www.WWW.get")
+    def test_cursor(self, mock: MagicMock) -> None:
+        def get(_path: str, limit: int, **kwargs: Any) -> Dict:
+            start = int(kwargs.get("cursor", 0))
+            ids = range(start, min(start + limit, 12))
+            res = {"tokens": [{"id": i} for i in ids]}  # type: Dict
+            if start + limit < 12:
+                res["next"] = str(start + limit)
+            return res
+
+        mock.side_effect = get
+
+        w = www.WWW("https://example.com")
+        res = list(w.paginate("token", "tokens", page_size=5, role="x"))
+
+        self.assertEqual(res, [{"id": i} for i in range(12)])
+        self.assertEqual(mock.call_count, 3)
+        _args, kwargs = mock.call_args
+        self.assertEqual(kwargs, {"cursor": "10", "limit": 5, "role": "x"})
+
+    @patch("pklookup.www.WWW.get")
+    def test_unsupported(self, mock: MagicMock) -> None:
+        mock.return_value = {"servers": [{"id": i} for i in range(25)]}
+
+        w = www.WWW("https://example.com")
+        res = list(w.paginate("server", "servers", page_size=10))
+
+        self.assertEqual(res, [{"id": i} for i in range(25)])
+
+    @patch("pklookup.www.WWW.get")
+    def test_unsupported_page_size(self, mock: MagicMock) -> None:
+        mock.return_value = {"servers": [{"id": i} for i in range(10)]}
+
+        w = www.WWW("https://example.com")
+        res = list(w.paginate("server", "servers", page_size=10))
+
+        self.assertEqual(res, [{"id": i} for i in range(10)])
+
+    @patch("pklookup.www.WWW.get")
+    def test_invalid(self, mock: MagicMock) -> None:
+        w = www.WWW("https://example.com")
+
+        mock.return_value = {"abc": []}
+        with self.assertRaises(KeyError):
+            list(w.paginate("server", "servers", page_size=10))
+
+        mock.return_value = {"servers": {}}
+        with self.assertRaises(TypeError):
+            list(w.paginate("server", "servers", page_size=10))
+
+        mock.side_effect = www.WWWError("msg")
+        with self.assertRaises(www.WWWError):
+            list(w.paginate("server", "servers", page_size=10))
+
+    @patch("pklookup.www.WWW.stream")
+    def test_no_page_size(self, mock: MagicMock) -> None:
+        mock.return_value = iter([{"id": i} for i in range(10)])
+
+        w = www.WWW("https://example.com")
+        res = list(w.paginate("server", "servers", limit=3, ip="1.2.3.4"))
+
+        self.assertEqual(res, [{"id": i} for i in range(3)])
+        mock.assert_called_once_with("server", "servers", ip="1.2.3.4")
+
+
+@patch("pklookup.www.ConnectionPool.connect")
+class TimeoutTest(TestCase):
+    def test_timeouts(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock()
+
+        w = www.WWW("https://example.com", connect_timeout=3, read_timeout=7)
+        w.get()
+
+        self.assertEqual(mock.return_value.timeout, 3)
+        self.assertEqual(mock.return_value.sock.timeout, 7)
+
+    def test_no_timeouts(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock()
+
+        www.WWW("https://example.com").get()
+
+        self.assertEqual(mock.return_value.timeout, None)
+        self.assertEqual(mock.return_value.sock.timeout, None)
+
+    def test_deadline_caps_timeouts(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock()
+
+        w = www.WWW("https://example.com", read_timeout=60, deadline=5)
+        w.get()
+
+        self.assertLessEqual(mock.return_value.timeout, 5)
+        self.assertLessEqual(mock.return_value.sock.timeout, 5)
+
+    def test_deadline_exceeded(self, mock: MagicMock) -> None:
+        w = www.WWW("https://example.com", deadline=0)
+
+        with self.assertRaisesRegex(www.WWWError, "deadline exceeded"):
+            w.get()
+        with self.assertRaisesRegex(www.WWWError, "deadline exceeded"):
+            list(w.stream("server", "servers"))
+        self.assertEqual(mock.call_count, 0)
+
+    def test_deadline_batch(self, mock: MagicMock) -> None:
+        w = www.WWW("https://example.com", deadline=0)
+
+        res = w.batch([("GET", "server", {})] * 3)
+
+        self.assertTrue(all(isinstance(r, www.WWWError) for r in res))
+        self.assertEqual(mock.call_count, 0)
+
+
+@patch("time.sleep")
+@patch("pklookup.www.ConnectionPool.connect")
+class RetryTest(TestCase):
+    def test_status(self, mock: MagicMock, sleep: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"bad gateway", status=502),
+            HTTPResponseMock(b"unavailable", status=503),
+            HTTPResponseMock(b'{"servers": []}'),
+        )
+
+        w = www.WWW("https://example.com", retries=2)
+        self.assertEqual(w.get("server"), {"servers": []})
+
+        self.assertEqual(len(mock.return_value.requests), 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_exhausted(self, mock: MagicMock, sleep: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"unavailable", status=503)
+        )
+
+        w = www.WWW("https://example.com", retries=3)
+        with self.assertRaisesRegex(www.WWWError, "^unavailable$"):
+            w.delete("server", id=1)
+
+        self.assertEqual(len(mock.return_value.requests), 4)
+        self.assertEqual(sleep.call_count, 3)
+
+    def test_not_idempotent(self, mock: MagicMock, sleep: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"unavailable", status=503)
+        )
+
+        w = www.WWW("https://example.com", retries=3)
+        with self.assertRaises(www.WWWError):
+            w.post("server", public_key="abc")
+
+        self.assertEqual(len(mock.return_value.requests), 1)
+        self.assertEqual(sleep.call_count, 0)
+
+    def test_retry_methods(self, mock: MagicMock, sleep: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"unavailable", status=503),
+            HTTPResponseMock(b"{}"),
+        )
+
+        w = www.WWW("https://example.com", retries=1, retry_methods=["post"])
+        self.assertEqual(w.post("server", public_key="abc"), {})
+        self.assertEqual(sleep.call_count, 1)
+
+    def test_client_error(self, mock: MagicMock, sleep: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b'{"message": "xyz"}', status=404)
+        )
+
+        w = www.WWW("https://example.com", retries=3)
+        with self.assertRaisesRegex(www.WWWError, "^xyz$"):
+            w.get("server", id=1)
+        self.assertEqual(sleep.call_count, 0)
+
+    def test_connection_error(self, mock: MagicMock, sleep: MagicMock) -> None:
+        mock.side_effect = [
+            HTTPConnectionMock(ConnectionRefusedError()),
+            HTTPConnectionMock(ConnectionResetError()),
+            HTTPConnectionMock(HTTPResponseMock(b"{}")),
+        ]
+
+        w = www.WWW("https://example.com", retries=2)
+        self.assertEqual(w.get(), {})
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_certificate(self, mock: MagicMock, sleep: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(ssl.CertificateError())
+
+        w = www.WWW("https://example.com", retries=2)
+        with self.assertRaises(www.WWWError):
+            w.get()
+        self.assertEqual(sleep.call_count, 0)
+
+    @patch("random.uniform")
+    def test_backoff(
+            self,
+            uniform: MagicMock,
+            mock: MagicMock,
+            sleep: MagicMock,
+    ) -> None:
+        uniform.side_effect = lambda a, b: b
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"unavailable", status=503)
+        )
+
+        w = www.WWW(
+            "https://example.com", retries=5, backoff=1, backoff_max=10
+        )
+        with self.assertRaises(www.WWWError):
+            w.get()
+
+        delays = [args[0] for args, _ in sleep.call_args_list]
+        self.assertEqual(delays, [1, 2, 4, 8, 10])
+
+    def test_retry_after(self, mock: MagicMock, sleep: MagicMock) -> None:
+        date = email.utils.formatdate(time.time() + 20, usegmt=True)
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"", 429, {"Retry-After": "3"}),
+            HTTPResponseMock(b"", 503, {"Retry-After": date}),
+            HTTPResponseMock(b"", 503, {"Retry-After": "1000"}),
+            HTTPResponseMock(b"{}"),
+        )
+
+        w = www.WWW("https://example.com", retries=3, backoff_max=60)
+        w.get()
+
+        delays = [args[0] for args, _ in sleep.call_args_list]
+        self.assertEqual(delays[0], 3)
+        self.assertTrue(15 < delays[1] <= 20)
+        self.assertEqual(delays[2], 60)
+
+    def test_deadline(self, mock: MagicMock, sleep: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"", 503, {"Retry-After": "30"}),
+        )
+
+        w = www.WWW("https://example.com", retries=3, deadline=10)
+        with self.assertRaises(www.WWWError):
+            w.get()
+        self.assertEqual(sleep.call_count, 0)
+
+    def test_stream(self, mock: MagicMock, sleep: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"unavailable", status=503),
+            HTTPResponseMock(b'{"servers": [1, 2]}'),
+        )
+
+        w = www.WWW("https://example.com", retries=1)
+        self.assertEqual(list(w.stream("server", "servers")), [1, 2])
+        self.assertEqual(sleep.call_count, 1)
+
+
+class SlowHTTPConnectionMock(HTTPConnectionMock):
+    def __init__(self, delay: float, data: bytes) -> None:
+        super().__init__(HTTPResponseMock(data))
+        self.delay = delay
+
+    def getresponse(self) -> HTTPResponseMock:
+        time.sleep(self.delay)
+        return super().getresponse()
+
+
+@patch("pklookup.www.ConnectionPool.connect")
+class HedgeTest(TestCase):
+    def test_hedge(self, mock: MagicMock) -> None:
+        slow = SlowHTTPConnectionMock(0.5, b'{"from": "slow"}')
+        fast = SlowHTTPConnectionMock(0, b'{"from": "fast"}')
+        mock.side_effect = [slow, fast]
+
+        w = www.WWW("https://example.com", hedge_delay=0.05)
+        self.assertEqual(w.get(), {"from": "fast"})
+
+        for _ in range(100):
+            if slow.closed:
+                break
+            time.sleep(0.01)
+        self.assertTrue(slow.closed)
+        self.assertEqual(mock.call_count, 2)
+
+    def test_fast(self, mock: MagicMock) -> None:
+        mock.return_value = SlowHTTPConnectionMock(0, b"{}")
+
+        w = www.WWW("https://example.com", hedge_delay=1)
+        for _ in range(5):
+            w.get()
+
+        self.assertEqual(mock.call_count, 1)
+
+    def test_failure(self, mock: MagicMock) -> None:
+        mock.side_effect = [
+            SlowHTTPConnectionMock(0.1, b"{}"),
+            HTTPConnectionMock(ConnectionRefusedError()),
+        ]
+
+        w = www.WWW("https://example.com", hedge_delay=0.01)
+        self.assertEqual(w.get(), {})
+
+    def test_post(self, mock: MagicMock) -> None:
+        mock.return_value = SlowHTTPConnectionMock(0.1, b"{}")
+
+        w = www.WWW("https://example.com", hedge_delay=0.01)
+        w.post()
+
+        self.assertEqual(mock.call_count, 1)
+
+    def test_percentile(self, mock: MagicMock) -> None:
+        mock.side_effect = lambda: SlowHTTPConnectionMock(0, b"{}")
+
+        w = www.WWW("https://example.com", pool_size=1, hedge_delay=10)
+        for _ in range(20):
+            w.get()
+
+        mock.side_effect = [
+            SlowHTTPConnectionMock(0.5, b'{"from": "slow"}'),
+            SlowHTTPConnectionMock(0, b'{"from": "fast"}'),
+        ]
+        w.close()
+        start = time.monotonic()
+        self.assertEqual(w.get(), {"from": "fast"})
+        self.assertLess(time.monotonic() - start, 0.4)
+
+
+@patch("pklookup.www.ConnectionPool.connect")
+class LimitTest(TestCase):
+    @patch("pklookup.limits.RateLimiter.acquire")
+    def test_rate_limit(self, acquire: MagicMock, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(HTTPResponseMock(b"{}"))
+        acquire.return_value = True
+
+        w = www.WWW("https://example.com", rate_limit=10)
+        w.batch([("GET", "server", {})] * 5)
+        self.assertEqual(acquire.call_count, 5)
+
+        acquire.return_value = False
+        with self.assertRaisesRegex(www.WWWError, "deadline exceeded"):
+            w.get()
+
+    @patch("time.sleep")
+    def test_retries(self, sleep: MagicMock, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"", status=429),
+            HTTPResponseMock(b"{}"),
+        )
+
+        w = www.WWW("https://example.com", rate_limit=1000, retries=1)
+        with patch("pklookup.limits.RateLimiter.acquire") as acquire:
+            w.get()
+        self.assertEqual(acquire.call_count, 2)
+
+    def test_concurrency(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"{}"),
+            HTTPResponseMock(b"busy", status=503),
+        )
+
+        w = www.WWW("https://example.com", pool_size=4, max_concurrency=8)
+        concurrency = w._concurrency
+        assert concurrency is not None
+        self.assertEqual(concurrency.limit, 4)
+
+        w.get()
+        self.assertGreater(concurrency.limit, 4)
+        with self.assertRaises(www.WWWError):
+            w.get()
+        self.assertLess(concurrency.limit, 4)
+        self.assertEqual(concurrency.inflight, 0)
+
+    def test_concurrency_error(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(ConnectionRefusedError())
+
+        w = www.WWW("https://example.com", max_concurrency=8)
+        with self.assertRaises(www.WWWError):
+            w.get()
+        concurrency = w._concurrency
+        assert concurrency is not None
+        self.assertEqual(concurrency.limit, 2)
+        self.assertEqual(concurrency.inflight, 0)
+
+    def test_disabled(self, mock: MagicMock) -> None:
+        w = www.WWW("https://example.com")
+        self.assertIsNone(w._rate_limiter)
+        self.assertIsNone(w._concurrency)
+
+
+@patch("pklookup.www.ConnectionPool.connect")
+class HookTest(TestCase):
+    def test_send(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(HTTPResponseMock(b'{"a": 1}'))
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW("https://example.com", hooks=[timings.append])
+        w.post("server", public_key="abc")
+
+        self.assertEqual(len(timings), 1)
+        timing = timings[0]
+        self.assertEqual(timing.method, "POST")
+        self.assertEqual(timing.target, "/server")
+        self.assertEqual(timing.status, 200)
+        self.assertEqual(timing.sent, len(b'{"public_key": "abc"}'))
+        self.assertEqual(timing.received, 8)
+        self.assertIsNone(timing.error)
+        self.assertEqual(list(timing.phases), ["ttfb", "body", "decode"])
+        self.assertAlmostEqual(timing.total, sum(timing.phases.values()))
+
+    def test_http_error(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"forbidden", status=403)
+        )
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW("https://example.com", hooks=[timings.append])
+        with self.assertRaises(www.WWWError):
+            w.get()
+
+        self.assertEqual(timings[0].status, 403)
+        self.assertIsNone(timings[0].error)
+
+    def test_connection_error(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(ConnectionRefusedError())
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW("https://example.com", hooks=[timings.append])
+        with self.assertRaises(www.WWWError):
+            w.get()
+
+        self.assertEqual(len(timings), 1)
+        self.assertIsNone(timings[0].status)
+        self.assertIsInstance(timings[0].error, ConnectionRefusedError)
+
+    @patch("time.sleep")
+    def test_retries(self, sleep: MagicMock, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(
+            HTTPResponseMock(b"busy", status=503),
+            HTTPResponseMock(b"{}"),
+        )
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW("https://example.com", retries=1)
+        w.hooks.append(timings.append)
+        w.get()
+
+        self.assertEqual([t.status for t in timings], [503, 200])
+        self.assertEqual(timings[0].received, 4)
+
+    def test_stream(self, mock: MagicMock) -> None:
+        data = b'{"servers": [1, 2, 3]}'
+        mock.return_value = HTTPConnectionMock(HTTPResponseMock(data))
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW("https://example.com", hooks=[timings.append])
+        self.assertEqual(list(w.stream("server", "servers")), [1, 2, 3])
+        self.assertEqual(timings[0].received, len(data))
+        self.assertEqual(list(timings[0].phases), ["ttfb", "body"])
+
+        next(w.stream("server", "servers"))
+        self.assertEqual(len(timings), 2)
+        self.assertIsNone(timings[1].error)
+
+    def test_queue(self, mock: MagicMock) -> None:
+        mock.return_value = HTTPConnectionMock(HTTPResponseMock(b"{}"))
+        timings = []  # type: List[www.Timing]
+
+        w = www.WWW(
+            "https://example.com", rate_limit=100, hooks=[timings.append]
+        )
+        w.get()
+
+        self.assertEqual(list(timings[0].phases)[0], "queue")
+
+
+class ConnectionPhaseTest(TestCase):
+    def test_phases(self) -> None:
+        with socket.socket() as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen(1)
+
+            conn = www.HTTPConnection("localhost", server.getsockname()[1])
+            conn.connect()
+            conn.close()
+
+        self.assertEqual(list(conn.phases), ["dns", "connect"])
+
+    def test_refused(self) -> None:
+        with socket.socket() as server:
+            server.bind(("127.0.0.1", 0))
+            port = server.getsockname()[1]
+
+        conn = www.HTTPConnection("127.0.0.1", port)
+        with self.assertRaises(ConnectionRefusedError):
+            conn.connect()
+
+
+class ReadTimeoutTest(TestCase):
+    def test_read_timeout(self) -> None:
+        with socket.socket() as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen(1)
+            url = "http://127.0.0.1:{}".format(server.getsockname()[1])
+
+            w = www.WWW(url, read_timeout=0.05)
+            start = time.monotonic()
+            with self.assertRaisesRegex(www.WWWError, "timed out"):
+                w.get()
+            self.assertLess(time.monotonic() - start, 5)
+
+
+class SlowBodyTest(TestCase):
+    """
+    Responses whose body trickles in one byte at a time, each well
+    within the read timeout.
+    """
+
+    def setUp(self) -> None:
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(4)
+        self.url = "http://127.0.0.1:{}".format(
+            self.server.getsockname()[1]
+        )
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.server.close()
+        self.thread.join()
+
+    def _serve(self) -> None:
+        body = b'{"servers": [' + b"1, " * 1000 + b"1]}"
+        try:
+            while True:
+                conn, _addr = self.server.accept()
+                with conn:
+                    conn.recv(65536)
+                    conn.sendall(
+                        b"HTTP/1.1 200 OK\r\n"
+                        b"Content-Type: application/json\r\n"
+                        b"Content-Length: " + str(len(body)).encode() +
+                        b"\r\n\r\n" + body[:20]
+                    )
+                    for i in range(20, len(body)):
+                        time.sleep(0.01)
+                        conn.sendall(body[i:i + 1])
+        except OSError:
+            return
+
+    def test_get(self) -> None:
+        w = www.WWW(self.url, read_timeout=1, deadline=0.3)
+        start = time.monotonic()
+        with self.assertRaisesRegex(www.WWWError, "deadline exceeded"):
+            w.get("server")
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_stream(self) -> None:
+        w = www.WWW(self.url, read_timeout=1, deadline=0.3)
+        start = time.monotonic()
+        servers = []
+        with self.assertRaisesRegex(www.WWWError, "deadline exceeded"):
+            for server in w.stream("server", "servers"):
+                servers.append(server)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertTrue(servers)
+
+
+class ClosingServerTest(TestCase):
+    """
+    A server that answers GET requests, but closes the connection after
+    reading a POST request.
+    """
+
+    def setUp(self) -> None:
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(4)
+        self.url = "http://127.0.0.1:{}".format(
+            self.server.getsockname()[1]
+        )
+        self.methods = []  # type: List[str]
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        # Wakes up the accept() of the server thread.
+        self.server.shutdown(socket.SHUT_RDWR)
+        self.server.close()
+        self.thread.join()
+
+    def _serve(self) -> None:
+        try:
+            while True:
+                conn, _addr = self.server.accept()
+                with conn, conn.makefile("rb") as f:
+                    self._handle(conn, f)
+        except OSError:
+            return
+
+    def _handle(self, conn: socket.socket, f: Any) -> None:
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            length = 0
+            while True:
+                header = f.readline()
+                if header in (b"\r\n", b""):
+                    break
+                name, _sep, value = header.partition(b":")
+                if name.lower() == b"content-length":
+                    length = int(value)
+            f.read(length)
+            self.methods.append(line.split()[0].decode())
+            if line.startswith(b"POST"):
+                return
+            conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+
+    def test_post_once(self) -> None:
+        w = www.WWW(self.url, retries=0)
+        w.get()
+        with self.assertRaises(www.WWWError):
+            w.post("server", public_key="x")
+        self.assertEqual(self.methods, ["GET", "POST"])
+
+    def test_retry_method_replayed(self) -> None:
+        w = www.WWW(self.url, retries=0, retry_methods=["GET", "POST"])
+        w.get()
+        with self.assertRaises(www.WWWError):
+            w.post("server", public_key="x")
+        self.assertEqual(self.methods, ["GET", "POST", "POST"])
+
+
+class SessionTest(TestCase):
+    def test_invalid_cafile(self) -> None:
+        with tempfile.NamedTemporaryFile() as tmp:
+            pass
+
+        with self.assertRaises(www.WWWError):
+            www.WWW("https://example.com", cafile=tmp.name)
+
+    @patch("pklookup.www.HTTPSConnection")
+    def test_resume(self, mock: MagicMock) -> None:
+        session = MagicMock()
+        conn = MagicMock(sock=MagicMock(session=session))
+        context = ssl.create_default_context()
+        pool = www.ConnectionPool("https", "example.com", 443, 1, context)
+
+        pool.connect()
+        self.assertEqual(mock.call_args[0][3], None)
+
+        pool.release(conn)
+        pool.connect()
+        self.assertEqual(mock.call_args[0][3], session)
+
+    @patch("http.client.HTTPConnection.connect")
+    def test_wrap_socket(self, _mock: MagicMock) -> None:
+        context = MagicMock()
+        session = MagicMock()
+
+        conn = www.HTTPSConnection("example.com", 443, context, session)
+        conn.connect()
+
+        _args, kwargs = context.wrap_socket.call_args
+        self.assertEqual(kwargs["server_hostname"], "example.com")
+        self.assertEqual(kwargs["session"], session)
+
+    @patch("http.client.HTTPConnection.connect")
+    def test_wrap_socket_no_session(self, _mock: MagicMock) -> None:
+        # Python 3.5 has no sessions, nor a session argument.
+        context = MagicMock()
+
+        with patch("pklookup.www.ssl", spec=["SSLContext"]):
+            conn = www.HTTPSConnection("example.com", 443, context, object())
+            conn.connect()
+
+        _args, kwargs = context.wrap_socket.call_args
+        self.assertTrue("session" not in kwargs)
+
+    @patch("http.client.HTTPConnection.connect")
+    def test_wrap_socket_tunnel(self, _mock: MagicMock) -> None:
+        context = MagicMock()
+
+        conn = www.HTTPSConnection("proxy", 3128, context)
+        conn.set_tunnel("example.com", 443)
+        conn.connect()
+
+        _args, kwargs = context.wrap_socket.call_args
+        self.assertEqual(kwargs["server_hostname"], "example.com")
+        self.assertTrue("session" not in kwargs)